@@ -1,11 +1,14 @@
 import json
 import os
 import uuid
+import base64
 import hashlib
 import hmac
 import time
-import psycopg2
-import psycopg2.extras
+import threading
+import math
+import random
+import collections
 
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
@@ -23,31 +26,258 @@ def get_secret():
         SECRET = os.environ.get('AUTH_SECRET', 'task-manager-secret-2024')
     return SECRET
 
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECK_AFTER = int(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+_POOL = []
+_POOL_LOCK = threading.Lock()
+
+def _close_quietly(conn):
+    import psycopg2
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def _is_alive(conn):
+    import psycopg2
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_conn():
+    """Берёт соединение из пула тёплого контейнера или открывает новое"""
+    import psycopg2
+    now = time.time()
+    while True:
+        with _POOL_LOCK:
+            if not _POOL:
+                break
+            conn, last_used = _POOL.pop()
+        idle = now - last_used
+        if conn.closed or idle > DB_POOL_IDLE_TIMEOUT:
+            _close_quietly(conn)
+            continue
+        if idle > DB_POOL_CHECK_AFTER and not _is_alive(conn):
+            _close_quietly(conn)
+            continue
+        return conn
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
+def put_conn(conn):
+    """Возвращает соединение в пул; сломанные и лишние закрываются"""
+    import psycopg2
+    if conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _close_quietly(conn)
+        return
+    with _POOL_LOCK:
+        if len(_POOL) < DB_POOL_MAX_SIZE:
+            _POOL.append((conn, time.time()))
+            return
+    _close_quietly(conn)
+
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', '16384'))
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+SCRYPT_SALT_BYTES = 16
+SCRYPT_DKLEN = 32
+
+def scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + 1024 * 1024, dklen=SCRYPT_DKLEN)
+
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Хеш пароля scrypt$n$r$p$salt$hash с солью и стоимостью из окружения"""
+    salt = os.urandom(SCRYPT_SALT_BYTES)
+    digest = scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return "scrypt$%d$%d$%d$%s$%s" % (
+        SCRYPT_N, SCRYPT_R, SCRYPT_P,
+        base64.b64encode(salt).decode(), base64.b64encode(digest).decode(),
+    )
 
-def create_token(user_id):
+def verify_password(password, stored):
+    """Возвращает (совпал, нужно_перехешировать); старые несолёные sha256 тоже принимаются"""
+    if not stored.startswith('scrypt$'):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored), True
+    try:
+        _, n, r, p, salt, digest = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+    except ValueError:
+        return False, False
+    ok = hmac.compare_digest(scrypt(password, salt, n, r, p), digest)
+    return ok, (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+DUMMY_HASH = None
+
+def burn_password_check(password):
+    """Тратит столько же времени, сколько проверка настоящего пароля, чтобы не выдавать наличие email"""
+    global DUMMY_HASH
+    if DUMMY_HASH is None:
+        DUMMY_HASH = hash_password(uuid.uuid4().hex)
+    verify_password(password, DUMMY_HASH)
+
+def create_token(user):
+    """Токен user_id:ts:claims:sig — email и имя подписаны вместе с id, чтобы me обходился без БД"""
     ts = str(int(time.time()))
-    payload = user_id + ":" + ts
+    claims = json.dumps({'email': user['email'], 'name': user['name']}, ensure_ascii=False, separators=(',', ':'))
+    claims = base64.urlsafe_b64encode(claims.encode()).decode().rstrip('=')
+    payload = user['id'] + ":" + ts + ":" + claims
     sig = hmac.new(get_secret().encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
     return payload + ":" + sig
 
+def token_claims(token):
+    """Подписанные claims токена; None для старых токенов без claims"""
+    parts = token.split(":")
+    if len(parts) != 4:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(parts[2] + '=' * (-len(parts[2]) % 4))
+        claims = json.loads(raw.decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return claims if isinstance(claims, dict) else None
+
+TOKEN_TTL = 30 * 24 * 3600
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '512'))
+
+_TOKEN_CACHE = collections.OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 def verify_token(token):
+    """Проверяет подпись и срок токена; проверенные токены кешируются в контейнере до истечения срока"""
+    now = time.time()
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+        if cached:
+            if cached[1] > now:
+                _TOKEN_CACHE.move_to_end(token)
+                return cached[0]
+            del _TOKEN_CACHE[token]
     parts = token.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         return None
-    user_id, ts, sig = parts
-    payload = user_id + ":" + ts
+    user_id, ts, sig = parts[0], parts[1], parts[-1]
+    payload = token[:-len(sig) - 1]
     expected = hmac.new(get_secret().encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
     if not hmac.compare_digest(sig, expected):
         return None
-    if int(time.time()) - int(ts) > 30 * 24 * 3600:
+    try:
+        expires = int(ts) + TOKEN_TTL
+    except ValueError:
+        return None
+    if expires <= now:
         return None
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = (user_id, expires)
+        while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+            _TOKEN_CACHE.popitem(last=False)
     return user_id
 
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'postgres')
+RATE_LIMITS = {
+    'ip': (float(os.environ.get('RATE_LIMIT_IP_BURST', '20')),
+           float(os.environ.get('RATE_LIMIT_IP_PER_MIN', '10')) / 60),
+    'email': (float(os.environ.get('RATE_LIMIT_EMAIL_BURST', '5')),
+              float(os.environ.get('RATE_LIMIT_EMAIL_PER_MIN', '2')) / 60),
+}
+RATE_LIMIT_CLEANUP_CHANCE = 0.01
+RATE_LIMIT_CLEANUP_AFTER = '1 hour'
+
+RATE_LIMIT_SQL = """
+INSERT INTO auth_rate_limits AS b (bucket_key, tokens, capacity, refill_per_sec, allowed, updated_at)
+VALUES {values}
+ON CONFLICT (bucket_key) DO UPDATE SET
+    tokens = LEAST(EXCLUDED.capacity,
+                   b.tokens + EXTRACT(EPOCH FROM EXCLUDED.updated_at - b.updated_at) * EXCLUDED.refill_per_sec)
+             - CASE WHEN LEAST(EXCLUDED.capacity,
+                               b.tokens + EXTRACT(EPOCH FROM EXCLUDED.updated_at - b.updated_at) * EXCLUDED.refill_per_sec)
+                         >= 1 THEN 1 ELSE 0 END,
+    allowed = LEAST(EXCLUDED.capacity,
+                    b.tokens + EXTRACT(EPOCH FROM EXCLUDED.updated_at - b.updated_at) * EXCLUDED.refill_per_sec) >= 1,
+    capacity = EXCLUDED.capacity,
+    refill_per_sec = EXCLUDED.refill_per_sec,
+    updated_at = EXCLUDED.updated_at
+RETURNING bucket_key, tokens, refill_per_sec, allowed
+"""
+
+_LOCAL_BUCKETS = {}
+_LOCAL_BUCKETS_LOCK = threading.Lock()
+
+def client_ip(event):
+    """IP для лимита: sourceIp шлюза или последний хоп X-Forwarded-For — его дописал наш прокси, а не клиент"""
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    headers = event.get('headers') or {}
+    forwarded = headers.get('X-Forwarded-For') or headers.get('x-forwarded-for') or ''
+    return forwarded.split(',')[-1].strip()
+
+def rate_limit_buckets(event, email):
+    buckets = []
+    ip = client_ip(event)
+    if ip:
+        buckets.append(('ip:' + ip,) + RATE_LIMITS['ip'])
+    if email:
+        buckets.append(('email:' + email,) + RATE_LIMITS['email'])
+    return buckets
+
+def retry_after(tokens, refill_per_sec):
+    return max(1, int(math.ceil((1 - tokens) / refill_per_sec))) if refill_per_sec > 0 else 3600
+
+def take_local(buckets):
+    """Token bucket в памяти контейнера — для разработки и когда общий счётчик не нужен"""
+    now = time.monotonic()
+    wait = 0
+    with _LOCAL_BUCKETS_LOCK:
+        for key, capacity, rate in buckets:
+            tokens, updated = _LOCAL_BUCKETS.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = max(wait, retry_after(tokens, rate))
+            _LOCAL_BUCKETS[key] = (tokens, now)
+    return wait
+
+def take_postgres(cur, buckets):
+    """Token bucket в UNLOGGED-таблице: пополнение и списание одним атомарным upsert на все ключи"""
+    values = ', '.join(["(%s, %s - 1, %s, %s, TRUE, clock_timestamp())"] * len(buckets))
+    args = []
+    for key, capacity, rate in buckets:
+        args.extend([key, capacity, capacity, rate])
+    cur.execute(RATE_LIMIT_SQL.format(values=values), args)
+    wait = 0
+    for r in cur.fetchall():
+        if not r['allowed']:
+            wait = max(wait, retry_after(r['tokens'], r['refill_per_sec']))
+    if random.random() < RATE_LIMIT_CLEANUP_CHANCE:
+        cur.execute(
+            "DELETE FROM auth_rate_limits WHERE updated_at < NOW() - INTERVAL '%s'" % RATE_LIMIT_CLEANUP_AFTER
+        )
+    return wait
+
+def rate_limit_wait(cur, event, email):
+    """Секунды до следующей разрешённой попытки входа или регистрации; 0 — можно"""
+    buckets = rate_limit_buckets(event, email)
+    if not buckets or RATE_LIMIT_STORE == 'off':
+        return 0
+    if RATE_LIMIT_STORE == 'local':
+        return take_local(buckets)
+    return take_postgres(cur, buckets)
+
 def handler(event, context):
     """Авторизация: регистрация, вход и проверка токена"""
     if event.get('httpMethod') == 'OPTIONS':
@@ -69,6 +299,14 @@ def handler(event, context):
         user_id = verify_token(token)
         if not user_id:
             return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Invalid token'})}
+        claims = token_claims(token)
+        if claims and params.get('fresh') != '1':
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({
+                'id': user_id,
+                'email': claims.get('email', ''),
+                'name': claims.get('name', ''),
+            })}
+        import psycopg2.extras
         conn = get_conn()
         conn.autocommit = True
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
@@ -84,7 +322,7 @@ def handler(event, context):
             })}
         finally:
             cur.close()
-            conn.close()
+            put_conn(conn)
 
     if method != 'POST':
         return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Method not allowed'})}
@@ -92,11 +330,21 @@ def handler(event, context):
     body = json.loads(event.get('body', '{}'))
     action = body.get('action', '')
 
+    import psycopg2.extras
     conn = get_conn()
     conn.autocommit = True
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
     try:
+        if action in ('register', 'login'):
+            wait = rate_limit_wait(cur, event, body.get('email', '').strip().lower())
+            if wait:
+                headers = dict(CORS_HEADERS)
+                headers['Retry-After'] = str(wait)
+                headers['Access-Control-Expose-Headers'] = 'Retry-After'
+                return {'statusCode': 429, 'headers': headers,
+                        'body': json.dumps({'error': 'Слишком много попыток, повторите позже'})}
+
         if action == 'register':
             email = body.get('email', '').strip().lower()
             password = body.get('password', '')
@@ -119,7 +367,7 @@ def handler(event, context):
                 % (user_id, email.replace("'", "''"), pw_hash, name.replace("'", "''"))
             )
             user = cur.fetchone()
-            token = create_token(user['id'])
+            token = create_token(user)
             return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps({
                 'token': token,
                 'user': {'id': user['id'], 'email': user['email'], 'name': user['name']}
@@ -132,16 +380,21 @@ def handler(event, context):
             if not email or not password:
                 return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Email и пароль обязательны'})}
 
-            pw_hash = hash_password(password)
-            cur.execute(
-                "SELECT id, email, name FROM users WHERE email = '%s' AND password_hash = '%s'"
-                % (email.replace("'", "''"), pw_hash)
-            )
+            cur.execute("SELECT id, email, name, password_hash FROM users WHERE email = %s", (email,))
             user = cur.fetchone()
             if not user:
+                burn_password_check(password)
                 return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Неверный email или пароль'})}
+            ok, needs_rehash = verify_password(password, user['password_hash'])
+            if not ok:
+                return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Неверный email или пароль'})}
+            if needs_rehash:
+                cur.execute(
+                    "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                    (hash_password(password), user['id'], user['password_hash'])
+                )
 
-            token = create_token(user['id'])
+            token = create_token(user)
             return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({
                 'token': token,
                 'user': {'id': user['id'], 'email': user['email'], 'name': user['name']}
@@ -150,4 +403,4 @@ def handler(event, context):
         return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Unknown action'})}
     finally:
         cur.close()
-        conn.close()
+        put_conn(conn)
@@ -1,11 +1,29 @@
 import json
 import os
+import datetime
+import email.utils
+import base64
+import html
 import hashlib
 # v2
 import hmac
 import time
-import psycopg2
-import psycopg2.extras
+import threading
+import random
+import collections
+import uuid
+import functools
+import gzip
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 SCHEMA = 't_p54371197_task_manager_creatio'
 
@@ -14,6 +32,7 @@ CORS_HEADERS = {
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
     'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization',
     'Access-Control-Max-Age': '86400',
+    'Access-Control-Expose-Headers': 'ETag, Last-Modified',
     'Content-Type': 'application/json'
 }
 
@@ -25,17 +44,40 @@ def get_secret():
         SECRET = os.environ.get('AUTH_SECRET', 'task-manager-secret-2024')
     return SECRET
 
+TOKEN_TTL = 30 * 24 * 3600
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '512'))
+
+_TOKEN_CACHE = collections.OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 def verify_token(token):
+    """Проверяет подпись и срок токена; проверенные токены кешируются в контейнере до истечения срока"""
+    now = time.time()
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+        if cached:
+            if cached[1] > now:
+                _TOKEN_CACHE.move_to_end(token)
+                return cached[0]
+            del _TOKEN_CACHE[token]
     parts = token.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         return None
-    user_id, ts, sig = parts
-    payload = user_id + ":" + ts
+    user_id, ts, sig = parts[0], parts[1], parts[-1]
+    payload = token[:-len(sig) - 1]
     expected = hmac.new(get_secret().encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
     if not hmac.compare_digest(sig, expected):
         return None
-    if int(time.time()) - int(ts) > 30 * 24 * 3600:
+    try:
+        expires = int(ts) + TOKEN_TTL
+    except ValueError:
         return None
+    if expires <= now:
+        return None
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = (user_id, expires)
+        while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+            _TOKEN_CACHE.popitem(last=False)
     return user_id
 
 def get_user_id(event):
@@ -46,9 +88,67 @@ def get_user_id(event):
         return verify_token(auth[7:])
     return None
 
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECK_AFTER = int(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+_POOL = []
+_POOL_LOCK = threading.Lock()
+
+def _close_quietly(conn):
+    import psycopg2
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def _is_alive(conn):
+    import psycopg2
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_conn():
+    """Берёт соединение из пула тёплого контейнера или открывает новое"""
+    import psycopg2
+    now = time.time()
+    while True:
+        with _POOL_LOCK:
+            if not _POOL:
+                break
+            conn, last_used = _POOL.pop()
+        idle = now - last_used
+        if conn.closed or idle > DB_POOL_IDLE_TIMEOUT:
+            _close_quietly(conn)
+            continue
+        if idle > DB_POOL_CHECK_AFTER and not _is_alive(conn):
+            _close_quietly(conn)
+            continue
+        return conn
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
+def put_conn(conn):
+    """Возвращает соединение в пул; сломанные и лишние закрываются"""
+    import psycopg2
+    if conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _close_quietly(conn)
+        return
+    with _POOL_LOCK:
+        if len(_POOL) < DB_POOL_MAX_SIZE:
+            _POOL.append((conn, time.time()))
+            return
+    _close_quietly(conn)
+
 def row_to_doc(r):
     return {
         'id': str(r['id']),
@@ -59,6 +159,316 @@ def row_to_doc(r):
         'updatedAt': r['updated_at'].isoformat() if r['updated_at'] else None,
     }
 
+DOC_CATEGORIES = ('letters', 'internal', 'other')
+PAGE_DEFAULT_LIMIT = 50
+PAGE_MAX_LIMIT = 200
+EXCERPT_LENGTH = 200
+
+def encode_cursor(r):
+    raw = "%s|%s" % (r['updated_at'].isoformat(), r['id'])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        updated_at, doc_id = raw.split('|', 1)
+        return updated_at, str(uuid.UUID(doc_id))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def make_excerpt(text):
+    text = ' '.join((text or '').split())
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    cut = text[:EXCERPT_LENGTH]
+    if ' ' in cut[EXCERPT_LENGTH // 2:]:
+        cut = cut[:cut.rindex(' ')]
+    return cut.rstrip(' ,.;:') + '…'
+
+def row_to_doc_summary(r):
+    return {
+        'id': str(r['id']),
+        'title': r['title'],
+        'category': r['category'],
+        'excerpt': make_excerpt(r['head']),
+        'contentLength': r['content_length'],
+        'createdAt': r['created_at'].isoformat() if r['created_at'] else None,
+        'updatedAt': r['updated_at'].isoformat() if r['updated_at'] else None,
+    }
+
+def list_docs(cur, user_id, params):
+    """Лёгкий список документов без полного текста: выдержка, длина, keyset по (updated_at, id)"""
+    import psycopg2
+    try:
+        limit = int(params.get('limit') or PAGE_DEFAULT_LIMIT)
+    except ValueError:
+        return 400, {'error': 'Invalid limit'}
+    limit = max(1, min(limit, PAGE_MAX_LIMIT))
+
+    wheres = ["user_id = %s"]
+    args = [EXCERPT_LENGTH * 2, user_id]
+    if params.get('category') in DOC_CATEGORIES:
+        wheres.append("category = %s")
+        args.append(params['category'])
+    if params.get('cursor'):
+        position = decode_cursor(params['cursor'])
+        if not position:
+            return 400, {'error': 'Invalid cursor'}
+        wheres.append("(updated_at, id) < (%s::timestamptz, %s::uuid)")
+        args.extend(position)
+
+    try:
+        cur.execute(
+            "SELECT id, title, category, created_at, updated_at, "
+            "left(content, %%s) AS head, char_length(content) AS content_length "
+            "FROM %s.documents WHERE %s ORDER BY updated_at DESC, id DESC LIMIT %d"
+            % (SCHEMA, ' AND '.join(wheres), limit + 1),
+            args
+        )
+    except psycopg2.DataError:
+        return 400, {'error': 'Invalid cursor'}
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return 200, {
+        'items': [row_to_doc_summary(r) for r in rows],
+        'nextCursor': encode_cursor(rows[-1]) if has_more else None,
+    }
+
+def get_doc(cur, user_id, doc_id):
+    """Один документ с полным текстом"""
+    try:
+        doc_id = str(uuid.UUID(doc_id))
+    except ValueError:
+        return None
+    cur.execute(
+        "SELECT id, title, content, category, created_at, updated_at "
+        "FROM %s.documents WHERE id = %%s AND user_id = %%s" % SCHEMA,
+        (doc_id, user_id)
+    )
+    return cur.fetchone()
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_HEADLINE = 'StartSel=\x02, StopSel=\x03, MaxWords=35, MinWords=15, MaxFragments=3'
+
+SEARCH_SQL = """
+WITH q AS (
+    SELECT websearch_to_tsquery('russian', %(q)s) || websearch_to_tsquery('simple', %(q)s) AS query
+), hits AS (
+    SELECT d.id, d.title, d.content, d.category, d.created_at, d.updated_at,
+           ts_rank_cd(d.search_vector, q.query) AS rank
+    FROM {schema}.documents d, q
+    WHERE d.user_id = %(user_id)s AND d.search_vector @@ q.query {filters}
+    ORDER BY rank DESC, d.updated_at DESC, d.id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+)
+SELECT hits.id, hits.category, hits.created_at, hits.updated_at, hits.rank, hits.title,
+       ts_headline('russian', hits.title, q.query, %(headline)s) AS title_hl,
+       ts_headline('russian', hits.content, q.query, %(headline)s) AS content_hl
+FROM hits, q
+ORDER BY hits.rank DESC, hits.updated_at DESC, hits.id DESC
+"""
+
+def highlight(text):
+    """Экранирует текст ts_headline и превращает маркеры совпадений в <mark>"""
+    return html.escape(text or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def search_docs(cur, user_id, params):
+    """Полнотекстовый поиск по заголовку и тексту документов: ранжирование, подсветка, offset-страницы"""
+    query = (params.get('q') or '').strip()
+    if not query:
+        return 400, {'error': 'q required'}
+    try:
+        limit = int(params.get('limit') or SEARCH_DEFAULT_LIMIT)
+        offset = int(params.get('offset') or 0)
+    except ValueError:
+        return 400, {'error': 'Invalid limit or offset'}
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+
+    filters = ''
+    args = {'q': query, 'user_id': user_id, 'limit': limit + 1, 'offset': offset, 'headline': SEARCH_HEADLINE}
+    if params.get('category') in DOC_CATEGORIES:
+        filters = 'AND d.category = %(category)s'
+        args['category'] = params['category']
+    cur.execute(SEARCH_SQL.format(schema=SCHEMA, filters=filters), args)
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    items = []
+    for r in rows[:limit]:
+        items.append({
+            'id': str(r['id']),
+            'title': r['title'],
+            'category': r['category'],
+            'createdAt': r['created_at'].isoformat() if r['created_at'] else None,
+            'updatedAt': r['updated_at'].isoformat() if r['updated_at'] else None,
+            'rank': float(r['rank']),
+            'highlight': {'title': highlight(r['title_hl']), 'content': highlight(r['content_hl'])},
+        })
+    return 200, {'items': items, 'nextOffset': offset + limit if has_more else None}
+
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 1000
+SYNC_LAG_SECONDS = 5
+SYNC_TOMBSTONE_DAYS = 30
+SYNC_PRUNE_CHANCE = 0.01
+SYNC_MIN_ID = '00000000-0000-0000-0000-000000000000'
+
+def prune_tombstones(cur):
+    cur.execute(
+        "DELETE FROM %s.sync_tombstones WHERE deleted_at < NOW() - make_interval(days => %%s)" % SCHEMA,
+        (SYNC_TOMBSTONE_DAYS,)
+    )
+
+def encode_sync_cursor(ts, row_id):
+    raw = "%s|%s" % (ts.isoformat(), row_id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_sync_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.split('|', 1)
+        ts = datetime.datetime.fromisoformat(ts)
+        if ts.tzinfo is None:
+            return None
+        return ts, str(uuid.UUID(row_id))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def sync_docs(cur, user_id, params):
+    """Дельта после курсора since: новые и изменённые документы и id удалённых (tombstones)"""
+    try:
+        limit = int(params.get('limit') or SYNC_DEFAULT_LIMIT)
+    except ValueError:
+        return 400, {'error': 'Invalid limit'}
+    limit = max(1, min(limit, SYNC_MAX_LIMIT))
+
+    cur.execute(
+        "SELECT NOW() - make_interval(secs => %s) AS horizon, NOW() - make_interval(days => %s) AS oldest",
+        (SYNC_LAG_SECONDS, SYNC_TOMBSTONE_DAYS)
+    )
+    bounds = cur.fetchone()
+    initial = not params.get('since')
+    if initial:
+        position = (datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc), SYNC_MIN_ID)
+    else:
+        position = decode_sync_cursor(params['since'])
+        if not position:
+            return 400, {'error': 'Invalid cursor'}
+        if position[0] < bounds['oldest']:
+            return 410, {'error': 'Cursor expired, full reload required'}
+
+    cur.execute(
+        "SELECT id, title, content, category, created_at, updated_at FROM %s.documents "
+        "WHERE user_id = %%s AND (updated_at, id) > (%%s, %%s::uuid) AND updated_at <= %%s "
+        "ORDER BY updated_at, id LIMIT %d"
+        % (SCHEMA, limit + 1),
+        (user_id, position[0], position[1], bounds['horizon'])
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    upper = rows[-1]['updated_at'] if has_more else bounds['horizon']
+    deleted = []
+    if not initial:
+        cur.execute(
+            "SELECT DISTINCT record_id FROM %s.sync_tombstones "
+            "WHERE user_id = %%s AND resource = %%s AND deleted_at > %%s AND deleted_at <= %%s" % SCHEMA,
+            (user_id, 'documents', position[0], upper)
+        )
+        deleted = [r['record_id'] for r in cur.fetchall()]
+    return 200, {
+        'items': [row_to_doc(r) for r in rows],
+        'deleted': deleted,
+        'nextCursor': encode_sync_cursor(rows[-1]['updated_at'], rows[-1]['id']) if has_more
+        else encode_sync_cursor(bounds['horizon'], SYNC_MIN_ID),
+        'hasMore': has_more,
+    }
+
+def list_version(cur, sql, args, params):
+    """ETag и Last-Modified списка по числу строк и max(updated_at) — без выборки самих строк"""
+    cur.execute(sql, args)
+    r = cur.fetchone()
+    last_modified = r['last_modified']
+    raw = "%s|%s|%s" % (
+        r['total'],
+        last_modified.isoformat() if last_modified else '',
+        json.dumps(params or {}, sort_keys=True),
+    )
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:24], last_modified
+
+def cache_headers(etag, last_modified):
+    headers = dict(CORS_HEADERS, ETag=etag)
+    headers['Cache-Control'] = 'private, no-cache'
+    if last_modified:
+        headers['Last-Modified'] = email.utils.format_datetime(
+            last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(event, etag):
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1400'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+def dumps(payload):
+    """JSON-тело ответа: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False)
+
+def accepted_encoding(event):
+    headers = event.get('headers') or {}
+    accept = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    offered = set()
+    for part in accept.lower().split(','):
+        name, _, q = part.partition(';')
+        q = q.replace(' ', '')
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        offered.add(name.strip())
+    if brotli is not None and 'br' in offered:
+        return 'br'
+    if 'gzip' in offered or '*' in offered:
+        return 'gzip'
+    return None
+
+def compress_response(event, response):
+    """Сжимает крупное тело ответа (br/gzip по Accept-Encoding) и отдаёт его в base64 для шлюза"""
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return response
+    raw = body.encode()
+    if encoding == 'br':
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    headers = dict(response.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return dict(response, headers=headers, body=base64.b64encode(data).decode(), isBase64Encoded=True)
+
+def compressed(handler):
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        return compress_response(event, handler(event, context))
+    return wrapper
+
+@compressed
 def handler(event, context):
     """API для управления документами: письма, внутренние, прочие"""
     if event.get('httpMethod') == 'OPTIONS':
@@ -66,11 +476,12 @@ def handler(event, context):
 
     user_id = get_user_id(event)
     if not user_id:
-        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Unauthorized'})}
+        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Unauthorized'})}
 
     method = event.get('httpMethod', 'GET')
     params = event.get('queryStringParameters') or {}
 
+    import psycopg2.extras
     conn = get_conn()
     conn.autocommit = True
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
@@ -78,7 +489,40 @@ def handler(event, context):
     try:
         uid = user_id.replace("'", "")
 
-        if method == 'GET':
+        if method == 'GET' and 'q' in params:
+            status, payload = search_docs(cur, user_id, params)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
+        elif method == 'GET' and params.get('id'):
+            r = get_doc(cur, user_id, params['id'])
+            if not r:
+                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+            etag = '"%s"' % hashlib.sha1(("%s|%s" % (r['id'], r['updated_at'].isoformat())).encode()).hexdigest()[:24]
+            headers = cache_headers(etag, r['updated_at'])
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+            return {'statusCode': 200, 'headers': headers, 'body': dumps(row_to_doc(r))}
+
+        elif method == 'GET' and 'since' in params:
+            status, payload = sync_docs(cur, user_id, params)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
+        elif method == 'GET':
+            etag, last_modified = list_version(
+                cur,
+                "SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified "
+                "FROM %s.documents WHERE user_id = '%s'" % (SCHEMA, uid),
+                None, params
+            )
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+            if params.get('mode') == 'list':
+                status, payload = list_docs(cur, user_id, params)
+                return {'statusCode': status, 'headers': headers if status == 200 else CORS_HEADERS,
+                        'body': dumps(payload)}
+
             category = params.get('category', '')
             if category and category in ('letters', 'internal', 'other'):
                 cur.execute(
@@ -93,7 +537,7 @@ def handler(event, context):
                     % (SCHEMA, uid)
                 )
             rows = cur.fetchall()
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps([row_to_doc(r) for r in rows])}
+            return {'statusCode': 200, 'headers': headers, 'body': dumps([row_to_doc(r) for r in rows])}
 
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
@@ -110,7 +554,7 @@ def handler(event, context):
                 % (SCHEMA, uid, title, content, category)
             )
             r = cur.fetchone()
-            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps(row_to_doc(r))}
+            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps(row_to_doc(r))}
 
         elif method == 'PUT':
             body = json.loads(event.get('body', '{}'))
@@ -130,18 +574,22 @@ def handler(event, context):
             )
             r = cur.fetchone()
             if not r:
-                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(row_to_doc(r))}
+                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(row_to_doc(r))}
 
         elif method == 'DELETE':
             doc_id = params.get('id', '').replace("'", "")
             cur.execute(
-                "DELETE FROM %s.documents WHERE id = '%s' AND user_id = '%s'"
-                % (SCHEMA, doc_id, uid)
+                "WITH gone AS (DELETE FROM %s.documents WHERE id = '%s' AND user_id = '%s' RETURNING id, user_id) "
+                "INSERT INTO %s.sync_tombstones (user_id, resource, record_id) "
+                "SELECT user_id, 'documents', id::text FROM gone"
+                % (SCHEMA, doc_id, uid, SCHEMA)
             )
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+            if random.random() < SYNC_PRUNE_CHANCE:
+                prune_tombstones(cur)
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
 
-        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Method not allowed'})}
+        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Method not allowed'})}
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        put_conn(conn)
\ No newline at end of file
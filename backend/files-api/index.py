@@ -5,9 +5,25 @@ import base64
 import hashlib
 import hmac
 import time
-import boto3
-import psycopg2
-import psycopg2.extras
+import re
+import threading
+import io
+import concurrent.futures
+import collections
+import functools
+import gzip
+import logging
+import urllib.parse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 SCHEMA = 't_p54371197_task_manager_creatio'
 
@@ -21,23 +37,48 @@ CORS_HEADERS = {
 
 SECRET = None
 
+logger = logging.getLogger('files-api')
+
 def get_secret():
     global SECRET
     if SECRET is None:
         SECRET = os.environ.get('AUTH_SECRET', 'task-manager-secret-2024')
     return SECRET
 
+TOKEN_TTL = 30 * 24 * 3600
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '512'))
+
+_TOKEN_CACHE = collections.OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 def verify_token(token):
+    """Проверяет подпись и срок токена; проверенные токены кешируются в контейнере до истечения срока"""
+    now = time.time()
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+        if cached:
+            if cached[1] > now:
+                _TOKEN_CACHE.move_to_end(token)
+                return cached[0]
+            del _TOKEN_CACHE[token]
     parts = token.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         return None
-    user_id, ts, sig = parts
-    payload = user_id + ":" + ts
+    user_id, ts, sig = parts[0], parts[1], parts[-1]
+    payload = token[:-len(sig) - 1]
     expected = hmac.new(get_secret().encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
     if not hmac.compare_digest(sig, expected):
         return None
-    if int(time.time()) - int(ts) > 30 * 24 * 3600:
+    try:
+        expires = int(ts) + TOKEN_TTL
+    except ValueError:
+        return None
+    if expires <= now:
         return None
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = (user_id, expires)
+        while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+            _TOKEN_CACHE.popitem(last=False)
     return user_id
 
 def get_user_id(event):
@@ -48,16 +89,99 @@ def get_user_id(event):
         return verify_token(auth[7:])
     return None
 
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECK_AFTER = int(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+_POOL = []
+_POOL_LOCK = threading.Lock()
+
+def _close_quietly(conn):
+    import psycopg2
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def _is_alive(conn):
+    import psycopg2
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_conn():
+    """Берёт соединение из пула тёплого контейнера или открывает новое"""
+    import psycopg2
+    now = time.time()
+    while True:
+        with _POOL_LOCK:
+            if not _POOL:
+                break
+            conn, last_used = _POOL.pop()
+        idle = now - last_used
+        if conn.closed or idle > DB_POOL_IDLE_TIMEOUT:
+            _close_quietly(conn)
+            continue
+        if idle > DB_POOL_CHECK_AFTER and not _is_alive(conn):
+            _close_quietly(conn)
+            continue
+        return conn
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
+def put_conn(conn):
+    """Возвращает соединение в пул; сломанные и лишние закрываются"""
+    import psycopg2
+    if conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _close_quietly(conn)
+        return
+    with _POOL_LOCK:
+        if len(_POOL) < DB_POOL_MAX_SIZE:
+            _POOL.append((conn, time.time()))
+            return
+    _close_quietly(conn)
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'files')
+
+PRESIGN_EXPIRES = 3600
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', str(2 * 1024 ** 3)))
+FILE_ID_RE = re.compile(r'^[0-9a-f-]{12}$')
+
+S3_CLIENT = None
+
 def get_s3():
-    return boto3.client(
-        's3',
-        endpoint_url='https://bucket.poehali.dev',
-        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-    )
+    import boto3
+    from botocore.config import Config
+    global S3_CLIENT
+    if S3_CLIENT is None:
+        S3_CLIENT = boto3.client(
+            's3',
+            endpoint_url=S3_ENDPOINT_URL,
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=10,
+                tcp_keepalive=True,
+                connect_timeout=5,
+                read_timeout=60,
+                retries={'max_attempts': 3, 'mode': 'standard'}
+            )
+        )
+    return S3_CLIENT
 
 def cdn_url(key):
     return "https://cdn.poehali.dev/projects/%s/bucket/%s" % (os.environ['AWS_ACCESS_KEY_ID'], key)
@@ -71,48 +195,563 @@ def row_to_attachment(r):
         'fileSize': r['file_size'],
         'contentType': r['content_type'],
         'cdnUrl': r['cdn_url'],
+        'thumbUrl': r.get('thumb_url'),
         'createdAt': r['created_at'].isoformat() if r['created_at'] else None,
     }
 
+def safe_file_name(file_name):
+    return file_name.replace("'", "").replace("/", "_").replace("\\", "_")
+
+def attachment_key(task_id, doc_id, file_id, safe_name):
+    folder = "docs/%s" % doc_id.replace("'", "") if doc_id else "attachments/%s" % task_id.replace("'", "")
+    return "%s/%s_%s" % (folder, file_id, safe_name)
+
+def insert_attachment(cur, file_id, task_id, doc_id, safe_name, file_size, content_type, url, uid,
+                      sha256=None, thumb_url=None):
+    doc_id_val = "NULL" if not doc_id else "'%s'" % doc_id.replace("'", "")
+    task_id_val = task_id.replace("'", "")
+    sha256_val = "'%s'" % sha256 if sha256 and SHA256_RE.match(sha256) else "NULL"
+    thumb_val = "'%s'" % thumb_url.replace("'", "") if thumb_url else "NULL"
+    cur.execute(
+        "INSERT INTO %s.attachments "
+        "(id, task_id, doc_id, file_name, file_size, content_type, cdn_url, user_id, blob_sha256, thumb_url) "
+        "VALUES ('%s', '%s', %s, '%s', %d, '%s', '%s', '%s', %s, %s) "
+        "RETURNING id, task_id, doc_id, file_name, file_size, content_type, cdn_url, thumb_url, created_at"
+        % (
+            SCHEMA, file_id, task_id_val, doc_id_val,
+            safe_name.replace("'", "''"), file_size,
+            content_type.replace("'", ""), url.replace("'", ""), uid, sha256_val, thumb_val
+        )
+    )
+    return cur.fetchone()
+
+BLOB_GC_GRACE_HOURS = int(os.environ.get('BLOB_GC_GRACE_HOURS', '24'))
+BLOB_GC_BATCH = 100
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+BLOB_RETURNING = "sha256, s3_key, cdn_url, file_size, content_type, thumb_url"
+
+FILE_EXT_RE = re.compile(r'^\.[0-9a-z]{1,10}$')
+
+def file_ext(file_name):
+    ext = os.path.splitext(file_name)[1].lower()
+    return ext if FILE_EXT_RE.match(ext) else ''
+
+def content_disposition(file_name):
+    """Content-Disposition с исходным именем файла (RFC 5987), чтобы при скачивании оно не терялось"""
+    return "inline; filename*=UTF-8''%s" % urllib.parse.quote(file_name, safe='')
+
+def blob_key(sha256, file_name):
+    """Ключ блоба со случайным суффиксом: по одному хешу содержимого адрес в CDN не угадать"""
+    return "blobs/%s/%s-%s%s" % (sha256[:2], sha256, uuid.uuid4().hex, file_ext(file_name))
+
+def acquire_blob(cur, sha256):
+    """Добавляет ссылку на уже сохранённый блоб; None — такого содержимого ещё нет"""
+    cur.execute(
+        "UPDATE %s.blobs SET ref_count = ref_count + 1, unreferenced_at = NULL "
+        "WHERE sha256 = %%s RETURNING %s" % (SCHEMA, BLOB_RETURNING),
+        (sha256,)
+    )
+    return cur.fetchone()
+
+def register_blob(cur, sha256, s3_key, file_size, content_type):
+    """Записывает новый блоб с одной ссылкой; если его успели записать параллельно — берёт существующий"""
+    cur.execute(
+        "INSERT INTO %s.blobs AS b (sha256, s3_key, cdn_url, file_size, content_type, ref_count) "
+        "VALUES (%%s, %%s, %%s, %%s, %%s, 1) "
+        "ON CONFLICT (sha256) DO UPDATE SET ref_count = b.ref_count + 1, unreferenced_at = NULL "
+        "RETURNING %s" % (SCHEMA, BLOB_RETURNING),
+        (sha256, s3_key, cdn_url(s3_key), file_size, content_type)
+    )
+    return cur.fetchone()
+
+def release_blob(cur, sha256):
+    cur.execute(
+        "UPDATE %s.blobs SET ref_count = ref_count - 1, "
+        "unreferenced_at = CASE WHEN ref_count <= 1 THEN NOW() ELSE unreferenced_at END "
+        "WHERE sha256 = %%s" % SCHEMA,
+        (sha256,)
+    )
+
+def store_blob(cur, sha256, file_name, file_size, content_type, upload):
+    """Блоб по sha256: дубликат не пишется в хранилище повторно, иначе upload(key) и регистрация"""
+    blob = acquire_blob(cur, sha256)
+    if blob:
+        return blob
+    s3_key = blob_key(sha256, file_name)
+    upload(s3_key)
+    blob = register_blob(cur, sha256, s3_key, file_size, content_type)
+    if blob['s3_key'] != s3_key:
+        # параллельная загрузка того же содержимого успела зарегистрироваться первой
+        get_s3().delete_object(Bucket=S3_BUCKET, Key=s3_key)
+    return blob
+
+def checksum_sha256(sha256):
+    """Хеш из hex в base64 — формат x-amz-checksum-sha256"""
+    return base64.b64encode(bytes.fromhex(sha256)).decode()
+
+def collect_garbage(conn, cur):
+    """Удаляет из хранилища блобы без ссылок старше BLOB_GC_GRACE_HOURS; каждый — в своей транзакции"""
+    cur.execute(
+        "SELECT sha256 FROM %s.blobs WHERE ref_count <= 0 "
+        "AND unreferenced_at < NOW() - make_interval(hours => %%s) "
+        "ORDER BY unreferenced_at LIMIT %%s" % SCHEMA,
+        (BLOB_GC_GRACE_HOURS, BLOB_GC_BATCH)
+    )
+    candidates = [r['sha256'] for r in cur.fetchall()]
+    conn.commit()
+    s3 = get_s3()
+    deleted = 0
+    for sha256 in candidates:
+        cur.execute(
+            "DELETE FROM %s.blobs WHERE sha256 = %%s AND ref_count <= 0 RETURNING s3_key" % SCHEMA,
+            (sha256,)
+        )
+        r = cur.fetchone()
+        if r:
+            s3.delete_objects(Bucket=S3_BUCKET, Delete={'Objects': [
+                {'Key': r['s3_key']}, {'Key': r['s3_key'] + THUMB_SUFFIX}
+            ], 'Quiet': True})
+            deleted += 1
+        conn.commit()
+    return 200, {'deleted': deleted, 'checked': len(candidates)}
+
+def is_cron_request(event):
+    """Вызов планировщика: заголовок X-Cron-Secret совпадает с CRON_SECRET из окружения"""
+    secret = os.environ.get('CRON_SECRET', '')
+    headers = event.get('headers') or {}
+    given = headers.get('X-Cron-Secret') or headers.get('x-cron-secret') or ''
+    return bool(secret) and hmac.compare_digest(given.encode(), secret.encode())
+
+def run_garbage_collection():
+    import psycopg2.extras
+    conn = get_conn()
+    conn.autocommit = False
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        status, payload = collect_garbage(conn, cur)
+    finally:
+        cur.close()
+        put_conn(conn)
+    return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
+def presign_upload(body):
+    """Первая фаза прямой загрузки: presigned PUT или набор ссылок на части multipart-загрузки"""
+    file_id = str(uuid.uuid4())[:12]
+    safe_name = safe_file_name(body.get('fileName', 'file'))
+    content_type = body.get('contentType') or 'application/octet-stream'
+    s3_key = attachment_key(body.get('taskId', ''), body.get('docId', ''), file_id, safe_name)
+    try:
+        file_size = int(body.get('fileSize') or 0)
+    except (TypeError, ValueError):
+        return 400, {'error': 'Invalid fileSize'}
+    if file_size < 0:
+        return 400, {'error': 'Invalid fileSize'}
+    if file_size > MAX_UPLOAD_SIZE:
+        return 413, {'error': 'File too large', 'maxSize': MAX_UPLOAD_SIZE}
+
+    result = {'fileId': file_id, 'fileName': safe_name, 'key': s3_key}
+    disposition = content_disposition(body.get('fileName') or safe_name)
+    s3 = get_s3()
+    if file_size <= MULTIPART_THRESHOLD:
+        params = {'Bucket': S3_BUCKET, 'Key': s3_key, 'ContentType': content_type,
+                  'ContentDisposition': disposition}
+        result['headers'] = {'Content-Type': content_type, 'Content-Disposition': disposition}
+        sha256 = (body.get('sha256') or '').lower()
+        if SHA256_RE.match(sha256):
+            # хранилище само сверит тело с хешем клиента и сохранит его для finalize
+            params['ChecksumSHA256'] = result['headers']['x-amz-checksum-sha256'] = checksum_sha256(sha256)
+        result['uploadUrl'] = s3.generate_presigned_url('put_object', Params=params, ExpiresIn=PRESIGN_EXPIRES)
+        return 200, result
+
+    part_size = max(MULTIPART_PART_SIZE, -(-file_size // MULTIPART_MAX_PARTS))
+    part_count = -(-file_size // part_size)
+    upload = s3.create_multipart_upload(Bucket=S3_BUCKET, Key=s3_key, ContentType=content_type,
+                                        ContentDisposition=disposition)
+    result['uploadId'] = upload['UploadId']
+    result['partSize'] = part_size
+    result['parts'] = [
+        {
+            'partNumber': n,
+            'url': s3.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': S3_BUCKET, 'Key': s3_key, 'UploadId': upload['UploadId'], 'PartNumber': n},
+                ExpiresIn=PRESIGN_EXPIRES
+            ),
+        }
+        for n in range(1, part_count + 1)
+    ]
+    return 200, result
+
+def finalize_upload(conn, cur, body, uid):
+    """Вторая фаза: завершает multipart, проверяет объект через HEAD и записывает вложение"""
+    import psycopg2
+    import botocore.exceptions
+    file_id = body.get('fileId', '')
+    if not FILE_ID_RE.match(file_id):
+        return 400, {'error': 'Invalid fileId'}
+    task_id = body.get('taskId', '')
+    doc_id = body.get('docId', '')
+    safe_name = safe_file_name(body.get('fileName', 'file'))
+    s3_key = attachment_key(task_id, doc_id, file_id, safe_name)
+
+    s3 = get_s3()
+    upload_id = body.get('uploadId')
+    if upload_id:
+        parts = body.get('parts') or []
+        try:
+            s3.complete_multipart_upload(
+                Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': int(p['partNumber']), 'ETag': p['etag']}
+                    for p in sorted(parts, key=lambda p: int(p['partNumber']))
+                ]}
+            )
+        except (KeyError, TypeError, ValueError):
+            return 400, {'error': 'Invalid parts'}
+        except botocore.exceptions.ClientError as e:
+            return 400, {'error': 'Multipart completion failed: %s' % e.response['Error'].get('Code', '')}
+
+    try:
+        head = s3.head_object(Bucket=S3_BUCKET, Key=s3_key, ChecksumMode='ENABLED')
+    except botocore.exceptions.ClientError:
+        return 404, {'error': 'Uploaded object not found'}
+    if head['ContentLength'] > MAX_UPLOAD_SIZE:
+        # размер из presign клиент мог занизить
+        s3.delete_object(Bucket=S3_BUCKET, Key=s3_key)
+        return 413, {'error': 'File too large', 'maxSize': MAX_UPLOAD_SIZE}
+
+    content_type = head.get('ContentType') or 'application/octet-stream'
+    url = cdn_url(s3_key)
+    source_key = s3_key
+    thumb_url = None
+    sha256 = (body.get('sha256') or '').lower()
+    # дедупликация только по контрольной сумме, проверенной хранилищем; без неё объект не перечитывается
+    if SHA256_RE.match(sha256) and head.get('ChecksumSHA256') == checksum_sha256(sha256):
+        blob = register_blob(cur, sha256, s3_key, head['ContentLength'], content_type)
+        url, source_key, thumb_url = blob['cdn_url'], blob['s3_key'], blob['thumb_url']
+        if blob['s3_key'] != s3_key:
+            s3.delete_object(Bucket=S3_BUCKET, Key=s3_key)
+    else:
+        sha256 = None
+
+    try:
+        r = insert_attachment(
+            cur, file_id, task_id, doc_id, safe_name, head['ContentLength'], content_type, url, uid,
+            sha256, thumb_url
+        )
+    except psycopg2.IntegrityError:
+        return 409, {'error': 'Already finalized'}
+    conn.commit()
+    if not r['thumb_url']:
+        r['thumb_url'] = wait_thumbnail(schedule_thumbnail(file_id, sha256, source_key, content_type))
+    return 201, row_to_attachment(r)
+
+def abort_upload(body):
+    import botocore.exceptions
+    file_id = body.get('fileId', '')
+    if not FILE_ID_RE.match(file_id) or not body.get('uploadId'):
+        return 400, {'error': 'fileId and uploadId required'}
+    s3_key = attachment_key(body.get('taskId', ''), body.get('docId', ''), file_id,
+                            safe_file_name(body.get('fileName', 'file')))
+    try:
+        get_s3().abort_multipart_upload(Bucket=S3_BUCKET, Key=s3_key, UploadId=body['uploadId'])
+    except botocore.exceptions.ClientError:
+        return 404, {'error': 'Upload not found'}
+    return 200, {'ok': True}
+
+THUMB_SIZE = int(os.environ.get('THUMB_SIZE', '256'))
+THUMB_WORKERS = int(os.environ.get('THUMB_WORKERS', '2'))
+THUMB_MAX_SOURCE_BYTES = 25 * 1024 * 1024
+THUMB_BACKFILL_BATCH = 20
+THUMB_BUDGET_SECONDS = float(os.environ.get('THUMB_BUDGET_SECONDS', '2'))
+THUMB_BACKFILL_BUDGET_SECONDS = float(os.environ.get('THUMB_BACKFILL_BUDGET_SECONDS', '10'))
+THUMB_MAX_ATTEMPTS = 3
+THUMB_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif', 'image/bmp', 'image/tiff')
+THUMB_PDF_TYPE = 'application/pdf'
+THUMB_SUFFIX = '.thumb.jpg'
+
+THUMB_POOL = None
+
+def get_thumb_pool():
+    global THUMB_POOL
+    if THUMB_POOL is None:
+        THUMB_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix='thumb')
+    return THUMB_POOL
+
+def has_thumbnail(content_type):
+    return content_type in THUMB_IMAGE_TYPES or content_type == THUMB_PDF_TYPE
+
+def render_thumbnail(data, content_type):
+    """JPEG-превью: уменьшенная картинка или первая страница PDF"""
+    from PIL import Image, ImageOps
+    if content_type == THUMB_PDF_TYPE:
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(data)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            image = page.render(scale=THUMB_SIZE / max(width, height, 1)).to_pil()
+        finally:
+            pdf.close()
+    else:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=80, optimize=True)
+    return out.getvalue()
+
+def record_thumbnail(sql, args):
+    conn = get_conn()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, args)
+    finally:
+        put_conn(conn)
+
+def thumbnail_job(file_id, sha256, source_key, content_type, data=None):
+    """Задача пула: превью кладётся рядом с оригиналом; попытки и ошибки пишутся в thumb_attempts/thumb_error"""
+    record_thumbnail(
+        "UPDATE %s.attachments SET thumb_attempts = thumb_attempts + 1 WHERE id = %%s" % SCHEMA, (file_id,))
+    try:
+        s3 = get_s3()
+        if data is None:
+            head = s3.head_object(Bucket=S3_BUCKET, Key=source_key)
+            if head['ContentLength'] > THUMB_MAX_SOURCE_BYTES:
+                data = None
+            else:
+                data = s3.get_object(Bucket=S3_BUCKET, Key=source_key)['Body'].read()
+        elif len(data) > THUMB_MAX_SOURCE_BYTES:
+            data = None
+        if data is None:
+            record_thumbnail(
+                "UPDATE %s.attachments SET thumb_attempts = %%s, thumb_error = %%s WHERE id = %%s" % SCHEMA,
+                (THUMB_MAX_ATTEMPTS, 'source too large', file_id))
+            return None
+        thumb_key = source_key + THUMB_SUFFIX
+        s3.put_object(Bucket=S3_BUCKET, Key=thumb_key, Body=render_thumbnail(data, content_type),
+                      ContentType='image/jpeg', CacheControl='public, max-age=31536000, immutable')
+    except Exception as e:
+        record_thumbnail(
+            "UPDATE %s.attachments SET thumb_error = %%s WHERE id = %%s" % SCHEMA, (str(e)[:500], file_id))
+        raise
+    thumb_url = cdn_url(thumb_key)
+
+    if sha256:
+        record_thumbnail("UPDATE %s.blobs SET thumb_url = %%s WHERE sha256 = %%s" % SCHEMA, (thumb_url, sha256))
+        record_thumbnail(
+            "UPDATE %s.attachments SET thumb_url = %%s, thumb_error = NULL "
+            "WHERE blob_sha256 = %%s OR id = %%s" % SCHEMA,
+            (thumb_url, sha256, file_id)
+        )
+    else:
+        record_thumbnail(
+            "UPDATE %s.attachments SET thumb_url = %%s, thumb_error = NULL WHERE id = %%s" % SCHEMA,
+            (thumb_url, file_id))
+    return thumb_url
+
+def log_thumbnail_failure(file_id):
+    def callback(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning('thumbnail failed for %s: %s', file_id, future.exception())
+    return callback
+
+def schedule_thumbnail(file_id, sha256, source_key, content_type, data=None):
+    """Отдаёт превью в пул; None — для этого типа файла превью не строится"""
+    if not has_thumbnail(content_type):
+        return None
+    future = get_thumb_pool().submit(thumbnail_job, file_id, sha256, source_key, content_type, data)
+    future.add_done_callback(log_thumbnail_failure(file_id))
+    return future
+
+def wait_thumbnail(future):
+    """Ждёт превью не дольше THUMB_BUDGET_SECONDS: после ответа контейнер может быть заморожен"""
+    if future is None:
+        return None
+    try:
+        return future.result(timeout=THUMB_BUDGET_SECONDS)
+    except Exception:
+        return None
+
+def backfill_thumbnails(cur, uid):
+    """Догоняет превью для живых вложений пользователя без превью, пока не исчерпаны попытки"""
+    cur.execute(
+        "SELECT a.id, a.blob_sha256, a.content_type, a.cdn_url, b.s3_key "
+        "FROM %s.attachments a LEFT JOIN %s.blobs b ON b.sha256 = a.blob_sha256 "
+        "WHERE a.user_id = %%s AND a.thumb_url IS NULL AND a.content_type = ANY(%%s) "
+        "AND a.thumb_attempts < %%s AND (a.task_id <> '' OR a.doc_id IS NOT NULL) "
+        "ORDER BY a.created_at DESC LIMIT %%s" % (SCHEMA, SCHEMA),
+        (uid, list(THUMB_IMAGE_TYPES) + [THUMB_PDF_TYPE], THUMB_MAX_ATTEMPTS, THUMB_BACKFILL_BATCH)
+    )
+    rows = cur.fetchall()
+    prefix = cdn_url('')
+    futures = [
+        schedule_thumbnail(r['id'], r['blob_sha256'], r['s3_key'] or r['cdn_url'][len(prefix):], r['content_type'])
+        for r in rows if r['s3_key'] or r['cdn_url'].startswith(prefix)
+    ]
+    done, pending = concurrent.futures.wait(futures, timeout=THUMB_BACKFILL_BUDGET_SECONDS)
+    failed = sum(1 for f in done if f.exception() is not None)
+    return 200, {'created': sum(1 for f in done if f.exception() is None and f.result()),
+                 'failed': failed, 'pending': len(pending), 'checked': len(rows)}
+
+BATCH_MAX_IDS = int(os.environ.get('ATTACHMENTS_BATCH_MAX_IDS', '200'))
+
+def list_attachments_batch(cur, params, uid):
+    """Вложения сразу для многих задач или документов: один запрос с ANY, результат по родителям"""
+    if params.get('doc_ids') and params.get('task_ids'):
+        return 400, {'error': 'Pass either task_ids or doc_ids, not both'}
+    column = 'doc_id' if params.get('doc_ids') else 'task_id'
+    raw = params.get('doc_ids') or params.get('task_ids') or ''
+    ids = list(dict.fromkeys(i.strip() for i in raw.split(',') if i.strip()))
+    if len(ids) > BATCH_MAX_IDS:
+        return 400, {'error': 'Too many ids, max %d' % BATCH_MAX_IDS}
+
+    if params.get('summary') == '1':
+        cur.execute(
+            "SELECT %s AS parent_id, COUNT(*) AS count, COALESCE(SUM(file_size), 0) AS total_size "
+            "FROM %s.attachments WHERE user_id = %%s AND %s = ANY(%%s) GROUP BY %s"
+            % (column, SCHEMA, column, column),
+            (uid, ids)
+        )
+        items = {i: {'count': 0, 'totalSize': 0} for i in ids}
+        for r in cur.fetchall():
+            items[r['parent_id']] = {'count': r['count'], 'totalSize': int(r['total_size'])}
+        return 200, {'items': items}
+
+    cur.execute(
+        "SELECT id, task_id, doc_id, file_name, file_size, content_type, cdn_url, thumb_url, created_at "
+        "FROM %s.attachments WHERE user_id = %%s AND %s = ANY(%%s) ORDER BY created_at DESC"
+        % (SCHEMA, column),
+        (uid, ids)
+    )
+    items = {i: [] for i in ids}
+    for r in cur.fetchall():
+        items[r[column]].append(row_to_attachment(r))
+    return 200, {'items': items}
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1400'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+def dumps(payload):
+    """JSON-тело ответа: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False)
+
+def accepted_encoding(event):
+    headers = event.get('headers') or {}
+    accept = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    offered = set()
+    for part in accept.lower().split(','):
+        name, _, q = part.partition(';')
+        q = q.replace(' ', '')
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        offered.add(name.strip())
+    if brotli is not None and 'br' in offered:
+        return 'br'
+    if 'gzip' in offered or '*' in offered:
+        return 'gzip'
+    return None
+
+def compress_response(event, response):
+    """Сжимает крупное тело ответа (br/gzip по Accept-Encoding) и отдаёт его в base64 для шлюза"""
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return response
+    raw = body.encode()
+    if encoding == 'br':
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    headers = dict(response.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return dict(response, headers=headers, body=base64.b64encode(data).decode(), isBase64Encoded=True)
+
+def compressed(handler):
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        return compress_response(event, handler(event, context))
+    return wrapper
+
+@compressed
 def handler(event, context):
     """Загрузка, получение и удаление файлов-вложений к задачам и документам"""
     if event.get('httpMethod') == 'OPTIONS':
         return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': ''}
 
+    if is_cron_request(event):
+        return run_garbage_collection()
+
     user_id = get_user_id(event)
     if not user_id:
-        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Unauthorized'})}
+        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Unauthorized'})}
 
     method = event.get('httpMethod', 'GET')
     params = event.get('queryStringParameters') or {}
     uid = user_id.replace("'", "")
 
+    import psycopg2.extras
     conn = get_conn()
-    conn.autocommit = True
+    conn.autocommit = method == 'GET'
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
     try:
         if method == 'GET':
+            if params.get('task_ids') or params.get('doc_ids'):
+                status, payload = list_attachments_batch(cur, params, uid)
+                return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
             task_id = params.get('task_id', '')
             doc_id = params.get('doc_id', '')
 
             if doc_id:
                 cur.execute(
-                    "SELECT id, task_id, doc_id, file_name, file_size, content_type, cdn_url, created_at "
+                    "SELECT id, task_id, doc_id, file_name, file_size, content_type, cdn_url, thumb_url, created_at "
                     "FROM %s.attachments WHERE doc_id = '%s' AND user_id = '%s' ORDER BY created_at DESC"
                     % (SCHEMA, doc_id.replace("'", ""), uid)
                 )
             else:
                 cur.execute(
-                    "SELECT id, task_id, doc_id, file_name, file_size, content_type, cdn_url, created_at "
+                    "SELECT id, task_id, doc_id, file_name, file_size, content_type, cdn_url, thumb_url, created_at "
                     "FROM %s.attachments WHERE task_id = '%s' AND user_id = '%s' ORDER BY created_at DESC"
                     % (SCHEMA, task_id.replace("'", ""), uid)
                 )
             rows = cur.fetchall()
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps([row_to_attachment(r) for r in rows])}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps([row_to_attachment(r) for r in rows])}
 
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
+            action = body.get('action', '')
+
+            if action == 'presign':
+                status, payload = presign_upload(body)
+                return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+            if action == 'finalize':
+                status, payload = finalize_upload(conn, cur, body, uid)
+                return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+            if action == 'abort':
+                status, payload = abort_upload(body)
+                return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+            if action == 'thumbnails':
+                status, payload = backfill_thumbnails(cur, uid)
+                conn.commit()
+                return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
             task_id = body.get('taskId', '')
             doc_id = body.get('docId', '')
             file_name = body.get('fileName', 'file')
@@ -121,42 +760,40 @@ def handler(event, context):
 
             file_bytes = base64.b64decode(file_data_b64)
             file_size = len(file_bytes)
+            sha256 = hashlib.sha256(file_bytes).hexdigest()
 
             file_id = str(uuid.uuid4())[:12]
-            safe_name = file_name.replace("'", "").replace("/", "_").replace("\\", "_")
-
-            folder = "docs/%s" % doc_id.replace("'", "") if doc_id else "attachments/%s" % task_id.replace("'", "")
-            s3_key = "%s/%s_%s" % (folder, file_id, safe_name)
+            safe_name = safe_file_name(file_name)
 
-            s3 = get_s3()
-            s3.put_object(Bucket='files', Key=s3_key, Body=file_bytes, ContentType=content_type)
-
-            url = cdn_url(s3_key)
-            doc_id_val = "NULL" if not doc_id else "'%s'" % doc_id.replace("'", "")
-            task_id_val = task_id.replace("'", "")
+            blob = store_blob(cur, sha256, file_name, file_size, content_type, lambda key: get_s3().put_object(
+                Bucket=S3_BUCKET, Key=key, Body=file_bytes, ContentType=content_type,
+                ContentDisposition=content_disposition(file_name)))
+            r = insert_attachment(cur, file_id, task_id, doc_id, safe_name, file_size, content_type,
+                                  blob['cdn_url'], uid, sha256, blob['thumb_url'])
+            conn.commit()
+            if not r['thumb_url']:
+                r['thumb_url'] = wait_thumbnail(
+                    schedule_thumbnail(file_id, sha256, blob['s3_key'], content_type, file_bytes))
+            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps(row_to_attachment(r))}
 
+        elif method == 'DELETE':
+            file_id = params.get('id', '').replace("'", "")
             cur.execute(
-                "INSERT INTO %s.attachments (id, task_id, doc_id, file_name, file_size, content_type, cdn_url, user_id) "
-                "VALUES ('%s', '%s', %s, '%s', %d, '%s', '%s', '%s') "
-                "RETURNING id, task_id, doc_id, file_name, file_size, content_type, cdn_url, created_at"
-                % (
-                    SCHEMA, file_id, task_id_val, doc_id_val,
-                    safe_name.replace("'", "''"), file_size,
-                    content_type.replace("'", ""), url.replace("'", ""), uid
-                )
+                "SELECT blob_sha256 FROM %s.attachments WHERE id = '%s' AND user_id = '%s' FOR UPDATE"
+                % (SCHEMA, file_id, uid)
             )
             r = cur.fetchone()
-            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps(row_to_attachment(r))}
-
-        elif method == 'DELETE':
-            file_id = params.get('id', '').replace("'", "")
             cur.execute(
-                "UPDATE %s.attachments SET task_id = '' WHERE id = '%s' AND user_id = '%s'"
+                "UPDATE %s.attachments SET task_id = '', doc_id = NULL, blob_sha256 = NULL "
+                "WHERE id = '%s' AND user_id = '%s'"
                 % (SCHEMA, file_id, uid)
             )
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+            if r and r['blob_sha256']:
+                release_blob(cur, r['blob_sha256'])
+            conn.commit()
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
 
-        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Method not allowed'})}
+        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Method not allowed'})}
     finally:
         cur.close()
-        conn.close()
+        put_conn(conn)
@@ -1,18 +1,34 @@
 import json
 import os
+import datetime
+import email.utils
 import hmac
 import hashlib
+import time
+import threading
+import collections
 import base64
-import uuid
-import psycopg2
-import psycopg2.extras
-import boto3
+import functools
+import gzip
+import re
+import urllib.parse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
     'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization',
     'Access-Control-Max-Age': '86400',
+    'Access-Control-Expose-Headers': 'ETag, Last-Modified',
     'Content-Type': 'application/json'
 }
 
@@ -24,15 +40,41 @@ def get_secret():
         SECRET = os.environ.get('AUTH_SECRET', 'task-manager-secret-2024')
     return SECRET
 
+TOKEN_TTL = 30 * 24 * 3600
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '512'))
+
+_TOKEN_CACHE = collections.OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 def verify_token(token):
+    """Проверяет подпись и срок токена; проверенные токены кешируются в контейнере до истечения срока"""
+    now = time.time()
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+        if cached:
+            if cached[1] > now:
+                _TOKEN_CACHE.move_to_end(token)
+                return cached[0]
+            del _TOKEN_CACHE[token]
     parts = token.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         return None
-    user_id, ts, sig = parts
-    expected = hmac.new(get_secret().encode(), f"{user_id}:{ts}".encode(), hashlib.sha256).hexdigest()
-    if hmac.compare_digest(expected, sig):
-        return user_id
-    return None
+    user_id, ts, sig = parts[0], parts[1], parts[-1]
+    payload = token[:-len(sig) - 1]
+    expected = hmac.new(get_secret().encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
+    if not hmac.compare_digest(sig, expected):
+        return None
+    try:
+        expires = int(ts) + TOKEN_TTL
+    except ValueError:
+        return None
+    if expires <= now:
+        return None
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = (user_id, expires)
+        while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+            _TOKEN_CACHE.popitem(last=False)
+    return user_id
 
 def get_user(event):
     auth = (event.get('headers') or {}).get('X-Authorization', '')
@@ -42,16 +84,92 @@ def get_user(event):
         return verify_token(auth[7:])
     return None
 
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECK_AFTER = int(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+_POOL = []
+_POOL_LOCK = threading.Lock()
+
+def _close_quietly(conn):
+    import psycopg2
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def _is_alive(conn):
+    import psycopg2
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_conn():
+    """Берёт соединение из пула тёплого контейнера или открывает новое"""
+    import psycopg2
+    now = time.time()
+    while True:
+        with _POOL_LOCK:
+            if not _POOL:
+                break
+            conn, last_used = _POOL.pop()
+        idle = now - last_used
+        if conn.closed or idle > DB_POOL_IDLE_TIMEOUT:
+            _close_quietly(conn)
+            continue
+        if idle > DB_POOL_CHECK_AFTER and not _is_alive(conn):
+            _close_quietly(conn)
+            continue
+        return conn
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
+def put_conn(conn):
+    """Возвращает соединение в пул; сломанные и лишние закрываются"""
+    import psycopg2
+    if conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _close_quietly(conn)
+        return
+    with _POOL_LOCK:
+        if len(_POOL) < DB_POOL_MAX_SIZE:
+            _POOL.append((conn, time.time()))
+            return
+    _close_quietly(conn)
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'files')
+
+S3_CLIENT = None
+
 def get_s3():
-    return boto3.client(
-        's3',
-        endpoint_url='https://bucket.poehali.dev',
-        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-    )
+    import boto3
+    from botocore.config import Config
+    global S3_CLIENT
+    if S3_CLIENT is None:
+        S3_CLIENT = boto3.client(
+            's3',
+            endpoint_url=S3_ENDPOINT_URL,
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=10,
+                tcp_keepalive=True,
+                connect_timeout=5,
+                read_timeout=60,
+                retries={'max_attempts': 3, 'mode': 'standard'}
+            )
+        )
+    return S3_CLIENT
 
 def cdn_url(key):
     return "https://cdn.poehali.dev/projects/%s/bucket/%s" % (os.environ['AWS_ACCESS_KEY_ID'], key)
@@ -65,11 +183,8 @@ def service_row(r):
     hourly_rate = float(r['hourly_rate']) if r['hourly_rate'] is not None else 1420
     fixed_price = float(r['fixed_price']) if r['fixed_price'] is not None else None
     is_fixed = bool(r['is_fixed_price'])
-    extra_total = sum(float(e.get('amount', 0)) for e in extra_costs)
-    if is_fixed:
-        total = (fixed_price or 0) + extra_total
-    else:
-        total = hours * hourly_rate + extra_total
+    # total — генерируемый столбец paid_services, считается в БД
+    total = float(r['total']) if r['total'] is not None else 0
     return {
         'id': r['id'],
         'serviceName': r['service_name'],
@@ -116,6 +231,487 @@ def applicant_row(r):
 def tag_row(r):
     return {'id': r['id'], 'name': r['name']}
 
+def version_etag(total, last_modified, params):
+    raw = "%s|%s|%s" % (
+        total,
+        last_modified.isoformat() if last_modified else '',
+        json.dumps(params or {}, sort_keys=True),
+    )
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:24]
+
+def list_version(cur, sql, args, params):
+    """ETag и Last-Modified списка по числу строк и max(updated_at) — без выборки самих строк"""
+    cur.execute(sql, args)
+    r = cur.fetchone()
+    return version_etag(r['total'], r['last_modified'], params), r['last_modified']
+
+def cache_headers(etag, last_modified):
+    headers = dict(CORS_HEADERS, ETag=etag)
+    headers['Cache-Control'] = 'private, no-cache'
+    if last_modified:
+        headers['Last-Modified'] = email.utils.format_datetime(
+            last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(event, etag):
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+
+DIRECTORY_CACHE_TTL = float(os.environ.get('DIRECTORY_CACHE_TTL', '60'))
+DIRECTORY_CACHE_BODIES = os.environ.get('DIRECTORY_CACHE_BODIES', '1') == '1'
+
+# resource -> (таблица, запрос списка, сериализатор строки)
+DIRECTORIES = {
+    'tags': ('service_tags', "SELECT id, name FROM service_tags ORDER BY id", tag_row),
+    'applicants': ('applicants', "SELECT * FROM applicants ORDER BY name", applicant_row),
+    'catalog': ('service_catalog', "SELECT * FROM service_catalog ORDER BY name", catalog_row),
+}
+
+DIRECTORY_CACHE = {}
+
+def directory_cache_get(resource):
+    entry = DIRECTORY_CACHE.get(resource)
+    if entry and entry['expires'] > time.monotonic():
+        return entry
+    return None
+
+def directory_cache_invalidate(resource):
+    DIRECTORY_CACHE.pop(resource, None)
+
+def store_directory(resource, etag, last_modified, items):
+    entry = {
+        'etag': etag,
+        'last_modified': last_modified,
+        'headers': cache_headers(etag, last_modified),
+        'items': items,
+        'body': dumps(items) if DIRECTORY_CACHE_BODIES else None,
+        'expires': time.monotonic() + DIRECTORY_CACHE_TTL,
+    }
+    DIRECTORY_CACHE[resource] = entry
+    return entry
+
+def revalidate_directory(resource, etag):
+    """Продлевает запись кеша, если версия справочника не изменилась; None — нужно перечитать"""
+    entry = DIRECTORY_CACHE.get(resource)
+    if not entry or entry['etag'] != etag:
+        return None
+    entry['expires'] = time.monotonic() + DIRECTORY_CACHE_TTL
+    return entry
+
+def load_directory(cur, resource):
+    """Читает справочник через кеш контейнера: при неизменной версии строки не перечитываются"""
+    entry = directory_cache_get(resource)
+    if entry:
+        return entry
+    table, list_sql, to_row = DIRECTORIES[resource]
+    etag, last_modified = list_version(
+        cur, "SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM %s" % table, None, None
+    )
+    entry = revalidate_directory(resource, etag)
+    if entry:
+        return entry
+    cur.execute(list_sql)
+    return store_directory(resource, etag, last_modified, [to_row(r) for r in cur.fetchall()])
+
+def directory_response(event, entry):
+    if is_not_modified(event, entry['etag']):
+        return {'statusCode': 304, 'headers': entry['headers'], 'body': ''}
+    body = entry['body'] if entry['body'] is not None else dumps(entry['items'])
+    return {'statusCode': 200, 'headers': entry['headers'], 'body': body}
+
+PAGE_MAX_LIMIT = 200
+
+def encode_cursor(r):
+    raw = "%s|%s" % (r['created_at'].isoformat(), r['id'])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, service_id = raw.split('|', 1)
+        return created_at, int(service_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def service_filters(params):
+    wheres = []
+    args = []
+    if params.get('date_from'):
+        wheres.append("service_date >= %s::date")
+        args.append(params['date_from'])
+    if params.get('date_to'):
+        wheres.append("service_date <= %s::date")
+        args.append(params['date_to'])
+    if params.get('status'):
+        wheres.append("status = %s")
+        args.append(params['status'])
+    return wheres, args
+
+def service_page(params, wheres, args):
+    """Добавляет keyset-условие курсора; возвращает (limit, LIMIT-выражение) или ошибку"""
+    limit_sql = ''
+    limit = None
+    if params.get('limit'):
+        try:
+            limit = max(1, min(int(params['limit']), PAGE_MAX_LIMIT))
+        except ValueError:
+            return None, {'error': 'Invalid limit'}
+        limit_sql = 'LIMIT %d' % (limit + 1)
+    if params.get('cursor'):
+        position = decode_cursor(params['cursor'])
+        if not position:
+            return None, {'error': 'Invalid cursor'}
+        wheres.append("(created_at, id) < (%s::timestamptz, %s)")
+        args.extend(position)
+    return (limit, limit_sql), None
+
+def list_services(cur, params):
+    """Постраничный список услуг: {items, nextCursor}"""
+    wheres, args = service_filters(params)
+    page, error = service_page(params, wheres, args)
+    if error:
+        return 400, error
+    limit, limit_sql = page
+    where_sql = ('WHERE ' + ' AND '.join(wheres)) if wheres else ''
+    import psycopg2
+    try:
+        cur.execute("SELECT * FROM paid_services %s ORDER BY created_at DESC, id DESC %s" % (where_sql, limit_sql), args)
+    except psycopg2.DataError:
+        return 400, {'error': 'Invalid filter value'}
+    rows = cur.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return 200, {'items': [service_row(r) for r in rows], 'nextCursor': next_cursor}
+
+SUMMARY_SQL = """
+WITH s AS (
+    SELECT id, status, service_date, created_at, applicant_id, applicant_name, tag_ids, total
+    FROM paid_services %s
+)
+SELECT
+    (SELECT json_build_object('count', COUNT(*), 'total', COALESCE(SUM(total), 0)) FROM s) AS overall,
+    (SELECT COALESCE(json_agg(json_build_object('month', month, 'count', n, 'total', amount) ORDER BY month), '[]')
+     FROM (SELECT to_char(COALESCE(service_date, created_at::date), 'YYYY-MM') AS month,
+                  COUNT(*) AS n, SUM(total) AS amount
+           FROM s GROUP BY 1) x) AS by_month,
+    (SELECT COALESCE(json_agg(json_build_object('status', status, 'count', n, 'total', amount) ORDER BY status), '[]')
+     FROM (SELECT status, COUNT(*) AS n, SUM(total) AS amount FROM s GROUP BY status) x) AS by_status,
+    (SELECT COALESCE(json_agg(json_build_object('tagId', tag_id, 'name', name, 'count', n, 'total', amount)
+                              ORDER BY amount DESC), '[]')
+     FROM (SELECT u.tag_id, st.name, COUNT(*) AS n, SUM(s.total) AS amount
+           FROM s CROSS JOIN LATERAL unnest(s.tag_ids) AS u(tag_id)
+           LEFT JOIN service_tags st ON st.id = u.tag_id
+           GROUP BY u.tag_id, st.name) x) AS by_tag,
+    (SELECT COALESCE(json_agg(json_build_object('applicantId', applicant_id, 'name', name, 'count', n, 'total', amount)
+                              ORDER BY amount DESC), '[]')
+     FROM (SELECT s.applicant_id, COALESCE(a.name, s.applicant_name) AS name, COUNT(*) AS n, SUM(s.total) AS amount
+           FROM s LEFT JOIN applicants a ON a.id = s.applicant_id
+           GROUP BY s.applicant_id, COALESCE(a.name, s.applicant_name)) x) AS by_applicant
+"""
+
+SUMMARY_SOURCES = (('services', 'paid_services'), ('applicants', 'applicants'), ('tags', 'service_tags'))
+
+def summary_version(cur, params):
+    """ETag итогов одним запросом: услуги, а также заявители и теги, чьи имена попадают в byApplicant/byTag"""
+    cur.execute("SELECT %s FROM %s" % (
+        ', '.join("%s.total AS %s_total, %s.last_modified AS %s_modified" % (name, name, name, name)
+                  for name, _ in SUMMARY_SOURCES),
+        ' CROSS JOIN '.join("(SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM %s) %s"
+                            % (table, name) for name, table in SUMMARY_SOURCES)
+    ))
+    r = cur.fetchone()
+    raw = '|'.join(version_etag(r[name + '_total'], r[name + '_modified'], params) for name, _ in SUMMARY_SOURCES)
+    stamps = [r[name + '_modified'] for name, _ in SUMMARY_SOURCES if r[name + '_modified']]
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:24], max(stamps) if stamps else None
+
+def services_summary(cur, params):
+    """Итоги и выручка по месяцам, статусам, тегам и заявителям — целиком в SQL"""
+    wheres, args = service_filters(params)
+    where_sql = ('WHERE ' + ' AND '.join(wheres)) if wheres else ''
+    import psycopg2
+    try:
+        cur.execute(SUMMARY_SQL % where_sql, args)
+    except psycopg2.DataError:
+        return 400, {'error': 'Invalid filter value'}
+    r = cur.fetchone()
+    return 200, {
+        'count': r['overall']['count'],
+        'total': r['overall']['total'],
+        'byMonth': r['by_month'],
+        'byStatus': r['by_status'],
+        'byTag': r['by_tag'],
+        'byApplicant': r['by_applicant'],
+    }
+
+BOOTSTRAP_DIRECTORIES = ('catalog', 'applicants', 'tags')
+
+def from_json_row(r):
+    """Приводит строку из json_agg к виду RealDictCursor: даты снова становятся datetime"""
+    for key in ('created_at', 'updated_at'):
+        if isinstance(r.get(key), str):
+            r[key] = datetime.datetime.fromisoformat(r[key])
+    return r
+
+def bootstrap_version(cur, params):
+    """ETag страницы одним запросом: версия услуг и справочников вне свежего кеша; None — перечитать"""
+    directories = {name: directory_cache_get(name) for name in BOOTSTRAP_DIRECTORIES}
+    stale = [name for name in BOOTSTRAP_DIRECTORIES if directories[name] is None]
+    columns = ["services.total AS services_total", "services.last_modified AS services_modified"]
+    sources = ["(SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM paid_services) services"]
+    for name in stale:
+        columns.append("%s.total AS %s_total, %s.last_modified AS %s_modified" % (name, name, name, name))
+        sources.append("(SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM %s) %s"
+                       % (DIRECTORIES[name][0], name))
+    cur.execute("SELECT %s FROM %s" % (', '.join(columns), ' CROSS JOIN '.join(sources)))
+    r = cur.fetchone()
+
+    versions = {}
+    for name in stale:
+        etag = version_etag(r[name + '_total'], r[name + '_modified'], None)
+        versions[name] = (etag, r[name + '_modified'])
+        directories[name] = revalidate_directory(name, etag)
+    directory_etags = [versions[name][0] if name in versions else directories[name]['etag']
+                       for name in BOOTSTRAP_DIRECTORIES]
+    stamps = [r['services_modified']] + [
+        versions[name][1] if name in versions else directories[name]['last_modified']
+        for name in BOOTSTRAP_DIRECTORIES
+    ]
+    raw = '|'.join([version_etag(r['services_total'], r['services_modified'], params)] + directory_etags)
+    stamps = [t for t in stamps if t]
+    etag = '"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:24]
+    return etag, max(stamps) if stamps else None, directories, versions
+
+def reload_directories(cur, names, versions):
+    """Перечитывает изменившиеся справочники одним запросом и кладёт их в кеш"""
+    cur.execute("SELECT %s" % ', '.join(
+        "(SELECT COALESCE(json_agg(x), '[]') FROM (%s) x) AS %s" % (DIRECTORIES[name][1], name)
+        for name in names
+    ))
+    r = cur.fetchone()
+    return {
+        name: store_directory(name, versions[name][0], versions[name][1],
+                              [DIRECTORIES[name][2](from_json_row(row)) for row in r[name]])
+        for name in names
+    }
+
+def bootstrap(cur, params, directories, versions):
+    """Всё для открытия страницы платных услуг: услуги, справочник, заявители, теги"""
+    status, page = list_services(cur, params)
+    if status != 200:
+        return status, page
+    missing = [name for name in BOOTSTRAP_DIRECTORIES if directories[name] is None]
+    if missing:
+        directories = dict(directories, **reload_directories(cur, missing, versions))
+    return 200, {
+        'services': page['items'],
+        'nextCursor': page['nextCursor'],
+        'catalog': directories['catalog']['items'],
+        'applicants': directories['applicants']['items'],
+        'tags': directories['tags']['items'],
+    }
+
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_CONCURRENCY = 2
+UPLOAD_FILE_TYPES = {
+    'draft': ('contract_draft_url', 'contract_draft_sha256'),
+    'final': ('contract_final_url', 'contract_final_sha256'),
+}
+BLOBS_TABLE = 't_p54371197_task_manager_creatio.blobs'
+BLOB_RETURNING = "sha256, s3_key, cdn_url, file_size, content_type"
+
+class Base64Stream:
+    """Файловый объект поверх тела запроса: декодирует base64 кусками, считает размер и sha256"""
+
+    def __init__(self, data, encoded=True):
+        self.data = data if encoded or isinstance(data, bytes) else data.encode()
+        self.encoded = encoded
+        self.pos = 0
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def rewind(self):
+        self.pos = 0
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.data)
+        step = (size + 2) // 3 * 4 if self.encoded else size
+        chunk = self.data[self.pos:self.pos + step]
+        self.pos += step
+        if self.encoded:
+            chunk = base64.b64decode(chunk)
+        self.size += len(chunk)
+        self.sha256.update(chunk)
+        return chunk
+
+def content_sha256(stream):
+    """Первый проход по телу: sha256 и размер без записи в хранилище, затем поток перематывается"""
+    while stream.read(UPLOAD_CHUNK_SIZE):
+        pass
+    digest, size = stream.sha256.hexdigest(), stream.size
+    stream.rewind()
+    return digest, size
+
+FILE_EXT_RE = re.compile(r'^\.[0-9a-z]{1,10}$')
+
+def file_ext(file_name):
+    ext = os.path.splitext(file_name)[1].lower()
+    return ext if FILE_EXT_RE.match(ext) else ''
+
+def content_disposition(file_name):
+    """Content-Disposition с исходным именем файла (RFC 5987), чтобы при скачивании оно не терялось"""
+    return "inline; filename*=UTF-8''%s" % urllib.parse.quote(file_name, safe='')
+
+def acquire_blob(cur, sha256):
+    """Добавляет ссылку на уже сохранённый блоб; None — такого содержимого ещё нет"""
+    cur.execute(
+        "UPDATE %s SET ref_count = ref_count + 1, unreferenced_at = NULL "
+        "WHERE sha256 = %%s RETURNING %s" % (BLOBS_TABLE, BLOB_RETURNING),
+        (sha256,)
+    )
+    return cur.fetchone()
+
+def register_blob(cur, sha256, s3_key, file_size, content_type):
+    cur.execute(
+        "INSERT INTO %s AS b (sha256, s3_key, cdn_url, file_size, content_type, ref_count) "
+        "VALUES (%%s, %%s, %%s, %%s, %%s, 1) "
+        "ON CONFLICT (sha256) DO UPDATE SET ref_count = b.ref_count + 1, unreferenced_at = NULL "
+        "RETURNING %s" % (BLOBS_TABLE, BLOB_RETURNING),
+        (sha256, s3_key, cdn_url(s3_key), file_size, content_type)
+    )
+    return cur.fetchone()
+
+def release_blob(cur, sha256):
+    cur.execute(
+        "UPDATE %s SET ref_count = ref_count - 1, "
+        "unreferenced_at = CASE WHEN ref_count <= 1 THEN NOW() ELSE unreferenced_at END "
+        "WHERE sha256 = %%s" % BLOBS_TABLE,
+        (sha256,)
+    )
+
+def upload_contract(conn, cur, event, params):
+    """Загрузка договора: сырое тело (или JSON с base64) потоком в хранилище кусками по 8 МБ"""
+    from boto3.s3.transfer import TransferConfig
+    headers = event.get('headers') or {}
+    if params.get('serviceId'):
+        # сырое тело: метаданные в query, тип файла — в Content-Type (в том числе application/json)
+        meta = params
+        stream = Base64Stream(event.get('body') or '', bool(event.get('isBase64Encoded')))
+        content_type = (params.get('contentType') or headers.get('Content-Type')
+                        or headers.get('content-type') or 'application/octet-stream')
+    else:
+        try:
+            body = json.loads(event.get('body') or '{}')
+        except ValueError:
+            return 400, {'error': 'serviceId query parameter or JSON body required'}
+        meta = body
+        stream = Base64Stream(body.get('fileData', ''))
+        content_type = body.get('contentType') or 'application/octet-stream'
+
+    try:
+        service_id = int(meta.get('serviceId') or 0)
+    except (TypeError, ValueError):
+        return 400, {'error': 'Invalid serviceId'}
+    fields = UPLOAD_FILE_TYPES.get(meta.get('fileType') or 'draft')
+    if not service_id or not fields:
+        return 400, {'error': 'serviceId and fileType required'}
+    url_field, sha_field = fields
+
+    cur.execute("SELECT %s AS old_sha256 FROM paid_services WHERE id=%%s FOR UPDATE" % sha_field, (service_id,))
+    service = cur.fetchone()
+    if not service:
+        return 404, {'error': 'Not found'}
+
+    sha256, size = content_sha256(stream)
+    blob = acquire_blob(cur, sha256)
+    if not blob:
+        file_name = meta.get('fileName') or 'contract'
+        s3_key = "blobs/%s/%s-%s%s" % (sha256[:2], sha256, os.urandom(16).hex(), file_ext(file_name))
+        get_s3().upload_fileobj(
+            stream, S3_BUCKET, s3_key,
+            ExtraArgs={'ContentType': content_type, 'ContentDisposition': content_disposition(file_name)},
+            Config=TransferConfig(
+                multipart_threshold=UPLOAD_CHUNK_SIZE,
+                multipart_chunksize=UPLOAD_CHUNK_SIZE,
+                max_concurrency=UPLOAD_MAX_CONCURRENCY,
+            )
+        )
+        blob = register_blob(cur, sha256, s3_key, size, content_type)
+        if blob['s3_key'] != s3_key:
+            # параллельная загрузка того же содержимого успела зарегистрироваться первой
+            get_s3().delete_object(Bucket=S3_BUCKET, Key=s3_key)
+    cur.execute(
+        "UPDATE paid_services SET %s=%%s, %s=%%s, updated_at=NOW() WHERE id=%%s" % (url_field, sha_field),
+        (blob['cdn_url'], sha256, service_id)
+    )
+    if service['old_sha256']:
+        release_blob(cur, service['old_sha256'])
+    conn.commit()
+    return 200, {'url': blob['cdn_url'], 'size': size, 'sha256': sha256}
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1400'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+def dumps(payload):
+    """JSON-тело ответа: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False)
+
+def accepted_encoding(event):
+    headers = event.get('headers') or {}
+    accept = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    offered = set()
+    for part in accept.lower().split(','):
+        name, _, q = part.partition(';')
+        q = q.replace(' ', '')
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        offered.add(name.strip())
+    if brotli is not None and 'br' in offered:
+        return 'br'
+    if 'gzip' in offered or '*' in offered:
+        return 'gzip'
+    return None
+
+def compress_response(event, response):
+    """Сжимает крупное тело ответа (br/gzip по Accept-Encoding) и отдаёт его в base64 для шлюза"""
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return response
+    raw = body.encode()
+    if encoding == 'br':
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    headers = dict(response.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return dict(response, headers=headers, body=base64.b64encode(data).decode(), isBase64Encoded=True)
+
+def compressed(handler):
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        return compress_response(event, handler(event, context))
+    return wrapper
+
+@compressed
 def handler(event: dict, context) -> dict:
     """API для модуля платных услуг: услуги, справочник, заявители, теги, загрузка файлов."""
     if event.get('httpMethod') == 'OPTIONS':
@@ -123,7 +719,7 @@ def handler(event: dict, context) -> dict:
 
     user_id = get_user(event)
     if not user_id:
-        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Unauthorized'})}
+        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Unauthorized'})}
 
     method = event.get('httpMethod', 'GET')
     path = event.get('path', '/')
@@ -133,6 +729,12 @@ def handler(event: dict, context) -> dict:
     res_id = parts[2] if len(parts) >= 3 else None
     params = event.get('queryStringParameters') or {}
 
+    if method == 'GET' and resource in DIRECTORIES and not res_id:
+        entry = directory_cache_get(resource)
+        if entry:
+            return directory_response(event, entry)
+
+    import psycopg2.extras
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
@@ -140,21 +742,21 @@ def handler(event: dict, context) -> dict:
         # ── TAGS ────────────────────────────────────────────────────────────────
         if resource == 'tags':
             if method == 'GET':
-                cur.execute("SELECT id, name FROM service_tags ORDER BY id")
-                return {'statusCode': 200, 'headers': CORS_HEADERS,
-                        'body': json.dumps([tag_row(r) for r in cur.fetchall()])}
+                return directory_response(event, load_directory(cur, 'tags'))
             if method == 'POST':
                 body = json.loads(event.get('body') or '{}')
                 name = body.get('name', '').strip()
                 if not name:
-                    return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'name required'})}
+                    return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': dumps({'error': 'name required'})}
                 cur.execute("INSERT INTO service_tags (name) VALUES (%s) ON CONFLICT (name) DO UPDATE SET name=EXCLUDED.name RETURNING id, name", (name,))
                 conn.commit()
-                return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps(tag_row(cur.fetchone()))}
+                directory_cache_invalidate('tags')
+                return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps(tag_row(cur.fetchone()))}
             if method == 'DELETE' and res_id:
                 cur.execute("DELETE FROM service_tags WHERE id=%s", (res_id,))
                 conn.commit()
-                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+                directory_cache_invalidate('tags')
+                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
 
         # ── APPLICANTS ───────────────────────────────────────────────────────────
         if resource == 'applicants':
@@ -163,11 +765,9 @@ def handler(event: dict, context) -> dict:
                     cur.execute("SELECT * FROM applicants WHERE id=%s", (res_id,))
                     r = cur.fetchone()
                     if not r:
-                        return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-                    return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(applicant_row(r))}
-                cur.execute("SELECT * FROM applicants ORDER BY name")
-                return {'statusCode': 200, 'headers': CORS_HEADERS,
-                        'body': json.dumps([applicant_row(r) for r in cur.fetchall()])}
+                        return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+                    return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(applicant_row(r))}
+                return directory_response(event, load_directory(cur, 'applicants'))
             if method == 'POST':
                 body = json.loads(event.get('body') or '{}')
                 cur.execute(
@@ -175,22 +775,25 @@ def handler(event: dict, context) -> dict:
                     (body.get('name',''), body.get('address',''), body.get('inn',''), body.get('contact',''))
                 )
                 conn.commit()
-                return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps(applicant_row(cur.fetchone()))}
+                directory_cache_invalidate('applicants')
+                return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps(applicant_row(cur.fetchone()))}
             if method == 'PUT' and res_id:
                 body = json.loads(event.get('body') or '{}')
                 cur.execute(
-                    "UPDATE applicants SET name=%s, address=%s, inn=%s, contact=%s WHERE id=%s RETURNING *",
+                    "UPDATE applicants SET name=%s, address=%s, inn=%s, contact=%s, updated_at=NOW() WHERE id=%s RETURNING *",
                     (body.get('name',''), body.get('address',''), body.get('inn',''), body.get('contact',''), res_id)
                 )
                 conn.commit()
+                directory_cache_invalidate('applicants')
                 r = cur.fetchone()
                 if not r:
-                    return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(applicant_row(r))}
+                    return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(applicant_row(r))}
             if method == 'DELETE' and res_id:
                 cur.execute("DELETE FROM applicants WHERE id=%s", (res_id,))
                 conn.commit()
-                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+                directory_cache_invalidate('applicants')
+                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
 
         # ── SERVICE CATALOG ──────────────────────────────────────────────────────
         if resource == 'catalog':
@@ -199,11 +802,9 @@ def handler(event: dict, context) -> dict:
                     cur.execute("SELECT * FROM service_catalog WHERE id=%s", (res_id,))
                     r = cur.fetchone()
                     if not r:
-                        return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-                    return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(catalog_row(r))}
-                cur.execute("SELECT * FROM service_catalog ORDER BY name")
-                return {'statusCode': 200, 'headers': CORS_HEADERS,
-                        'body': json.dumps([catalog_row(r) for r in cur.fetchall()])}
+                        return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+                    return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(catalog_row(r))}
+                return directory_response(event, load_directory(cur, 'catalog'))
             if method == 'POST':
                 body = json.loads(event.get('body') or '{}')
                 cur.execute(
@@ -214,48 +815,53 @@ def handler(event: dict, context) -> dict:
                      float(body.get('hourlyRate', 1420)))
                 )
                 conn.commit()
-                return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps(catalog_row(cur.fetchone()))}
+                directory_cache_invalidate('catalog')
+                return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps(catalog_row(cur.fetchone()))}
             if method == 'PUT' and res_id:
                 body = json.loads(event.get('body') or '{}')
                 cur.execute(
-                    "UPDATE service_catalog SET name=%s, description=%s, is_fixed_price=%s, fixed_price=%s, hourly_rate=%s WHERE id=%s RETURNING *",
+                    "UPDATE service_catalog SET name=%s, description=%s, is_fixed_price=%s, fixed_price=%s, hourly_rate=%s, updated_at=NOW() WHERE id=%s RETURNING *",
                     (body.get('name',''), body.get('description',''),
                      bool(body.get('isFixedPrice', False)),
                      body.get('fixedPrice') or None,
                      float(body.get('hourlyRate', 1420)), res_id)
                 )
                 conn.commit()
+                directory_cache_invalidate('catalog')
                 r = cur.fetchone()
                 if not r:
-                    return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(catalog_row(r))}
+                    return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(catalog_row(r))}
             if method == 'DELETE' and res_id:
                 cur.execute("DELETE FROM service_catalog WHERE id=%s", (res_id,))
                 conn.commit()
-                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+                directory_cache_invalidate('catalog')
+                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
+
+        # ── SUMMARY: итоги и выручка, агрегаты в SQL ───────────────────────────────
+        if resource == 'summary' and method == 'GET':
+            etag, last_modified = summary_version(cur, params)
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+            status, payload = services_summary(cur, params)
+            return {'statusCode': status, 'headers': headers if status == 200 else CORS_HEADERS,
+                    'body': dumps(payload)}
+
+        # ── BOOTSTRAP: услуги + справочники одним запросом ───────────────────────
+        if resource == 'bootstrap' and method == 'GET':
+            etag, last_modified, directories, versions = bootstrap_version(cur, params)
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+            status, payload = bootstrap(cur, params, directories, versions)
+            return {'statusCode': status, 'headers': headers if status == 200 else CORS_HEADERS,
+                    'body': dumps(payload)}
 
         # ── FILE UPLOAD for paid_services ────────────────────────────────────────
         if resource == 'upload' and method == 'POST':
-            body = json.loads(event.get('body') or '{}')
-            service_id = body.get('serviceId', '')
-            file_type = body.get('fileType', 'draft')  # 'draft' | 'final'
-            file_name = body.get('fileName', 'file')
-            content_type = body.get('contentType', 'application/octet-stream')
-            file_data_b64 = body.get('fileData', '')
-            file_bytes = base64.b64decode(file_data_b64)
-            file_id = str(uuid.uuid4())[:12]
-            safe_name = file_name.replace("'", "").replace("/", "_").replace("\\", "_")
-            s3_key = "paid-services/%s/%s_%s" % (service_id, file_id, safe_name)
-            s3 = get_s3()
-            s3.put_object(Bucket='files', Key=s3_key, Body=file_bytes, ContentType=content_type)
-            url = cdn_url(s3_key)
-            field = 'contract_draft_url' if file_type == 'draft' else 'contract_final_url'
-            cur.execute(
-                "UPDATE paid_services SET %s=%%s, updated_at=NOW() WHERE id=%%s RETURNING id" % field,
-                (url, service_id)
-            )
-            conn.commit()
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'url': url})}
+            status, payload = upload_contract(conn, cur, event, params)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
 
         # ── PAID SERVICES (default resource) ─────────────────────────────────────
         if method == 'GET':
@@ -263,23 +869,24 @@ def handler(event: dict, context) -> dict:
                 cur.execute("SELECT * FROM paid_services WHERE id=%s", (res_id,))
                 r = cur.fetchone()
                 if not r:
-                    return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(service_row(r))}
+                    return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(service_row(r))}
             # list with optional filters
-            date_from = params.get('date_from', '')
-            date_to = params.get('date_to', '')
-            status_filter = params.get('status', '')
-            wheres = []
-            if date_from:
-                wheres.append("service_date >= '%s'" % date_from.replace("'", ""))
-            if date_to:
-                wheres.append("service_date <= '%s'" % date_to.replace("'", ""))
-            if status_filter:
-                wheres.append("status = '%s'" % status_filter.replace("'", ""))
+            etag, last_modified = list_version(
+                cur, "SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM paid_services", None, params
+            )
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+            if params.get('limit') or params.get('cursor'):
+                status, payload = list_services(cur, params)
+                return {'statusCode': status, 'headers': headers if status == 200 else CORS_HEADERS,
+                        'body': dumps(payload)}
+            wheres, args = service_filters(params)
             where_sql = ('WHERE ' + ' AND '.join(wheres)) if wheres else ''
-            cur.execute("SELECT * FROM paid_services %s ORDER BY created_at DESC" % where_sql)
-            return {'statusCode': 200, 'headers': CORS_HEADERS,
-                    'body': json.dumps([service_row(r) for r in cur.fetchall()])}
+            cur.execute("SELECT * FROM paid_services %s ORDER BY created_at DESC" % where_sql, args)
+            return {'statusCode': 200, 'headers': headers,
+                    'body': dumps([service_row(r) for r in cur.fetchall()])}
 
         if method == 'POST':
             body = json.loads(event.get('body') or '{}')
@@ -306,7 +913,7 @@ def handler(event: dict, context) -> dict:
                  body.get('serviceDate') or None)
             )
             conn.commit()
-            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps(service_row(cur.fetchone()))}
+            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps(service_row(cur.fetchone()))}
 
         if method == 'PUT' and res_id:
             body = json.loads(event.get('body') or '{}')
@@ -336,16 +943,23 @@ def handler(event: dict, context) -> dict:
             conn.commit()
             r = cur.fetchone()
             if not r:
-                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(service_row(r))}
+                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(service_row(r))}
 
         if method == 'DELETE' and res_id:
-            cur.execute("DELETE FROM paid_services WHERE id=%s", (res_id,))
+            cur.execute(
+                "DELETE FROM paid_services WHERE id=%s RETURNING contract_draft_sha256, contract_final_sha256",
+                (res_id,)
+            )
+            r = cur.fetchone()
+            for sha256 in (r['contract_draft_sha256'], r['contract_final_sha256']) if r else ():
+                if sha256:
+                    release_blob(cur, sha256)
             conn.commit()
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
 
-        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Method not allowed'})}
+        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Method not allowed'})}
 
     finally:
         cur.close()
-        conn.close()
+        put_conn(conn)
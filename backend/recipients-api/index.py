@@ -1,10 +1,28 @@
 import json
 import os
+import datetime
+import email.utils
+import html
 import hashlib
 import hmac
 import time
-import psycopg2
-import psycopg2.extras
+import threading
+import uuid
+import random
+import collections
+import base64
+import functools
+import gzip
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 SCHEMA = 't_p54371197_task_manager_creatio'
 
@@ -13,6 +31,7 @@ CORS_HEADERS = {
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
     'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization',
     'Access-Control-Max-Age': '86400',
+    'Access-Control-Expose-Headers': 'ETag, Last-Modified',
     'Content-Type': 'application/json'
 }
 
@@ -24,17 +43,40 @@ def get_secret():
         SECRET = os.environ.get('AUTH_SECRET', 'task-manager-secret-2024')
     return SECRET
 
+TOKEN_TTL = 30 * 24 * 3600
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '512'))
+
+_TOKEN_CACHE = collections.OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 def verify_token(token):
+    """Проверяет подпись и срок токена; проверенные токены кешируются в контейнере до истечения срока"""
+    now = time.time()
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+        if cached:
+            if cached[1] > now:
+                _TOKEN_CACHE.move_to_end(token)
+                return cached[0]
+            del _TOKEN_CACHE[token]
     parts = token.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         return None
-    user_id, ts, sig = parts
-    payload = user_id + ":" + ts
+    user_id, ts, sig = parts[0], parts[1], parts[-1]
+    payload = token[:-len(sig) - 1]
     expected = hmac.new(get_secret().encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
     if not hmac.compare_digest(sig, expected):
         return None
-    if int(time.time()) - int(ts) > 30 * 24 * 3600:
+    try:
+        expires = int(ts) + TOKEN_TTL
+    except ValueError:
+        return None
+    if expires <= now:
         return None
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = (user_id, expires)
+        while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+            _TOKEN_CACHE.popitem(last=False)
     return user_id
 
 def get_user_id(event):
@@ -45,9 +87,67 @@ def get_user_id(event):
         return verify_token(auth[7:])
     return None
 
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECK_AFTER = int(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+_POOL = []
+_POOL_LOCK = threading.Lock()
+
+def _close_quietly(conn):
+    import psycopg2
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def _is_alive(conn):
+    import psycopg2
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_conn():
+    """Берёт соединение из пула тёплого контейнера или открывает новое"""
+    import psycopg2
+    now = time.time()
+    while True:
+        with _POOL_LOCK:
+            if not _POOL:
+                break
+            conn, last_used = _POOL.pop()
+        idle = now - last_used
+        if conn.closed or idle > DB_POOL_IDLE_TIMEOUT:
+            _close_quietly(conn)
+            continue
+        if idle > DB_POOL_CHECK_AFTER and not _is_alive(conn):
+            _close_quietly(conn)
+            continue
+        return conn
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
+def put_conn(conn):
+    """Возвращает соединение в пул; сломанные и лишние закрываются"""
+    import psycopg2
+    if conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _close_quietly(conn)
+        return
+    with _POOL_LOCK:
+        if len(_POOL) < DB_POOL_MAX_SIZE:
+            _POOL.append((conn, time.time()))
+            return
+    _close_quietly(conn)
+
 def row_to_recipient(r):
     emails = r.get('emails') or []
     if isinstance(emails, str):
@@ -66,6 +166,226 @@ def emails_to_pg_array(emails):
     safe = [e.replace("'", "''").replace('"', '') for e in emails if e.strip()]
     return "ARRAY[%s]::TEXT[]" % ','.join("'%s'" % e for e in safe) if safe else "ARRAY[]::TEXT[]"
 
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_HEADLINE = 'StartSel=\x02, StopSel=\x03, HighlightAll=true'
+
+SEARCH_SQL = """
+WITH q AS (
+    SELECT websearch_to_tsquery('russian', %(q)s) || websearch_to_tsquery('simple', %(q)s) AS query,
+           lower(%(q)s) AS term
+), hits AS (
+    SELECT r.id, r.full_name, r.organization, r.position, r.address, r.emails, r.created_at,
+           GREATEST(ts_rank_cd(r.search_vector, q.query), word_similarity(q.term, lower(r.full_name))) AS rank
+    FROM {schema}.recipients r, q
+    WHERE r.user_id = %(user_id)s
+      AND (r.search_vector @@ q.query
+           OR lower(r.full_name) LIKE %(prefix)s
+           OR q.term <%% lower(r.full_name))
+    ORDER BY rank DESC, r.full_name ASC, r.id ASC
+    LIMIT %(limit)s OFFSET %(offset)s
+)
+SELECT hits.*,
+       ts_headline('russian', hits.full_name, q.query, %(headline)s) AS full_name_hl,
+       ts_headline('russian', hits.organization || ' ' || hits.position, q.query, %(headline)s) AS details_hl
+FROM hits, q
+ORDER BY hits.rank DESC, hits.full_name ASC, hits.id ASC
+"""
+
+def highlight(text):
+    """Экранирует текст ts_headline и превращает маркеры совпадений в <mark>"""
+    return html.escape(text or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def search_recipients(cur, user_id, params):
+    """Поиск адресатов: полнотекстовый по ФИО, организации, должности, email и нечёткий по началу ФИО"""
+    query = (params.get('q') or '').strip()
+    if not query:
+        return 400, {'error': 'q required'}
+    try:
+        limit = int(params.get('limit') or SEARCH_DEFAULT_LIMIT)
+        offset = int(params.get('offset') or 0)
+    except ValueError:
+        return 400, {'error': 'Invalid limit or offset'}
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+
+    prefix = query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    cur.execute(SEARCH_SQL.format(schema=SCHEMA), {
+        'q': query, 'prefix': prefix, 'user_id': user_id,
+        'limit': limit + 1, 'offset': offset, 'headline': SEARCH_HEADLINE,
+    })
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    items = []
+    for r in rows[:limit]:
+        item = row_to_recipient(r)
+        item['rank'] = float(r['rank'])
+        item['highlight'] = {'fullName': highlight(r['full_name_hl']), 'details': highlight(r['details_hl'])}
+        items.append(item)
+    return 200, {'items': items, 'nextOffset': offset + limit if has_more else None}
+
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 1000
+SYNC_LAG_SECONDS = 5
+SYNC_TOMBSTONE_DAYS = 30
+SYNC_PRUNE_CHANCE = 0.01
+SYNC_MIN_ID = '00000000-0000-0000-0000-000000000000'
+
+def prune_tombstones(cur):
+    cur.execute(
+        "DELETE FROM %s.sync_tombstones WHERE deleted_at < NOW() - make_interval(days => %%s)" % SCHEMA,
+        (SYNC_TOMBSTONE_DAYS,)
+    )
+
+def encode_sync_cursor(ts, row_id):
+    raw = "%s|%s" % (ts.isoformat(), row_id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_sync_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.split('|', 1)
+        ts = datetime.datetime.fromisoformat(ts)
+        if ts.tzinfo is None:
+            return None
+        return ts, str(uuid.UUID(row_id))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def sync_recipients(cur, user_id, params):
+    """Дельта после курсора since: новые и изменённые адресаты и id удалённых (tombstones)"""
+    try:
+        limit = int(params.get('limit') or SYNC_DEFAULT_LIMIT)
+    except ValueError:
+        return 400, {'error': 'Invalid limit'}
+    limit = max(1, min(limit, SYNC_MAX_LIMIT))
+
+    cur.execute(
+        "SELECT NOW() - make_interval(secs => %s) AS horizon, NOW() - make_interval(days => %s) AS oldest",
+        (SYNC_LAG_SECONDS, SYNC_TOMBSTONE_DAYS)
+    )
+    bounds = cur.fetchone()
+    initial = not params.get('since')
+    if initial:
+        position = (datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc), SYNC_MIN_ID)
+    else:
+        position = decode_sync_cursor(params['since'])
+        if not position:
+            return 400, {'error': 'Invalid cursor'}
+        if position[0] < bounds['oldest']:
+            return 410, {'error': 'Cursor expired, full reload required'}
+
+    cur.execute(
+        "SELECT id, full_name, organization, position, address, emails, created_at, updated_at "
+        "FROM %s.recipients "
+        "WHERE user_id = %%s AND (updated_at, id) > (%%s, %%s::uuid) AND updated_at <= %%s "
+        "ORDER BY updated_at, id LIMIT %d"
+        % (SCHEMA, limit + 1),
+        (user_id, position[0], position[1], bounds['horizon'])
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    upper = rows[-1]['updated_at'] if has_more else bounds['horizon']
+    deleted = []
+    if not initial:
+        cur.execute(
+            "SELECT DISTINCT record_id FROM %s.sync_tombstones "
+            "WHERE user_id = %%s AND resource = %%s AND deleted_at > %%s AND deleted_at <= %%s" % SCHEMA,
+            (user_id, 'recipients', position[0], upper)
+        )
+        deleted = [r['record_id'] for r in cur.fetchall()]
+    return 200, {
+        'items': [row_to_recipient(r) for r in rows],
+        'deleted': deleted,
+        'nextCursor': encode_sync_cursor(rows[-1]['updated_at'], rows[-1]['id']) if has_more
+        else encode_sync_cursor(bounds['horizon'], SYNC_MIN_ID),
+        'hasMore': has_more,
+    }
+
+def list_version(cur, sql, args, params):
+    """ETag и Last-Modified списка по числу строк и max(updated_at) — без выборки самих строк"""
+    cur.execute(sql, args)
+    r = cur.fetchone()
+    last_modified = r['last_modified']
+    raw = "%s|%s|%s" % (
+        r['total'],
+        last_modified.isoformat() if last_modified else '',
+        json.dumps(params or {}, sort_keys=True),
+    )
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:24], last_modified
+
+def cache_headers(etag, last_modified):
+    headers = dict(CORS_HEADERS, ETag=etag)
+    headers['Cache-Control'] = 'private, no-cache'
+    if last_modified:
+        headers['Last-Modified'] = email.utils.format_datetime(
+            last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(event, etag):
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1400'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+def dumps(payload):
+    """JSON-тело ответа: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False)
+
+def accepted_encoding(event):
+    headers = event.get('headers') or {}
+    accept = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    offered = set()
+    for part in accept.lower().split(','):
+        name, _, q = part.partition(';')
+        q = q.replace(' ', '')
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        offered.add(name.strip())
+    if brotli is not None and 'br' in offered:
+        return 'br'
+    if 'gzip' in offered or '*' in offered:
+        return 'gzip'
+    return None
+
+def compress_response(event, response):
+    """Сжимает крупное тело ответа (br/gzip по Accept-Encoding) и отдаёт его в base64 для шлюза"""
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return response
+    raw = body.encode()
+    if encoding == 'br':
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    headers = dict(response.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return dict(response, headers=headers, body=base64.b64encode(data).decode(), isBase64Encoded=True)
+
+def compressed(handler):
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        return compress_response(event, handler(event, context))
+    return wrapper
+
+@compressed
 def handler(event, context):
     """API для справочника адресатов: ФИО, организация, должность, адрес, несколько email"""
     if event.get('httpMethod') == 'OPTIONS':
@@ -73,11 +393,12 @@ def handler(event, context):
 
     user_id = get_user_id(event)
     if not user_id:
-        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Unauthorized'})}
+        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Unauthorized'})}
 
     method = event.get('httpMethod', 'GET')
     params = event.get('queryStringParameters') or {}
 
+    import psycopg2.extras
     conn = get_conn()
     conn.autocommit = True
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
@@ -85,14 +406,32 @@ def handler(event, context):
     try:
         uid = user_id.replace("'", "")
 
-        if method == 'GET':
+        if method == 'GET' and 'q' in params:
+            status, payload = search_recipients(cur, user_id, params)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
+        elif method == 'GET' and 'since' in params:
+            status, payload = sync_recipients(cur, user_id, params)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
+        elif method == 'GET':
+            etag, last_modified = list_version(
+                cur,
+                "SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified "
+                "FROM %s.recipients WHERE user_id = '%s'" % (SCHEMA, uid),
+                None, params
+            )
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+
             cur.execute(
                 "SELECT id, full_name, organization, position, address, emails, created_at "
                 "FROM %s.recipients WHERE user_id = '%s' ORDER BY full_name ASC"
                 % (SCHEMA, uid)
             )
             rows = cur.fetchall()
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps([row_to_recipient(r) for r in rows])}
+            return {'statusCode': 200, 'headers': headers, 'body': dumps([row_to_recipient(r) for r in rows])}
 
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
@@ -105,7 +444,7 @@ def handler(event, context):
                 emails = [emails] if emails else []
 
             if not full_name:
-                return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'fullName required'})}
+                return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': dumps({'error': 'fullName required'})}
 
             emails_sql = emails_to_pg_array(emails)
             cur.execute(
@@ -115,7 +454,7 @@ def handler(event, context):
                 % (SCHEMA, uid, full_name, organization, position, address, emails_sql)
             )
             r = cur.fetchone()
-            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps(row_to_recipient(r))}
+            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps(row_to_recipient(r))}
 
         elif method == 'PUT':
             body = json.loads(event.get('body', '{}'))
@@ -142,18 +481,22 @@ def handler(event, context):
             )
             r = cur.fetchone()
             if not r:
-                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(row_to_recipient(r))}
+                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(row_to_recipient(r))}
 
         elif method == 'DELETE':
             rec_id = params.get('id', '').replace("'", "")
             cur.execute(
-                "DELETE FROM %s.recipients WHERE id = '%s' AND user_id = '%s'"
-                % (SCHEMA, rec_id, uid)
+                "WITH gone AS (DELETE FROM %s.recipients WHERE id = '%s' AND user_id = '%s' RETURNING id, user_id) "
+                "INSERT INTO %s.sync_tombstones (user_id, resource, record_id) "
+                "SELECT user_id, 'recipients', id::text FROM gone"
+                % (SCHEMA, rec_id, uid, SCHEMA)
             )
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+            if random.random() < SYNC_PRUNE_CHANCE:
+                prune_tombstones(cur)
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
 
-        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Method not allowed'})}
+        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Method not allowed'})}
     finally:
         cur.close()
-        conn.close()
+        put_conn(conn)
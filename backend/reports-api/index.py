@@ -1,15 +1,37 @@
 import json
 import os
+import re
+import base64
+import csv
+import gzip
+import io
+import tempfile
+import uuid
+import datetime
+import email.utils
 import hmac
 import hashlib
-import psycopg2  # noqa
-import psycopg2.extras
+import time
+import threading
+import collections
+import functools
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, PATCH, DELETE, OPTIONS',
     'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization',
     'Access-Control-Max-Age': '86400',
+    'Access-Control-Expose-Headers': 'ETag, Last-Modified',
     'Content-Type': 'application/json'
 }
 
@@ -21,15 +43,41 @@ def get_secret():
         SECRET = os.environ.get('AUTH_SECRET', 'task-manager-secret-2024')
     return SECRET
 
+TOKEN_TTL = 30 * 24 * 3600
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '512'))
+
+_TOKEN_CACHE = collections.OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 def verify_token(token):
+    """Проверяет подпись и срок токена; проверенные токены кешируются в контейнере до истечения срока"""
+    now = time.time()
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+        if cached:
+            if cached[1] > now:
+                _TOKEN_CACHE.move_to_end(token)
+                return cached[0]
+            del _TOKEN_CACHE[token]
     parts = token.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         return None
-    user_id, ts, sig = parts
-    expected = hmac.new(get_secret().encode(), f"{user_id}:{ts}".encode(), hashlib.sha256).hexdigest()
-    if hmac.compare_digest(expected, sig):
-        return user_id
-    return None
+    user_id, ts, sig = parts[0], parts[1], parts[-1]
+    payload = token[:-len(sig) - 1]
+    expected = hmac.new(get_secret().encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
+    if not hmac.compare_digest(sig, expected):
+        return None
+    try:
+        expires = int(ts) + TOKEN_TTL
+    except ValueError:
+        return None
+    if expires <= now:
+        return None
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = (user_id, expires)
+        while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+            _TOKEN_CACHE.popitem(last=False)
+    return user_id
 
 def get_user(event):
     auth = event.get('headers', {}).get('X-Authorization', '')
@@ -37,9 +85,486 @@ def get_user(event):
         return verify_token(auth[7:])
     return None
 
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECK_AFTER = int(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+_POOL = []
+_POOL_LOCK = threading.Lock()
+
+def _close_quietly(conn):
+    import psycopg2
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def _is_alive(conn):
+    import psycopg2
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_conn():
+    """Берёт соединение из пула тёплого контейнера или открывает новое"""
+    import psycopg2
+    now = time.time()
+    while True:
+        with _POOL_LOCK:
+            if not _POOL:
+                break
+            conn, last_used = _POOL.pop()
+        idle = now - last_used
+        if conn.closed or idle > DB_POOL_IDLE_TIMEOUT:
+            _close_quietly(conn)
+            continue
+        if idle > DB_POOL_CHECK_AFTER and not _is_alive(conn):
+            _close_quietly(conn)
+            continue
+        return conn
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
+def put_conn(conn):
+    """Возвращает соединение в пул; сломанные и лишние закрываются"""
+    import psycopg2
+    if conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _close_quietly(conn)
+        return
+    with _POOL_LOCK:
+        if len(_POOL) < DB_POOL_MAX_SIZE:
+            _POOL.append((conn, time.time()))
+            return
+    _close_quietly(conn)
+
+def list_version(cur, sql, args, params):
+    """ETag и Last-Modified списка по числу строк и max(updated_at) — без выборки самих строк"""
+    cur.execute(sql, args)
+    r = cur.fetchone()
+    last_modified = r['last_modified']
+    raw = "%s|%s|%s" % (
+        r['total'],
+        last_modified.isoformat() if last_modified else '',
+        json.dumps(params or {}, sort_keys=True),
+    )
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:24], last_modified
+
+def cache_headers(etag, last_modified):
+    headers = dict(CORS_HEADERS, ETag=etag)
+    headers['Cache-Control'] = 'private, no-cache'
+    if last_modified:
+        headers['Last-Modified'] = email.utils.format_datetime(
+            last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(event, etag):
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+
+TREE_PAGE_LIMIT = 100
+
+def bump_period(cur, year, month, delta):
+    """Поддерживает сводку report_periods: счётчик отчётов за месяц и время последнего изменения"""
+    cur.execute("""
+        INSERT INTO report_periods (report_year, report_month, reports_count)
+        VALUES (%s, %s, GREATEST(%s, 0))
+        ON CONFLICT (report_year, report_month) DO UPDATE
+        SET reports_count = GREATEST(report_periods.reports_count + %s, 0), updated_at = NOW()
+    """, (year, month, delta, delta))
+
+def encode_cursor(r):
+    raw = "%s|%s" % (r['id'], r['employee_name'] or '')
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        report_id, employee_name = raw.split('|', 1)
+        return employee_name, int(report_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def parse_period(params):
+    """Год и месяц из query-параметров (None, если не заданы); ValueError — не число или вне диапазона"""
+    year = int(params['year']) if params.get('year') else None
+    month = int(params['month']) if params.get('month') else None
+    if (year is not None and not 1 <= year <= 9999) or (month is not None and not 1 <= month <= 12):
+        raise ValueError('Invalid period')
+    return year, month
+
+def archive_tree(cur, params, year, month):
+    """Ленивое дерево архива: годы → месяцы → отчёты месяца (постранично)"""
+    if not year:
+        cur.execute("""
+            SELECT report_year, COUNT(*) AS months, SUM(reports_count) AS reports, MAX(updated_at) AS updated_at
+            FROM report_periods WHERE reports_count > 0
+            GROUP BY report_year ORDER BY report_year DESC
+        """)
+        return 200, [{
+            'year': r['report_year'],
+            'months': r['months'],
+            'reports': int(r['reports']),
+            'updated_at': r['updated_at'].isoformat() if r['updated_at'] else None,
+        } for r in cur.fetchall()]
+
+    if not month:
+        cur.execute("""
+            SELECT report_month, reports_count, updated_at FROM report_periods
+            WHERE report_year = %s AND reports_count > 0 ORDER BY report_month DESC
+        """, (year,))
+        return 200, [{
+            'month': f"{r['report_month']:02d}",
+            'reports': r['reports_count'],
+            'updated_at': r['updated_at'].isoformat() if r['updated_at'] else None,
+        } for r in cur.fetchall()]
+
+    try:
+        limit = max(1, min(int(params.get('limit') or TREE_PAGE_LIMIT), TREE_PAGE_LIMIT))
+    except ValueError:
+        return 400, {'error': 'Invalid limit'}
+    wheres = ["report_year = %s", "report_month = %s"]
+    args = [year, month]
+    if params.get('cursor'):
+        position = decode_cursor(params['cursor'])
+        if not position:
+            return 400, {'error': 'Invalid cursor'}
+        wheres.append("(employee_name, id) > (%s, %s)")
+        args.extend(position)
+    cur.execute("""
+        SELECT id, name, month_label, department, employee_name, created_at, updated_at
+        FROM reports WHERE %s ORDER BY employee_name ASC, id ASC LIMIT %d
+    """ % (' AND '.join(wheres), limit + 1), args)
+    rows = cur.fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return 200, {
+        'items': [{
+            'id': r['id'],
+            'name': r['name'],
+            'month_label': r['month_label'],
+            'department': r['department'],
+            'employee_name': r['employee_name'] or '',
+            'created_at': r['created_at'].isoformat() if r['created_at'] else None,
+            'updated_at': r['updated_at'].isoformat() if r['updated_at'] else None,
+        } for r in rows[:limit]],
+        'nextCursor': next_cursor,
+    }
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'files')
+
+S3_CLIENT = None
+
+def get_s3():
+    import boto3
+    from botocore.config import Config
+    global S3_CLIENT
+    if S3_CLIENT is None:
+        S3_CLIENT = boto3.client(
+            's3',
+            endpoint_url=S3_ENDPOINT_URL,
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=10,
+                tcp_keepalive=True,
+                connect_timeout=5,
+                read_timeout=60,
+                retries={'max_attempts': 3, 'mode': 'standard'}
+            )
+        )
+    return S3_CLIENT
+
+def cdn_url(key):
+    return "https://cdn.poehali.dev/projects/%s/bucket/%s" % (os.environ['AWS_ACCESS_KEY_ID'], key)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+EXPORT_ITERSIZE = 50
+REPORT_ROW_FIELDS = ('serviceName', 'operation', 'group', 'executor', 'unit', 'result', 'comment')
+CSV_HEADER = ('report_id', 'employee_name', 'department', 'month_label') + REPORT_ROW_FIELDS
+
+def iter_period_reports(conn, year, month):
+    """Отчёты периода через серверный курсор: в памяти не больше EXPORT_ITERSIZE отчётов"""
+    import psycopg2.extras
+    cur = conn.cursor(name='reports_export_%s' % uuid.uuid4().hex[:12],
+                      cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.itersize = EXPORT_ITERSIZE
+    try:
+        cur.execute("""
+            SELECT id, name, report_year, report_month, month_label, department,
+                   employee_name, rows_data, created_at, updated_at
+            FROM reports
+            WHERE report_year = %s AND report_month = %s
+            ORDER BY employee_name ASC, created_at ASC
+        """, (year, month))
+        for r in cur:
+            rows = r['rows_data']
+            if not isinstance(rows, list):
+                rows = json.loads(rows or '[]')
+            r['rows_data'] = rows
+            yield r
+    finally:
+        cur.close()
+
+def write_ndjson(reports, out):
+    text = io.TextIOWrapper(out, encoding='utf-8')
+    count = 0
+    for r in reports:
+        text.write(json.dumps({
+            'id': r['id'],
+            'name': r['name'],
+            'report_year': r['report_year'],
+            'report_month': r['report_month'],
+            'month_label': r['month_label'],
+            'department': r['department'],
+            'employee_name': r['employee_name'] or '',
+            'rows_data': r['rows_data'],
+            'created_at': r['created_at'].isoformat() if r['created_at'] else None,
+            'updated_at': r['updated_at'].isoformat() if r['updated_at'] else None,
+        }, ensure_ascii=False))
+        text.write('\n')
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+def write_csv(reports, out):
+    text = io.TextIOWrapper(out, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(CSV_HEADER)
+    count = 0
+    for r in reports:
+        for row in r['rows_data']:
+            writer.writerow([r['id'], r['employee_name'] or '', r['department'], r['month_label']]
+                            + [row.get(f, '') for f in REPORT_ROW_FIELDS])
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+def write_xlsx(reports, out):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    count = 0
+    for r in reports:
+        count += 1
+        title = re.sub(r'[\[\]:*?/\\]', '_', (r['employee_name'] or r['name'])[:25]) or 'Лист'
+        ws = wb.create_sheet('%s %d' % (title, count))
+        ws.append([r['employee_name'] or r['name'], r['department'], r['month_label']])
+        ws.append(list(REPORT_ROW_FIELDS))
+        for row in r['rows_data']:
+            ws.append([row.get(f, '') for f in REPORT_ROW_FIELDS])
+    if not count:
+        wb.create_sheet('Пусто')
+    wb.save(out)
+    return count
+
+EXPORT_WRITERS = {'ndjson': write_ndjson, 'csv': write_csv, 'xlsx': write_xlsx}
+
+def export_period(conn, year, month, fmt, compress):
+    """Пишет выгрузку периода во временный файл построчно и кладёт в хранилище под постоянным ключом периода"""
+    compress = compress and fmt != 'xlsx'
+    with tempfile.TemporaryFile() as spool:
+        out = gzip.GzipFile(fileobj=spool, mode='wb') if compress else spool
+        count = EXPORT_WRITERS[fmt](iter_period_reports(conn, year, month), out)
+        if compress:
+            out.close()
+        size = spool.tell()
+        spool.seek(0)
+        key = "exports/reports/%d-%02d.%s%s" % (year, month, fmt, '.gz' if compress else '')
+        get_s3().upload_fileobj(spool, S3_BUCKET, key, ExtraArgs={
+            'ContentType': 'application/gzip' if compress else EXPORT_FORMATS[fmt],
+            'CacheControl': 'no-cache',
+        })
+    # ?v= — чтобы CDN и браузер не отдали прошлую выгрузку по тому же ключу
+    url = "%s?v=%d" % (cdn_url(key), int(time.time()))
+    return {'url': url, 'format': fmt, 'compressed': compress, 'reports': count, 'size': size}
+
+PATCH_MAX_OPS = 500
+PATCH_FIELDS = ('name', 'month_label', 'department', 'employee_name')
+
+def check_row(row):
+    """Строка отчёта: объект с известными полями, id — целое, остальные значения — строки"""
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object')
+    for key, value in row.items():
+        if key == 'id':
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError('Invalid id')
+        elif key not in REPORT_ROW_FIELDS:
+            raise ValueError('Unknown field: %s' % key)
+        elif not isinstance(value, str):
+            raise ValueError('Invalid value for %s' % key)
+    return json.dumps(row, ensure_ascii=False)
+
+def build_rows_patch(ops):
+    """SQL-выражение поверх rows_data (jsonb_set/jsonb_insert) и минимальная длина rows_data для его индексов"""
+    expr = 'rows_data'
+    args = []
+    min_length = 0
+    growth = 0
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError('Invalid op')
+        kind = op.get('op')
+        index = op.get('index')
+        if kind == 'append':
+            expr = "jsonb_insert(%s, '{-1}', %%s::jsonb, true)" % expr
+            args.append(check_row(op.get('row') or {}))
+            growth += 1
+            continue
+        if not isinstance(index, int) or isinstance(index, bool) or index < 0:
+            raise ValueError('index required')
+        # insert допускает позицию сразу за последней строкой, остальные операции — только существующие
+        min_length = max(min_length, index - growth + (0 if kind == 'insert' else 1))
+        if kind == 'set':
+            field = op.get('field')
+            if field not in REPORT_ROW_FIELDS:
+                raise ValueError('Unknown field: %s' % field)
+            if not isinstance(op.get('value', ''), str):
+                raise ValueError('Invalid value for %s' % field)
+            expr = "jsonb_set(%s, ARRAY[%%s, %%s]::text[], %%s::jsonb, false)" % expr
+            args.extend([str(index), field, json.dumps(op.get('value', ''), ensure_ascii=False)])
+        elif kind == 'replace':
+            expr = "jsonb_set(%s, ARRAY[%%s]::text[], %%s::jsonb, false)" % expr
+            args.extend([str(index), check_row(op.get('row') or {})])
+        elif kind == 'insert':
+            expr = "jsonb_insert(%s, ARRAY[%%s]::text[], %%s::jsonb)" % expr
+            args.extend([str(index), check_row(op.get('row') or {})])
+            growth += 1
+        elif kind == 'remove':
+            expr = "(%s - %%s::int)" % expr
+            args.append(index)
+            growth -= 1
+        else:
+            raise ValueError('Unknown op: %s' % kind)
+    return expr, args, min_length
+
+def patch_report(cur, report_id, body):
+    """Частичное обновление отчёта с оптимистичной блокировкой по updated_at"""
+    version = body.get('version')
+    if not version:
+        return 400, {'error': 'version required'}
+    ops = body.get('ops') or []
+    fields = body.get('fields') or {}
+    if not isinstance(ops, list) or len(ops) > PATCH_MAX_OPS:
+        return 400, {'error': 'Invalid ops'}
+    try:
+        rows_expr, rows_args, min_length = build_rows_patch(ops)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    if not isinstance(fields, dict) or not all(isinstance(fields[f], str) for f in PATCH_FIELDS if f in fields):
+        return 400, {'error': 'Invalid fields'}
+
+    sets = ["updated_at = NOW()"]
+    args = []
+    if ops:
+        sets.append("rows_data = " + rows_expr)
+        args.extend(rows_args)
+    for field in PATCH_FIELDS:
+        if field in fields:
+            sets.append("%s = %%s" % field)
+            args.append(fields[field])
+
+    import psycopg2
+    try:
+        cur.execute(
+            "UPDATE reports SET %s WHERE id = %%s AND updated_at = %%s::timestamptz "
+            "AND jsonb_array_length(rows_data) >= %%s "
+            "RETURNING report_year, report_month, updated_at" % ', '.join(sets),
+            args + [report_id, version, min_length]
+        )
+    except psycopg2.DataError:
+        return 400, {'error': 'Invalid patch'}
+    r = cur.fetchone()
+    if not r:
+        cur.execute(
+            "SELECT updated_at, updated_at = %s::timestamptz AS same_version, "
+            "jsonb_array_length(rows_data) AS row_count FROM reports WHERE id = %s",
+            (version, report_id)
+        )
+        current = cur.fetchone()
+        if not current:
+            return 404, {'error': 'Not found'}
+        if current['same_version']:
+            return 400, {'error': 'Row index out of range', 'rowCount': current['row_count']}
+        return 409, {'error': 'Version conflict',
+                     'version': current['updated_at'].isoformat() if current['updated_at'] else None}
+    bump_period(cur, r['report_year'], r['report_month'], 0)
+    return 200, {'ok': True, 'version': r['updated_at'].isoformat()}
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1400'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+def dumps(payload):
+    """JSON-тело ответа: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False)
+
+def accepted_encoding(event):
+    headers = event.get('headers') or {}
+    accept = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    offered = set()
+    for part in accept.lower().split(','):
+        name, _, q = part.partition(';')
+        q = q.replace(' ', '')
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        offered.add(name.strip())
+    if brotli is not None and 'br' in offered:
+        return 'br'
+    if 'gzip' in offered or '*' in offered:
+        return 'gzip'
+    return None
+
+def compress_response(event, response):
+    """Сжимает крупное тело ответа (br/gzip по Accept-Encoding) и отдаёт его в base64 для шлюза"""
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return response
+    raw = body.encode()
+    if encoding == 'br':
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    headers = dict(response.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return dict(response, headers=headers, body=base64.b64encode(data).decode(), isBase64Encoded=True)
+
+def compressed(handler):
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        return compress_response(event, handler(event, context))
+    return wrapper
+
+@compressed
 def handler(event: dict, context) -> dict:
     """API для управления сохранёнными отчётами: список, сохранение, загрузка, удаление."""
     if event.get('httpMethod') == 'OPTIONS':
@@ -47,7 +572,7 @@ def handler(event: dict, context) -> dict:
 
     user_id = get_user(event)
     if not user_id:
-        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Unauthorized'})}
+        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Unauthorized'})}
 
     method = event.get('httpMethod', 'GET')
     path = event.get('path', '/')
@@ -55,6 +580,7 @@ def handler(event: dict, context) -> dict:
     # parts[0] = 'reports-api', parts[1] = id or 'by-period'
     sub = parts[1] if len(parts) >= 2 else None
 
+    import psycopg2.extras
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
@@ -62,8 +588,26 @@ def handler(event: dict, context) -> dict:
         # GET /reports-api/by-period?year=2026&month=3 — все отчёты за период (для группового экспорта)
         if method == 'GET' and sub == 'by-period':
             params = event.get('queryStringParameters') or {}
-            year = int(params.get('year', 2026))
-            month = int(params.get('month', 1))
+            try:
+                year, month = parse_period(params)
+            except ValueError:
+                return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Invalid year or month'})}
+            year, month = year or 2026, month or 1
+            fmt = params.get('format', '')
+            if fmt:
+                if fmt not in EXPORT_FORMATS:
+                    return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Unknown format'})}
+                result = export_period(conn, year, month, fmt, params.get('gzip') == '1')
+                return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(result)}
+            etag, last_modified = list_version(
+                cur,
+                "SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM reports "
+                "WHERE report_year = %s AND report_month = %s",
+                (year, month), params
+            )
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
             cur.execute("""
                 SELECT id, name, report_year, report_month, month_label, department,
                        employee_name, rows_data, created_at, updated_at
@@ -86,10 +630,16 @@ def handler(event: dict, context) -> dict:
                     'created_at': r['created_at'].isoformat() if r['created_at'] else None,
                     'updated_at': r['updated_at'].isoformat() if r['updated_at'] else None,
                 })
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(result)}
+            return {'statusCode': 200, 'headers': headers, 'body': dumps(result)}
 
         # GET /reports-api — список всех отчётов (структура год→месяц)
         if method == 'GET' and not sub:
+            etag, last_modified = list_version(
+                cur, "SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM reports", None, None
+            )
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
             cur.execute("""
                 SELECT id, name, report_year, report_month, month_label, department,
                        employee_name, created_at, updated_at
@@ -114,15 +664,43 @@ def handler(event: dict, context) -> dict:
                     'created_at': r['created_at'].isoformat() if r['created_at'] else None,
                     'updated_at': r['updated_at'].isoformat() if r['updated_at'] else None,
                 })
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(result)}
+            return {'statusCode': 200, 'headers': headers, 'body': dumps(result)}
+
+        # GET /reports-api/tree?year=2026&month=3 — дерево архива по уровням из сводки report_periods
+        if method == 'GET' and sub == 'tree':
+            params = event.get('queryStringParameters') or {}
+            try:
+                year, month = parse_period(params)
+            except ValueError:
+                return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Invalid year or month'})}
+            wheres = []
+            args = []
+            if year:
+                wheres.append("report_year = %s")
+                args.append(year)
+            if month:
+                wheres.append("report_month = %s")
+                args.append(month)
+            etag, last_modified = list_version(
+                cur,
+                "SELECT COALESCE(SUM(reports_count), 0) AS total, MAX(updated_at) AS last_modified "
+                "FROM report_periods %s" % (('WHERE ' + ' AND '.join(wheres)) if wheres else ''),
+                args, params
+            )
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+            status, payload = archive_tree(cur, params, year, month)
+            return {'statusCode': status, 'headers': headers if status == 200 else CORS_HEADERS,
+                    'body': dumps(payload)}
 
         # GET /reports-api/{id} — загрузить отчёт
         if method == 'GET' and sub:
             cur.execute("SELECT * FROM reports WHERE id = %s", (sub,))
             r = cur.fetchone()
             if not r:
-                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({
+                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({
                 'id': r['id'],
                 'name': r['name'],
                 'report_year': r['report_year'],
@@ -151,8 +729,9 @@ def handler(event: dict, context) -> dict:
                 VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id, created_at
             """, (name, report_year, report_month, month_label, department, employee_name, rows_data))
             row = cur.fetchone()
+            bump_period(cur, report_year, report_month, 1)
             conn.commit()
-            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps({'id': row['id'], 'created_at': row['created_at'].isoformat()})}
+            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps({'id': row['id'], 'created_at': row['created_at'].isoformat()})}
 
         # PUT /reports-api/{id} — обновить отчёт
         if method == 'PUT' and sub:
@@ -166,21 +745,43 @@ def handler(event: dict, context) -> dict:
             rows_data = json.dumps(body.get('rows_data', []), ensure_ascii=False)
 
             cur.execute("""
-                UPDATE reports SET name=%s, report_year=%s, report_month=%s, month_label=%s,
+                UPDATE reports r SET name=%s, report_year=%s, report_month=%s, month_label=%s,
                 department=%s, employee_name=%s, rows_data=%s, updated_at=NOW()
-                WHERE id=%s
+                FROM (SELECT id, report_year, report_month FROM reports WHERE id=%s FOR UPDATE) old
+                WHERE r.id = old.id
+                RETURNING old.report_year AS old_year, old.report_month AS old_month, r.updated_at
             """, (name, report_year, report_month, month_label, department, employee_name, rows_data, sub))
+            old = cur.fetchone()
+            if old and (old['old_year'], old['old_month']) != (report_year, report_month):
+                bump_period(cur, old['old_year'], old['old_month'], -1)
+                bump_period(cur, report_year, report_month, 1)
+            elif old:
+                bump_period(cur, report_year, report_month, 0)
             conn.commit()
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({
+                'ok': True, 'version': old['updated_at'].isoformat() if old else None})}
+
+        # PATCH /reports-api/{id} — точечные правки строк отчёта: {version, ops, fields}
+        if method == 'PATCH' and sub:
+            body = json.loads(event.get('body') or '{}')
+            status, payload = patch_report(cur, sub, body)
+            if status == 200:
+                conn.commit()
+            else:
+                conn.rollback()
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
 
         # DELETE /reports-api/{id} — удалить отчёт
         if method == 'DELETE' and sub:
-            cur.execute("DELETE FROM reports WHERE id = %s", (sub,))
+            cur.execute("DELETE FROM reports WHERE id = %s RETURNING report_year, report_month", (sub,))
+            old = cur.fetchone()
+            if old:
+                bump_period(cur, old['report_year'], old['report_month'], -1)
             conn.commit()
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
 
-        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Method not allowed'})}
+        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Method not allowed'})}
 
     finally:
         cur.close()
-        conn.close()
+        put_conn(conn)
@@ -1,17 +1,35 @@
 import json
 import os
+import datetime
+import email.utils
+import html
+import base64
+import re
 import uuid
 import hashlib
 import hmac
 import time
-import psycopg2
-import psycopg2.extras
+import threading
+import collections
+import functools
+import gzip
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
     'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization',
     'Access-Control-Max-Age': '86400',
+    'Access-Control-Expose-Headers': 'ETag, Last-Modified',
     'Content-Type': 'application/json'
 }
 
@@ -23,17 +41,40 @@ def get_secret():
         SECRET = os.environ.get('AUTH_SECRET', 'task-manager-secret-2024')
     return SECRET
 
+TOKEN_TTL = 30 * 24 * 3600
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '512'))
+
+_TOKEN_CACHE = collections.OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
 def verify_token(token):
+    """Проверяет подпись и срок токена; проверенные токены кешируются в контейнере до истечения срока"""
+    now = time.time()
+    with _TOKEN_CACHE_LOCK:
+        cached = _TOKEN_CACHE.get(token)
+        if cached:
+            if cached[1] > now:
+                _TOKEN_CACHE.move_to_end(token)
+                return cached[0]
+            del _TOKEN_CACHE[token]
     parts = token.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         return None
-    user_id, ts, sig = parts
-    payload = user_id + ":" + ts
+    user_id, ts, sig = parts[0], parts[1], parts[-1]
+    payload = token[:-len(sig) - 1]
     expected = hmac.new(get_secret().encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
     if not hmac.compare_digest(sig, expected):
         return None
-    if int(time.time()) - int(ts) > 30 * 24 * 3600:
+    try:
+        expires = int(ts) + TOKEN_TTL
+    except ValueError:
+        return None
+    if expires <= now:
         return None
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[token] = (user_id, expires)
+        while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+            _TOKEN_CACHE.popitem(last=False)
     return user_id
 
 def get_user_id(event):
@@ -44,9 +85,67 @@ def get_user_id(event):
         return verify_token(auth[7:])
     return None
 
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_CHECK_AFTER = int(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+_POOL = []
+_POOL_LOCK = threading.Lock()
+
+def _close_quietly(conn):
+    import psycopg2
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def _is_alive(conn):
+    import psycopg2
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        if not conn.autocommit:
+            conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_conn():
+    """Берёт соединение из пула тёплого контейнера или открывает новое"""
+    import psycopg2
+    now = time.time()
+    while True:
+        with _POOL_LOCK:
+            if not _POOL:
+                break
+            conn, last_used = _POOL.pop()
+        idle = now - last_used
+        if conn.closed or idle > DB_POOL_IDLE_TIMEOUT:
+            _close_quietly(conn)
+            continue
+        if idle > DB_POOL_CHECK_AFTER and not _is_alive(conn):
+            _close_quietly(conn)
+            continue
+        return conn
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
+def put_conn(conn):
+    """Возвращает соединение в пул; сломанные и лишние закрываются"""
+    import psycopg2
+    if conn.closed:
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _close_quietly(conn)
+        return
+    with _POOL_LOCK:
+        if len(_POOL) < DB_POOL_MAX_SIZE:
+            _POOL.append((conn, time.time()))
+            return
+    _close_quietly(conn)
+
 def row_to_task(r):
     return {
         'id': r['id'],
@@ -59,6 +158,503 @@ def row_to_task(r):
         'completedAt': r['completed_at'].isoformat() if r['completed_at'] else None,
     }
 
+TASK_STATUSES = ('active', 'completed', 'archived')
+TASK_PRIORITIES = ('high', 'medium', 'low')
+PAGE_DEFAULT_LIMIT = 50
+PAGE_MAX_LIMIT = 200
+LIST_PARAMS = ('limit', 'cursor', 'status', 'priority', 'due_from', 'due_to')
+
+def encode_cursor(r):
+    raw = "%s|%s" % (r['created_at'].isoformat(), r['id'])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, task_id = raw.split('|', 1)
+        return created_at, task_id
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def split_param(value, allowed):
+    values = [v.strip() for v in (value or '').split(',') if v.strip()]
+    return [v for v in values if v in allowed]
+
+def list_tasks(cur, user_id, params):
+    """Постраничный список задач: keyset по (created_at, id) и фильтры по статусу, приоритету, сроку"""
+    import psycopg2
+    try:
+        limit = int(params.get('limit') or PAGE_DEFAULT_LIMIT)
+    except ValueError:
+        return 400, {'error': 'Invalid limit'}
+    limit = max(1, min(limit, PAGE_MAX_LIMIT))
+
+    wheres = ["user_id = %s"]
+    args = [user_id]
+    statuses = split_param(params.get('status'), TASK_STATUSES)
+    if statuses:
+        wheres.append("status = ANY(%s)")
+        args.append(statuses)
+    priorities = split_param(params.get('priority'), TASK_PRIORITIES)
+    if priorities:
+        wheres.append("priority = ANY(%s)")
+        args.append(priorities)
+    if params.get('due_from'):
+        wheres.append("due_date >= %s::timestamptz")
+        args.append(params['due_from'])
+    if params.get('due_to'):
+        wheres.append("due_date <= %s::timestamptz")
+        args.append(params['due_to'])
+    if params.get('cursor'):
+        position = decode_cursor(params['cursor'])
+        if not position:
+            return 400, {'error': 'Invalid cursor'}
+        wheres.append("(created_at, id) < (%s::timestamptz, %s)")
+        args.extend(position)
+
+    try:
+        cur.execute(
+            "SELECT id, title, description, priority, status, due_date, created_at, completed_at "
+            "FROM tasks WHERE %s ORDER BY created_at DESC, id DESC LIMIT %d"
+            % (' AND '.join(wheres), limit + 1),
+            args
+        )
+    except psycopg2.DataError:
+        return 400, {'error': 'Invalid filter value'}
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return 200, {
+        'items': [row_to_task(r) for r in rows],
+        'nextCursor': encode_cursor(rows[-1]) if has_more else None,
+    }
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_HEADLINE = 'StartSel=\x02, StopSel=\x03, MaxWords=35, MinWords=15, MaxFragments=2'
+
+SEARCH_SQL = """
+WITH q AS (
+    SELECT websearch_to_tsquery('russian', %(q)s) || websearch_to_tsquery('simple', %(q)s) AS query
+), hits AS (
+    SELECT t.id, t.title, t.description, t.priority, t.status, t.due_date, t.created_at, t.completed_at,
+           ts_rank_cd(t.search_vector, q.query) AS rank
+    FROM tasks t, q
+    WHERE t.user_id = %(user_id)s AND t.search_vector @@ q.query {filters}
+    ORDER BY rank DESC, t.created_at DESC, t.id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+)
+SELECT hits.*,
+       ts_headline('russian', hits.title, q.query, %(headline)s) AS title_hl,
+       ts_headline('russian', hits.description, q.query, %(headline)s) AS description_hl
+FROM hits, q
+ORDER BY hits.rank DESC, hits.created_at DESC, hits.id DESC
+"""
+
+def highlight(text):
+    """Экранирует текст ts_headline и превращает маркеры совпадений в <mark>"""
+    return html.escape(text or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def search_tasks(cur, user_id, params):
+    """Полнотекстовый поиск по названию и описанию задач: ранжирование, подсветка, offset-страницы"""
+    query = (params.get('q') or '').strip()
+    if not query:
+        return 400, {'error': 'q required'}
+    try:
+        limit = int(params.get('limit') or SEARCH_DEFAULT_LIMIT)
+        offset = int(params.get('offset') or 0)
+    except ValueError:
+        return 400, {'error': 'Invalid limit or offset'}
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+
+    filters = ''
+    args = {'q': query, 'user_id': user_id, 'limit': limit + 1, 'offset': offset, 'headline': SEARCH_HEADLINE}
+    statuses = split_param(params.get('status'), TASK_STATUSES)
+    if statuses:
+        filters = 'AND t.status = ANY(%(statuses)s)'
+        args['statuses'] = statuses
+    cur.execute(SEARCH_SQL.format(filters=filters), args)
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    items = []
+    for r in rows[:limit]:
+        item = row_to_task(r)
+        item['rank'] = float(r['rank'])
+        item['highlight'] = {'title': highlight(r['title_hl']), 'description': highlight(r['description_hl'])}
+        items.append(item)
+    return 200, {'items': items, 'nextOffset': offset + limit if has_more else None}
+
+STATS_GRANULARITY = {'day': ('1 day', 30), 'week': ('1 week', 12)}
+STATS_MAX_PERIODS = 366
+
+STATS_SQL = """
+WITH t AS (
+    SELECT status, priority, due_date, created_at, completed_at
+    FROM tasks WHERE user_id = %(uid)s
+),
+buckets AS (
+    SELECT generate_series(
+        date_trunc(%(unit)s, NOW() AT TIME ZONE %(tz)s) - (%(periods)s - 1) * %(step)s::interval,
+        date_trunc(%(unit)s, NOW() AT TIME ZONE %(tz)s),
+        %(step)s::interval
+    ) AS period
+),
+created AS (
+    SELECT date_trunc(%(unit)s, created_at AT TIME ZONE %(tz)s) AS period,
+           COUNT(*) AS created, COUNT(completed_at) AS done
+    FROM t GROUP BY 1
+),
+completed AS (
+    SELECT date_trunc(%(unit)s, completed_at AT TIME ZONE %(tz)s) AS period, COUNT(*) AS completed
+    FROM t WHERE completed_at IS NOT NULL GROUP BY 1
+),
+due AS (
+    SELECT to_char(due_date AT TIME ZONE %(tz)s, 'YYYY-MM-DD') AS day,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE status = 'active' AND due_date < NOW()) AS overdue
+    FROM t
+    WHERE status <> 'archived'
+      AND due_date >= %(month)s::date::timestamp AT TIME ZONE %(tz)s
+      AND due_date < (%(month)s::date + INTERVAL '1 month')::timestamp AT TIME ZONE %(tz)s
+    GROUP BY 1
+)
+SELECT
+    (SELECT COUNT(*) FROM t) AS total,
+    (SELECT COALESCE(json_object_agg(status, n), '{}') FROM
+        (SELECT status, COUNT(*) AS n FROM t GROUP BY status) s) AS by_status,
+    (SELECT COALESCE(json_object_agg(priority, n), '{}') FROM
+        (SELECT priority, COUNT(*) AS n FROM t WHERE status = 'active' GROUP BY priority) p) AS by_priority,
+    (SELECT COUNT(*) FROM t WHERE status = 'active' AND due_date < NOW()) AS overdue,
+    (SELECT COUNT(*) FROM t WHERE status = 'completed'
+        AND completed_at > NOW() - INTERVAL '7 days') AS completed_this_week,
+    (SELECT json_agg(json_build_object(
+        'period', to_char(b.period, 'YYYY-MM-DD'),
+        'created', COALESCE(c.created, 0),
+        'completed', COALESCE(d.completed, 0),
+        'completionRate', CASE WHEN c.created > 0 THEN round(c.done::numeric / c.created, 4) END
+     ) ORDER BY b.period)
+     FROM buckets b
+     LEFT JOIN created c ON c.period = b.period
+     LEFT JOIN completed d ON d.period = b.period) AS series,
+    (SELECT COALESCE(json_object_agg(day, json_build_object('total', total, 'overdue', overdue)), '{}')
+     FROM due) AS due_histogram
+"""
+
+def task_stats(cur, user_id, params):
+    """Сводная статистика задач одним сгруппированным запросом: счётчики, динамика выполнения, календарь срока"""
+    import psycopg2
+    granularity = params.get('granularity') or 'day'
+    if granularity not in STATS_GRANULARITY:
+        return 400, {'error': 'Invalid granularity'}
+    step, default_periods = STATS_GRANULARITY[granularity]
+    try:
+        periods = int(params.get('periods') or default_periods)
+    except ValueError:
+        return 400, {'error': 'Invalid periods'}
+    periods = max(1, min(periods, STATS_MAX_PERIODS))
+    month = params.get('month') or time.strftime('%Y-%m', time.gmtime())
+    if not re.match(r'^\d{4}-(0[1-9]|1[0-2])$', month):
+        return 400, {'error': 'Invalid month'}
+
+    try:
+        cur.execute(STATS_SQL, {
+            'uid': user_id,
+            'unit': granularity,
+            'step': step,
+            'periods': periods,
+            'tz': params.get('tz') or 'UTC',
+            'month': month + '-01',
+        })
+    except psycopg2.DataError:
+        return 400, {'error': 'Invalid timezone'}
+    r = cur.fetchone()
+    by_status = r['by_status'] or {}
+    by_priority = r['by_priority'] or {}
+    return 200, {
+        'total': r['total'],
+        'active': by_status.get('active', 0),
+        'completed': by_status.get('completed', 0),
+        'archived': by_status.get('archived', 0),
+        'overdue': r['overdue'],
+        'highPriority': by_priority.get('high', 0),
+        'completedThisWeek': r['completed_this_week'],
+        'byStatus': by_status,
+        'byPriority': by_priority,
+        'granularity': granularity,
+        'series': r['series'] or [],
+        'month': month,
+        'dueHistogram': r['due_histogram'] or {},
+    }
+
+BULK_MAX_OPERATIONS = 1000
+TASK_RETURNING = "id, title, description, priority, status, due_date, created_at, completed_at"
+
+BULK_INSERT_SQL = (
+    "INSERT INTO tasks (id, title, description, priority, due_date, user_id) VALUES %s "
+    "RETURNING " + TASK_RETURNING
+)
+
+BULK_UPDATE_SQL = (
+    "UPDATE tasks AS t SET "
+    "title = CASE WHEN v.has_title THEN v.title ELSE t.title END, "
+    "description = CASE WHEN v.has_description THEN v.description ELSE t.description END, "
+    "priority = COALESCE(v.priority, t.priority), "
+    "status = COALESCE(v.status, t.status), "
+    "completed_at = CASE WHEN v.status = 'completed' THEN NOW() "
+    "WHEN v.status = 'active' THEN NULL ELSE t.completed_at END, "
+    "due_date = CASE WHEN v.has_due THEN v.due_date ELSE t.due_date END, "
+    "updated_at = NOW() "
+    "FROM (VALUES %s) AS v(id, user_id, has_title, title, has_description, description, "
+    "priority, status, has_due, due_date) "
+    "WHERE t.id = v.id AND t.user_id = v.user_id "
+    "RETURNING " + ', '.join('t.' + c for c in TASK_RETURNING.split(', '))
+)
+BULK_UPDATE_TEMPLATE = "(%s, %s, %s, %s::text, %s, %s::text, %s::text, %s::text, %s, %s::timestamptz)"
+
+def parse_due_date(value):
+    """Срок задачи из ISO-строки; пустое значение — без срока, иначе ValueError"""
+    if value in (None, ''):
+        return None
+    if not isinstance(value, str):
+        raise ValueError(value)
+    datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value
+
+def bulk_item_error(item, op):
+    """Проверка полей операции до SQL, чтобы одна плохая запись не срывала весь пакет"""
+    if op == 'create' or 'title' in item:
+        if not isinstance(item.get('title'), str) or not item['title'].strip():
+            return 'title required'
+    if item.get('description') is not None and not isinstance(item['description'], str):
+        return 'Invalid description'
+    if item.get('priority') not in (None,) + TASK_PRIORITIES:
+        return 'Invalid priority'
+    if op == 'update' and item.get('status') not in (None,) + TASK_STATUSES:
+        return 'Invalid status'
+    try:
+        parse_due_date(item.get('dueDate'))
+    except ValueError:
+        return 'Invalid dueDate'
+    return None
+
+def bulk_tasks(conn, cur, user_id, operations):
+    """Пакетное создание, изменение и архивирование задач в одной транзакции с результатом по каждой операции"""
+    import psycopg2.extras
+    results = [None] * len(operations)
+    creates, updates, archives = [], [], []
+    seen = set()
+
+    for i, item in enumerate(operations):
+        op = item.get('op') if isinstance(item, dict) else None
+        if op == 'create':
+            error = bulk_item_error(item, op)
+            if error:
+                results[i] = {'index': i, 'op': op, 'ok': False, 'error': error}
+            else:
+                task_id = str(uuid.uuid4())[:12]
+                creates.append((i, (task_id, item['title'], item.get('description') or '',
+                                    item.get('priority') or 'medium', parse_due_date(item.get('dueDate')),
+                                    user_id)))
+        elif op in ('update', 'archive'):
+            task_id = item.get('id') or ''
+            error = bulk_item_error(item, op) if op == 'update' else None
+            if not isinstance(task_id, str) or not task_id:
+                results[i] = {'index': i, 'op': op, 'ok': False, 'error': 'id required'}
+            elif task_id in seen:
+                results[i] = {'index': i, 'op': op, 'ok': False, 'error': 'Duplicate id in batch'}
+            elif op == 'archive':
+                seen.add(task_id)
+                archives.append((i, task_id))
+            elif error:
+                results[i] = {'index': i, 'op': op, 'ok': False, 'error': error}
+            else:
+                seen.add(task_id)
+                updates.append((i, (task_id, user_id,
+                                    'title' in item, item.get('title'),
+                                    'description' in item, item.get('description') or '',
+                                    item.get('priority'), item.get('status'),
+                                    'dueDate' in item, parse_due_date(item.get('dueDate')))))
+        else:
+            results[i] = {'index': i, 'op': op, 'ok': False, 'error': 'Unknown op'}
+
+    conn.autocommit = False
+    try:
+        if creates:
+            rows = psycopg2.extras.execute_values(
+                cur, BULK_INSERT_SQL, [v for _, v in creates], page_size=len(creates), fetch=True)
+            by_id = {r['id']: r for r in rows}
+            for i, v in creates:
+                results[i] = {'index': i, 'op': 'create', 'ok': True, 'task': row_to_task(by_id[v[0]])}
+        if updates:
+            rows = psycopg2.extras.execute_values(
+                cur, BULK_UPDATE_SQL, [v for _, v in updates], template=BULK_UPDATE_TEMPLATE,
+                page_size=len(updates), fetch=True)
+            by_id = {r['id']: r for r in rows}
+            for i, v in updates:
+                r = by_id.get(v[0])
+                results[i] = ({'index': i, 'op': 'update', 'ok': True, 'task': row_to_task(r)} if r
+                              else {'index': i, 'op': 'update', 'ok': False, 'error': 'Not found'})
+        if archives:
+            cur.execute(
+                "UPDATE tasks SET status = 'archived', updated_at = NOW() WHERE user_id = %s AND id = ANY(%s) "
+                "RETURNING " + TASK_RETURNING,
+                (user_id, [task_id for _, task_id in archives])
+            )
+            by_id = {r['id']: r for r in cur.fetchall()}
+            for i, task_id in archives:
+                r = by_id.get(task_id)
+                results[i] = ({'index': i, 'op': 'archive', 'ok': True, 'task': row_to_task(r)} if r
+                              else {'index': i, 'op': 'archive', 'ok': False, 'error': 'Not found'})
+        conn.commit()
+    except psycopg2.DataError:
+        conn.rollback()
+        return 400, {'error': 'Invalid value in batch'}
+    except Exception:
+        conn.rollback()
+        raise
+    return 200, {'results': results}
+
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 1000
+SYNC_LAG_SECONDS = 5
+SYNC_MIN_ID = ''
+
+def encode_sync_cursor(ts, row_id):
+    raw = "%s|%s" % (ts.isoformat(), row_id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_sync_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.split('|', 1)
+        ts = datetime.datetime.fromisoformat(ts)
+        if ts.tzinfo is None:
+            return None
+        return ts, row_id
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def sync_tasks(cur, user_id, params):
+    """Дельта после курсора since: новые и изменённые задачи; удаление — это архивирование, поэтому deleted пуст"""
+    try:
+        limit = int(params.get('limit') or SYNC_DEFAULT_LIMIT)
+    except ValueError:
+        return 400, {'error': 'Invalid limit'}
+    limit = max(1, min(limit, SYNC_MAX_LIMIT))
+
+    cur.execute(
+        "SELECT NOW() - make_interval(secs => %s) AS horizon", (SYNC_LAG_SECONDS,)
+    )
+    bounds = cur.fetchone()
+    if params.get('since'):
+        position = decode_sync_cursor(params['since'])
+        if not position:
+            return 400, {'error': 'Invalid cursor'}
+    else:
+        position = (datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc), SYNC_MIN_ID)
+
+    cur.execute(
+        "SELECT id, title, description, priority, status, due_date, created_at, completed_at, updated_at "
+        "FROM tasks WHERE user_id = %%s AND (updated_at, id) > (%%s, %%s) AND updated_at <= %%s "
+        "ORDER BY updated_at, id LIMIT %d"
+        % (limit + 1),
+        (user_id, position[0], position[1], bounds['horizon'])
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return 200, {
+        'items': [row_to_task(r) for r in rows],
+        'deleted': [],
+        'nextCursor': encode_sync_cursor(rows[-1]['updated_at'], rows[-1]['id']) if has_more
+        else encode_sync_cursor(bounds['horizon'], SYNC_MIN_ID),
+        'hasMore': has_more,
+    }
+
+def list_version(cur, sql, args, params):
+    """ETag и Last-Modified списка по числу строк и max(updated_at) — без выборки самих строк"""
+    cur.execute(sql, args)
+    r = cur.fetchone()
+    last_modified = r['last_modified']
+    raw = "%s|%s|%s" % (
+        r['total'],
+        last_modified.isoformat() if last_modified else '',
+        json.dumps(params or {}, sort_keys=True),
+    )
+    return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:24], last_modified
+
+def cache_headers(etag, last_modified):
+    headers = dict(CORS_HEADERS, ETag=etag)
+    headers['Cache-Control'] = 'private, no-cache'
+    if last_modified:
+        headers['Last-Modified'] = email.utils.format_datetime(
+            last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(event, etag):
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1400'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+def dumps(payload):
+    """JSON-тело ответа: orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False)
+
+def accepted_encoding(event):
+    headers = event.get('headers') or {}
+    accept = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    offered = set()
+    for part in accept.lower().split(','):
+        name, _, q = part.partition(';')
+        q = q.replace(' ', '')
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        offered.add(name.strip())
+    if brotli is not None and 'br' in offered:
+        return 'br'
+    if 'gzip' in offered or '*' in offered:
+        return 'gzip'
+    return None
+
+def compress_response(event, response):
+    """Сжимает крупное тело ответа (br/gzip по Accept-Encoding) и отдаёт его в base64 для шлюза"""
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return response
+    raw = body.encode()
+    if encoding == 'br':
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    headers = dict(response.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return dict(response, headers=headers, body=base64.b64encode(data).decode(), isBase64Encoded=True)
+
+def compressed(handler):
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        return compress_response(event, handler(event, context))
+    return wrapper
+
+@compressed
 def handler(event, context):
     """API для управления задачами с привязкой к пользователю"""
     if event.get('httpMethod') == 'OPTIONS':
@@ -66,17 +662,44 @@ def handler(event, context):
 
     user_id = get_user_id(event)
     if not user_id:
-        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Unauthorized'})}
+        return {'statusCode': 401, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Unauthorized'})}
 
     method = event.get('httpMethod', 'GET')
     params = event.get('queryStringParameters') or {}
 
+    import psycopg2.extras
     conn = get_conn()
     conn.autocommit = True
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
     try:
-        if method == 'GET':
+        if method == 'GET' and params.get('mode') == 'stats':
+            status, payload = task_stats(cur, user_id, params)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
+        elif method == 'GET' and 'q' in params:
+            status, payload = search_tasks(cur, user_id, params)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
+        elif method == 'GET' and 'since' in params:
+            status, payload = sync_tasks(cur, user_id, params)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
+
+        elif method == 'GET':
+            etag, last_modified = list_version(
+                cur,
+                "SELECT COUNT(*) AS total, MAX(updated_at) AS last_modified FROM tasks WHERE user_id = %s",
+                (user_id,), params
+            )
+            headers = cache_headers(etag, last_modified)
+            if is_not_modified(event, etag):
+                return {'statusCode': 304, 'headers': headers, 'body': ''}
+
+            if any(k in params for k in LIST_PARAMS):
+                status, payload = list_tasks(cur, user_id, params)
+                return {'statusCode': status, 'headers': headers if status == 200 else CORS_HEADERS,
+                        'body': dumps(payload)}
+
             cur.execute(
                 "SELECT id, title, description, priority, status, due_date, created_at, completed_at "
                 "FROM tasks WHERE user_id = '%s' ORDER BY created_at DESC"
@@ -84,7 +707,17 @@ def handler(event, context):
             )
             rows = cur.fetchall()
             tasks = [row_to_task(r) for r in rows]
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(tasks)}
+            return {'statusCode': 200, 'headers': headers, 'body': dumps(tasks)}
+
+        elif method == 'POST' and params.get('action') == 'bulk':
+            body = json.loads(event.get('body') or '{}')
+            operations = body.get('operations')
+            if not isinstance(operations, list) or not operations:
+                return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': dumps({'error': 'operations required'})}
+            if len(operations) > BULK_MAX_OPERATIONS:
+                return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Too many operations'})}
+            status, payload = bulk_tasks(conn, cur, user_id, operations)
+            return {'statusCode': status, 'headers': CORS_HEADERS, 'body': dumps(payload)}
 
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
@@ -109,7 +742,7 @@ def handler(event, context):
                 )
             )
             r = cur.fetchone()
-            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': json.dumps(row_to_task(r))}
+            return {'statusCode': 201, 'headers': CORS_HEADERS, 'body': dumps(row_to_task(r))}
 
         elif method == 'PUT':
             body = json.loads(event.get('body', '{}'))
@@ -134,7 +767,8 @@ def handler(event, context):
                     sets.append("due_date = NULL")
 
             if not sets:
-                return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Nothing to update'})}
+                return {'statusCode': 400, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Nothing to update'})}
+            sets.append("updated_at = NOW()")
 
             cur.execute(
                 "UPDATE tasks SET %s WHERE id = '%s' AND user_id = '%s' "
@@ -143,18 +777,18 @@ def handler(event, context):
             )
             r = cur.fetchone()
             if not r:
-                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Not found'})}
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps(row_to_task(r))}
+                return {'statusCode': 404, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Not found'})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps(row_to_task(r))}
 
         elif method == 'DELETE':
             task_id = params.get('id', '')
             cur.execute(
-                "UPDATE tasks SET status = 'archived' WHERE id = '%s' AND user_id = '%s'"
+                "UPDATE tasks SET status = 'archived', updated_at = NOW() WHERE id = '%s' AND user_id = '%s'"
                 % (task_id.replace("'", ""), user_id.replace("'", ""))
             )
-            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': json.dumps({'ok': True})}
+            return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': dumps({'ok': True})}
 
-        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': json.dumps({'error': 'Method not allowed'})}
+        return {'statusCode': 405, 'headers': CORS_HEADERS, 'body': dumps({'error': 'Method not allowed'})}
     finally:
         cur.close()
-        conn.close()
+        put_conn(conn)
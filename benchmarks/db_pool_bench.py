@@ -0,0 +1,69 @@
+"""Сравнение холодного подключения к Postgres и выдачи соединения из пула.
+
+Запуск: DATABASE_URL=postgres://... python benchmarks/db_pool_bench.py [N]
+"""
+import importlib.util
+import os
+import statistics
+import sys
+import time
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_function(name):
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(label, fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print('%-28s p50=%8.2f ms  p95=%8.2f ms  mean=%8.2f ms'
+          % (label, statistics.median(samples), p95, statistics.mean(samples)))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    dsn = os.environ['DATABASE_URL']
+    tasks = load_function('tasks-api')
+
+    def cold_connect():
+        conn = psycopg2.connect(dsn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.close()
+
+    warm = psycopg2.connect(dsn)
+
+    def warm_query():
+        with warm.cursor() as cur:
+            cur.execute("SELECT 1")
+        warm.rollback()
+
+    def pooled_checkout():
+        conn = tasks.get_conn()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        tasks.put_conn(conn)
+
+    measure('cold connect + SELECT 1', cold_connect, n)
+    measure('warm connection SELECT 1', warm_query, n)
+    pooled_checkout()
+    measure('pooled checkout + SELECT 1', pooled_checkout, n)
+    warm.close()
+
+
+if __name__ == '__main__':
+    main()
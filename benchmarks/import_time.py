@@ -0,0 +1,84 @@
+"""Время импорта каждой функции (python -X importtime) и проверка лёгких путей.
+
+Для каждой backend/<функция>/index.py измеряется кумулятивное время `import index`,
+после чего вызываются OPTIONS и неавторизованный запрос и проверяется, что ни psycopg2,
+ни boto3, ни Pillow/pypdfium2 (превью в files-api) при этом не были импортированы. Результат записывается в benchmarks/import_time.md.
+
+Запуск: python benchmarks/import_time.py [N]
+"""
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+REPORT = os.path.join(ROOT, 'benchmarks', 'import_time.md')
+HEAVY = ('psycopg2', 'boto3', 'botocore', 'PIL', 'pypdfium2')
+OPTIONAL = ('orjson', 'brotli', 'PIL', 'pypdfium2')
+
+PROBE = """
+import json, sys
+import index
+paths = [
+    {'httpMethod': 'OPTIONS', 'headers': {}},
+    {'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': {'action': 'me'}},
+]
+codes = [index.handler(e, None)['statusCode'] for e in paths]
+heavy = sorted(m for m in %r if m in sys.modules)
+print(json.dumps({'codes': codes, 'heavy': heavy}))
+""" % (HEAVY,)
+
+
+def probe(func_dir):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=func_dir, capture_output=True, text=True, check=True
+    )
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == 'index':
+            cumulative_us = int(fields[1])
+    return cumulative_us, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rows = []
+    for name in sorted(os.listdir(BACKEND)):
+        func_dir = os.path.join(BACKEND, name)
+        if not os.path.isfile(os.path.join(func_dir, 'index.py')):
+            continue
+        samples = []
+        for _ in range(n):
+            cumulative_us, result = probe(func_dir)
+            samples.append(cumulative_us / 1000)
+        rows.append((name, statistics.median(samples), result['codes'], result['heavy']))
+
+    lines = [
+        '# Время импорта функций',
+        '',
+        'Генерируется `python benchmarks/import_time.py`; медиана %d запусков `python -X importtime`, '
+        'Python %s.' % (n, sys.version.split()[0]),
+        'Установленные необязательные зависимости: %s (orjson и brotli импортируются при загрузке модуля, '
+        'Pillow и pypdfium2 — только при построении превью).' % (
+            ', '.join(m for m in OPTIONAL if importlib.util.find_spec(m)) or 'нет'),
+        'Колонка «тяжёлые модули» — что оказалось в `sys.modules` после OPTIONS и запроса без токена.',
+        '',
+        '| Функция | import index, мс | коды OPTIONS / без токена | тяжёлые модули |',
+        '| --- | ---: | --- | --- |',
+    ]
+    for name, ms, codes, heavy in rows:
+        lines.append('| %s | %.2f | %s | %s |' % (name, ms, ' / '.join(map(str, codes)), ', '.join(heavy) or '—'))
+    with open(REPORT, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print('\n'.join(lines))
+
+
+if __name__ == '__main__':
+    main()
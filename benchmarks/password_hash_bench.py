@@ -0,0 +1,76 @@
+"""Подбор стоимости scrypt для auth-api под целевую задержку проверки пароля.
+
+Для каждого N проверяет пароль через verify_password функции в C параллельных потоках
+(hashlib.scrypt отпускает GIL, так что потоки конкурируют за CPU и память как параллельные
+входы в одном контейнере) и печатает p50/p95, пропускную способность и память на проверку.
+Рекомендуется наибольшее N, у которого p95 укладывается в цель и память C проверок — в лимит.
+
+Запуск: python benchmarks/password_hash_bench.py [target_ms] [concurrency] [memory_mb] [N]
+Найденное значение задаётся функции через PASSWORD_SCRYPT_N (r и p — PASSWORD_SCRYPT_R/_P).
+"""
+import concurrent.futures
+import importlib.util
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_function(name):
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(auth, stored, concurrency, total):
+    def one(_):
+        start = time.perf_counter()
+        ok, _ = auth.verify_password('correct horse battery staple', stored)
+        assert ok
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = sorted(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    return statistics.median(samples), p95, total / elapsed
+
+
+def main():
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    memory_mb = float(sys.argv[3]) if len(sys.argv) > 3 else 128
+    total = int(sys.argv[4]) if len(sys.argv) > 4 else concurrency * 5
+    auth = load_function('auth-api')
+    r, p = auth.SCRYPT_R, auth.SCRYPT_P
+
+    print('цель p95 <= %.0f ms, параллельно %d, память %.0f MB, r=%d p=%d'
+          % (target_ms, concurrency, memory_mb, r, p))
+    print('%8s %10s %10s %10s %12s' % ('N', 'p50 ms', 'p95 ms', 'логин/с', 'MB на C'))
+    best = None
+    for log_n in range(12, 19):
+        n = 2 ** log_n
+        auth.SCRYPT_N = n
+        stored = auth.hash_password('correct horse battery staple')
+        mem = 128 * n * r * concurrency / (1024 * 1024)
+        if mem > memory_mb:
+            print('%8d %10s %10s %10s %12.0f  память' % (n, '-', '-', '-', mem))
+            break
+        p50, p95, rate = run(auth, stored, concurrency, total)
+        print('%8d %10.1f %10.1f %10.1f %12.0f' % (n, p50, p95, rate, mem))
+        if p95 > target_ms:
+            break
+        best = n
+    if best:
+        print('\nрекомендуется PASSWORD_SCRYPT_N=%d' % best)
+    else:
+        print('\nдаже N=4096 не укладывается в цель — увеличьте цель или уменьшите параллельность')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Сериализация и сжатие тел ответов на типичных объёмах данных.
+
+Сравнивает json.dumps с orjson и gzip/brotli на разных уровнях для списков задач,
+документов с текстом и отчёта с rows_data. База и сеть не нужны: данные синтетические,
+сериализатор и compress_response берутся из tasks-api.
+
+Запуск: python benchmarks/response_bench.py [N]
+"""
+import base64
+import gzip
+import importlib.util
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ('письмо договор согласование заявка отчёт услуга оплата срок исполнитель проверка '
+         'документ приказ справка архив подпись реестр направить подготовить получить').split()
+
+
+def load_function(name):
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def tasks_payload(rng, count):
+    return [{
+        'id': '%032x' % rng.getrandbits(128),
+        'title': text(rng, 5),
+        'description': text(rng, 30),
+        'priority': rng.choice(('high', 'medium', 'low')),
+        'status': rng.choice(('active', 'completed', 'archived')),
+        'dueDate': '2024-05-%02dT12:00:00+00:00' % rng.randint(1, 28),
+        'createdAt': '2024-04-%02dT09:30:00+00:00' % rng.randint(1, 28),
+        'completedAt': None,
+    } for _ in range(count)]
+
+
+def documents_payload(rng, count):
+    return [{
+        'id': '%032x' % rng.getrandbits(128),
+        'title': text(rng, 6),
+        'content': '\n'.join(text(rng, 40) for _ in range(8)),
+        'category': rng.choice(('letters', 'internal', 'other')),
+        'createdAt': '2024-04-01T09:30:00+00:00',
+        'updatedAt': '2024-04-02T09:30:00+00:00',
+    } for _ in range(count)]
+
+
+def report_payload(rng, rows):
+    return {
+        'id': 1,
+        'employee_name': 'Иванов Иван Иванович',
+        'report_year': 2024,
+        'report_month': 5,
+        'rows_data': [{
+            'serviceName': text(rng, 4),
+            'operation': text(rng, 3),
+            'group': rng.choice(('А', 'Б', 'В')),
+            'executor': 'Петров П. П.',
+            'unit': 'шт.',
+            'result': str(rng.randint(1, 500)),
+            'comment': text(rng, 8),
+        } for _ in range(rows)],
+    }
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    tasks = load_function('tasks-api')
+    rng = random.Random(42)
+    payloads = [
+        ('tasks x50', tasks_payload(rng, 50)),
+        ('tasks x500', tasks_payload(rng, 500)),
+        ('documents x100', documents_payload(rng, 100)),
+        ('report 300 rows', report_payload(rng, 300)),
+    ]
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    print('orjson: %s, brotli: %s' % (
+        'yes' if tasks.orjson is not None else 'no', 'yes' if brotli is not None else 'no'))
+    print()
+    print('| Ответ | json.dumps | dumps() | Размер | gzip 1 | gzip 5 | gzip 9 | br 5 | br 11 |')
+    print('| --- | --- | --- | --- | --- | --- | --- | --- | --- |')
+    for label, payload in payloads:
+        stdlib_ms, _ = timed(lambda: json.dumps(payload), n)
+        fast_ms, body = timed(lambda: tasks.dumps(payload), n)
+        raw = body.encode()
+        cells = []
+        for level in (1, 5, 9):
+            ms, data = timed(lambda: gzip.compress(raw, compresslevel=level), n)
+            cells.append('%.1f KB / %.2f ms' % (len(data) / 1024, ms))
+        for quality in (5, 11):
+            if brotli is None:
+                cells.append('—')
+                continue
+            ms, data = timed(lambda: brotli.compress(raw, quality=quality), n)
+            cells.append('%.1f KB / %.2f ms' % (len(data) / 1024, ms))
+        print('| %s | %.2f ms | %.2f ms | %.1f KB | %s |' % (
+            label, stdlib_ms, fast_ms, len(raw) / 1024, ' | '.join(cells)))
+
+    print()
+    event = {'headers': {'Accept-Encoding': 'gzip, deflate, br'}}
+    for label, payload in payloads:
+        response = {'statusCode': 200, 'headers': tasks.CORS_HEADERS, 'body': tasks.dumps(payload)}
+        ms, result = timed(lambda: tasks.compress_response(event, response), n)
+        wire = len(base64.b64decode(result['body'])) if result.get('isBase64Encoded') else len(result['body'])
+        print('compress_response %-16s %-5s %8.1f KB -> %8.1f KB  %6.2f ms' % (
+            label, result['headers'].get('Content-Encoding', '-'),
+            len(response['body'].encode()) / 1024, wire / 1024, ms))
+
+
+if __name__ == '__main__':
+    main()
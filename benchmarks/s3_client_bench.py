@@ -0,0 +1,74 @@
+"""Стоимость создания S3-клиента: импорт boto3, первый и повторные вызовы get_s3().
+
+Сравнивает создание нового клиента на каждый вызов (как было) с кешированным клиентом
+модуля функции. Сеть не нужна: измеряется только построение клиента.
+
+Запуск: python benchmarks/s3_client_bench.py [files-api|paid-services-api] [N]
+"""
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_function(name):
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def import_time_ms():
+    out = subprocess.check_output([
+        sys.executable, '-c',
+        'import time; t = time.perf_counter(); import boto3; print((time.perf_counter() - t) * 1000)'
+    ])
+    return float(out)
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else 'files-api'
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+
+    print('import boto3 (fresh interpreter): %8.2f ms' % import_time_ms())
+
+    import boto3
+    module = load_function(name)
+
+    fresh = []
+    for _ in range(n):
+        start = time.perf_counter()
+        boto3.client(
+            's3',
+            endpoint_url=module.S3_ENDPOINT_URL,
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+        fresh.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    module.get_s3()
+    first = (time.perf_counter() - start) * 1000
+
+    cached = []
+    for _ in range(n):
+        start = time.perf_counter()
+        module.get_s3()
+        cached.append((time.perf_counter() - start) * 1000)
+
+    print('new client per call (before): p50=%8.2f ms  mean=%8.2f ms'
+          % (statistics.median(fresh), statistics.mean(fresh)))
+    print('get_s3() first call:               %8.2f ms' % first)
+    print('get_s3() cached calls (after):  p50=%8.4f ms  mean=%8.4f ms'
+          % (statistics.median(cached), statistics.mean(cached)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Проверка токена: HMAC на каждый запрос против LRU проверенных токенов, me из claims против БД.
+
+Кеш живёт в модуле функции (тёплый контейнер) и хранит token -> (user_id, expires).
+Инвалидация: запись живёт до истечения срока токена (TOKEN_TTL) и вытесняется при
+переполнении TOKEN_CACHE_SIZE; отрицательные результаты не кешируются. Отзыва токенов
+в системе нет, а AUTH_SECRET и так читается один раз на контейнер, поэтому кеш не
+продлевает жизнь ни одному токену. me из claims отдаёт email и имя на момент входа;
+auth-api?action=me&fresh=1 читает пользователя из БД.
+
+Запуск: python benchmarks/token_cache_bench.py [N]
+        DATABASE_URL=postgres://... — дополнительно замерить me через БД
+"""
+import importlib.util
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_function(name):
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(label, fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000 * 1000)
+    samples.sort()
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print('%-34s p50=%8.2f us  p95=%8.2f us  mean=%8.2f us'
+          % (label, statistics.median(samples), p95, statistics.mean(samples)))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    auth = load_function('auth-api')
+    tasks = load_function('tasks-api')
+    user = {'id': 'a1b2c3d4-e5f', 'email': 'user@example.com', 'name': 'Иван Петров'}
+    token = auth.create_token(user)
+
+    def uncached():
+        tasks._TOKEN_CACHE.clear()
+        tasks.verify_token(token)
+
+    measure('verify_token без кеша', uncached, n)
+    tasks.verify_token(token)
+    measure('verify_token из кеша', lambda: tasks.verify_token(token), n)
+
+    tokens = [auth.create_token(dict(user, id='u%011d' % i)) for i in range(tasks.TOKEN_CACHE_SIZE * 2)]
+    position = [0]
+
+    def churn():
+        tasks.verify_token(tokens[position[0] % len(tokens)])
+        position[0] += 1
+
+    measure('verify_token, кеш переполнен', churn, n)
+    print('записей в кеше: %d из %d' % (len(tasks._TOKEN_CACHE), tasks.TOKEN_CACHE_SIZE))
+
+    event = {'httpMethod': 'GET', 'queryStringParameters': {'action': 'me'},
+             'headers': {'X-Authorization': 'Bearer ' + token}}
+    measure('auth-api me из claims', lambda: auth.handler(event, None), n)
+
+    if os.environ.get('DATABASE_URL'):
+        fresh = dict(event, queryStringParameters={'action': 'me', 'fresh': '1'})
+        measure('auth-api me через БД', lambda: auth.handler(fresh, None), max(1, n // 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+CREATE INDEX IF NOT EXISTS idx_tasks_user_status_created
+  ON tasks(user_id, status, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_user_created
+  ON tasks(user_id, created_at DESC, id DESC);
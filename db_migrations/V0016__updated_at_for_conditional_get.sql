@@ -0,0 +1,14 @@
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+UPDATE tasks SET updated_at = COALESCE(completed_at, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_user_updated ON tasks(user_id, updated_at);
+
+CREATE INDEX IF NOT EXISTS idx_documents_user_updated
+  ON t_p54371197_task_manager_creatio.documents(user_id, updated_at);
+CREATE INDEX IF NOT EXISTS idx_recipients_user_updated
+  ON t_p54371197_task_manager_creatio.recipients(user_id, updated_at);
+
+CREATE INDEX IF NOT EXISTS idx_reports_period_updated ON reports(report_year, report_month, updated_at);
+
+ALTER TABLE service_catalog ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+ALTER TABLE applicants ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+ALTER TABLE service_tags ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
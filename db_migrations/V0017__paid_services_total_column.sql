@@ -0,0 +1,15 @@
+CREATE OR REPLACE FUNCTION paid_service_extra_total(costs JSONB) RETURNS NUMERIC
+LANGUAGE SQL IMMUTABLE AS $$
+  SELECT COALESCE(SUM(COALESCE(NULLIF(e->>'amount', '')::NUMERIC, 0)), 0)
+  FROM jsonb_array_elements(CASE WHEN jsonb_typeof(costs) = 'array' THEN costs ELSE '[]'::jsonb END) e
+$$;
+
+ALTER TABLE paid_services
+  ADD COLUMN IF NOT EXISTS total NUMERIC(14,2) GENERATED ALWAYS AS (
+    CASE WHEN is_fixed_price THEN COALESCE(fixed_price, 0) ELSE hours * hourly_rate END
+    + paid_service_extra_total(extra_costs)
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_paid_services_created ON paid_services(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_paid_services_service_date ON paid_services(service_date);
+CREATE INDEX IF NOT EXISTS idx_paid_services_status ON paid_services(status);
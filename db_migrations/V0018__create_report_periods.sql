@@ -0,0 +1,16 @@
+CREATE TABLE IF NOT EXISTS report_periods (
+  report_year INTEGER NOT NULL,
+  report_month INTEGER NOT NULL,
+  reports_count INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (report_year, report_month)
+);
+
+INSERT INTO report_periods (report_year, report_month, reports_count, updated_at)
+SELECT report_year, report_month, COUNT(*), COALESCE(MAX(updated_at), NOW())
+FROM reports
+GROUP BY report_year, report_month
+ON CONFLICT (report_year, report_month) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_reports_period_employee
+  ON reports(report_year, report_month, employee_name, id);
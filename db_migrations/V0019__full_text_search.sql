@@ -0,0 +1,37 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION t_p54371197_task_manager_creatio.search_join(arr TEXT[])
+RETURNS TEXT LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT coalesce(array_to_string(arr, ' '), '')
+$$;
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, '')), 'D')
+  ) STORED;
+CREATE INDEX IF NOT EXISTS idx_tasks_search ON tasks USING gin(search_vector);
+
+ALTER TABLE t_p54371197_task_manager_creatio.documents ADD COLUMN IF NOT EXISTS search_vector tsvector
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(content, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(content, '')), 'D')
+  ) STORED;
+CREATE INDEX IF NOT EXISTS idx_documents_search
+  ON t_p54371197_task_manager_creatio.documents USING gin(search_vector);
+
+ALTER TABLE t_p54371197_task_manager_creatio.recipients ADD COLUMN IF NOT EXISTS search_vector tsvector
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(full_name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(organization, '') || ' ' || coalesce(position, '')), 'B') ||
+    setweight(to_tsvector('simple',
+      coalesce(full_name, '') || ' ' ||
+      t_p54371197_task_manager_creatio.search_join(emails)), 'C')
+  ) STORED;
+CREATE INDEX IF NOT EXISTS idx_recipients_search
+  ON t_p54371197_task_manager_creatio.recipients USING gin(search_vector);
+
+CREATE INDEX IF NOT EXISTS idx_recipients_full_name_trgm
+  ON t_p54371197_task_manager_creatio.recipients USING gin(lower(full_name) gin_trgm_ops);
@@ -0,0 +1,2 @@
+CREATE INDEX IF NOT EXISTS idx_documents_user_category_updated
+  ON t_p54371197_task_manager_creatio.documents(user_id, category, updated_at DESC, id DESC);
@@ -0,0 +1,22 @@
+CREATE TABLE IF NOT EXISTS t_p54371197_task_manager_creatio.sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    resource VARCHAR(20) NOT NULL,
+    record_id TEXT NOT NULL,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_resource_deleted
+  ON t_p54371197_task_manager_creatio.sync_tombstones(user_id, resource, deleted_at);
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted
+  ON t_p54371197_task_manager_creatio.sync_tombstones(deleted_at);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_user_updated_id ON tasks(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_documents_user_updated_id
+  ON t_p54371197_task_manager_creatio.documents(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_recipients_user_updated_id
+  ON t_p54371197_task_manager_creatio.recipients(user_id, updated_at, id);
+
+DROP INDEX IF EXISTS idx_tasks_user_updated;
+DROP INDEX IF EXISTS t_p54371197_task_manager_creatio.idx_documents_user_updated;
+DROP INDEX IF EXISTS t_p54371197_task_manager_creatio.idx_recipients_user_updated;
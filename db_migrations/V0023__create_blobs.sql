@@ -0,0 +1,20 @@
+CREATE TABLE IF NOT EXISTS t_p54371197_task_manager_creatio.blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    s3_key TEXT NOT NULL,
+    cdn_url TEXT NOT NULL,
+    file_size BIGINT NOT NULL DEFAULT 0,
+    content_type TEXT NOT NULL DEFAULT 'application/octet-stream',
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    unreferenced_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced
+  ON t_p54371197_task_manager_creatio.blobs(unreferenced_at) WHERE ref_count <= 0;
+
+ALTER TABLE t_p54371197_task_manager_creatio.attachments
+  ADD COLUMN IF NOT EXISTS blob_sha256 CHAR(64) NULL;
+
+ALTER TABLE paid_services
+  ADD COLUMN IF NOT EXISTS contract_draft_sha256 CHAR(64) NULL,
+  ADD COLUMN IF NOT EXISTS contract_final_sha256 CHAR(64) NULL;
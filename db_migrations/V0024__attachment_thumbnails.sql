@@ -0,0 +1,5 @@
+ALTER TABLE t_p54371197_task_manager_creatio.attachments
+  ADD COLUMN IF NOT EXISTS thumb_url TEXT NULL;
+
+ALTER TABLE t_p54371197_task_manager_creatio.blobs
+  ADD COLUMN IF NOT EXISTS thumb_url TEXT NULL;
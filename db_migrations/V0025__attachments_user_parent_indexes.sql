@@ -0,0 +1,6 @@
+CREATE INDEX IF NOT EXISTS idx_attachments_user_task
+  ON t_p54371197_task_manager_creatio.attachments (user_id, task_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_attachments_user_doc
+  ON t_p54371197_task_manager_creatio.attachments (user_id, doc_id, created_at DESC)
+  WHERE doc_id IS NOT NULL;
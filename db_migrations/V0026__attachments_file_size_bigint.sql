@@ -0,0 +1,2 @@
+ALTER TABLE t_p54371197_task_manager_creatio.attachments
+  ALTER COLUMN file_size TYPE BIGINT;
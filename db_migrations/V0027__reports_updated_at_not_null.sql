@@ -0,0 +1,3 @@
+UPDATE reports SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+ALTER TABLE reports ALTER COLUMN updated_at SET DEFAULT NOW();
+ALTER TABLE reports ALTER COLUMN updated_at SET NOT NULL;
@@ -0,0 +1,3 @@
+ALTER TABLE t_p54371197_task_manager_creatio.attachments
+  ADD COLUMN IF NOT EXISTS thumb_attempts SMALLINT NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS thumb_error TEXT NULL;
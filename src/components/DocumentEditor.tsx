@@ -7,6 +7,7 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle } from "@/components/u
 import { Checkbox } from "@/components/ui/checkbox";
 import { Tabs, TabsList, TabsTrigger, TabsContent } from "@/components/ui/tabs";
 import Icon from "@/components/ui/icon";
+import { toast } from "sonner";
 import type { Document, DocCategory, Recipient, DocAttachment } from "@/lib/documents-store";
 import {
   CATEGORY_LABELS,
@@ -227,8 +228,11 @@ function DocFiles({ docId }: { docId: string }) {
     for (let i = 0; i < list.length; i++) {
       const f = list[i];
       if (f.size > MAX_FILE_SIZE) continue;
-      const att = await uploadDocAttachment(docId, f);
-      added.push(att);
+      try {
+        added.push(await uploadDocAttachment(docId, f));
+      } catch {
+        toast.error(`Не удалось загрузить «${f.name}»`);
+      }
     }
     setFiles((prev) => [...added, ...prev]);
     setUploading(false);
@@ -272,8 +276,12 @@ function DocFiles({ docId }: { docId: string }) {
         <div className="space-y-1.5">
           {files.map((file) => (
             <div key={file.id} className="flex items-center gap-2.5 p-2.5 rounded-md border bg-muted/20 hover:bg-muted/40 transition-colors group">
-              <div className="shrink-0 w-8 h-8 rounded flex items-center justify-center bg-background border">
-                <Icon name={getFileIcon(file.contentType)} size={15} className="text-muted-foreground" />
+              <div className="shrink-0 w-8 h-8 rounded overflow-hidden flex items-center justify-center bg-background border">
+                {file.thumbUrl ? (
+                  <img src={file.thumbUrl} alt={file.fileName} loading="lazy" className="w-full h-full object-cover" />
+                ) : (
+                  <Icon name={getFileIcon(file.contentType)} size={15} className="text-muted-foreground" />
+                )}
               </div>
               <div className="flex-1 min-w-0">
                 <a href={file.cdnUrl} target="_blank" rel="noopener noreferrer"
@@ -5,11 +5,20 @@ import { Input } from "@/components/ui/input";
 import Icon from "@/components/ui/icon";
 import DocumentEditor from "./DocumentEditor";
 import RecipientsTable from "./RecipientsTable";
-import type { Document, DocCategory } from "@/lib/documents-store";
-import { fetchDocuments, deleteDocument, CATEGORY_LABELS } from "@/lib/documents-store";
+import type { Document, DocumentSummary, DocCategory } from "@/lib/documents-store";
+import {
+  fetchDocumentList,
+  searchDocuments,
+  fetchDocument,
+  deleteDocument,
+  toDocumentSummary,
+  CATEGORY_LABELS,
+} from "@/lib/documents-store";
 
 type DocTab = DocCategory | "recipients";
 
+const SEARCH_DEBOUNCE_MS = 300;
+
 const CATEGORY_ICONS: Record<DocCategory, string> = {
   letters: "Mail",
   internal: "Building2",
@@ -25,41 +34,95 @@ function DocList({
   onEdit,
 }: {
   category: DocCategory;
-  onEdit: (doc: Document) => void;
+  onEdit: (doc: DocumentSummary) => void;
 }) {
-  const [docs, setDocs] = useState<Document[]>([]);
+  const [docs, setDocs] = useState<DocumentSummary[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [search, setSearch] = useState("");
+  const [query, setQuery] = useState("");
+  const [found, setFound] = useState<DocumentSummary[]>([]);
+  const [nextOffset, setNextOffset] = useState<number | null>(null);
+  const [searching, setSearching] = useState(false);
   const [editorOpen, setEditorOpen] = useState(false);
 
   useEffect(() => {
     setLoading(true);
-    fetchDocuments(category).then((data) => {
-      setDocs(data);
+    fetchDocumentList(category).then((page) => {
+      setDocs(page.items);
+      setNextCursor(page.nextCursor);
       setLoading(false);
     });
   }, [category]);
 
+  useEffect(() => {
+    const timer = setTimeout(() => setQuery(search.trim()), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [search]);
+
+  useEffect(() => {
+    if (!query) {
+      setFound([]);
+      setNextOffset(null);
+      setSearching(false);
+      return;
+    }
+    let cancelled = false;
+    setSearching(true);
+    searchDocuments(query, category)
+      .then((page) => {
+        if (cancelled) return;
+        setFound(page.items);
+        setNextOffset(page.nextOffset);
+      })
+      .catch(() => {
+        if (!cancelled) setFound([]);
+      })
+      .finally(() => {
+        if (!cancelled) setSearching(false);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [query, category]);
+
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    try {
+      if (query) {
+        if (nextOffset !== null) {
+          const page = await searchDocuments(query, category, nextOffset);
+          setFound((prev) => [...prev, ...page.items]);
+          setNextOffset(page.nextOffset);
+        }
+      } else if (nextCursor) {
+        const page = await fetchDocumentList(category, nextCursor);
+        setDocs((prev) => [...prev, ...page.items]);
+        setNextCursor(page.nextCursor);
+      }
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDelete = async (id: string) => {
     await deleteDocument(id);
     setDocs((prev) => prev.filter((d) => d.id !== id));
+    setFound((prev) => prev.filter((d) => d.id !== id));
   };
 
   const handleSaved = (doc: Document) => {
+    const summary = toDocumentSummary(doc);
     setDocs((prev) => {
       const exists = prev.find((d) => d.id === doc.id);
-      if (exists) return prev.map((d) => (d.id === doc.id ? doc : d));
-      return [doc, ...prev];
+      if (exists) return prev.map((d) => (d.id === doc.id ? summary : d));
+      return [summary, ...prev];
     });
   };
 
-  const filtered = search
-    ? docs.filter(
-        (d) =>
-          d.title.toLowerCase().includes(search.toLowerCase()) ||
-          d.content.toLowerCase().includes(search.toLowerCase())
-      )
-    : docs;
+  const filtered = query ? found : docs;
+  const hasMore = query ? nextOffset !== null : nextCursor !== null;
 
   return (
     <div className="space-y-4">
@@ -79,7 +142,7 @@ function DocList({
         </Button>
       </div>
 
-      {loading ? (
+      {loading || searching ? (
         <div className="flex justify-center py-10">
           <Icon name="Loader2" size={28} className="animate-spin text-muted-foreground" />
         </div>
@@ -116,10 +179,17 @@ function DocList({
                     {formatDate(doc.updatedAt)}
                   </span>
                 </div>
-                {doc.content && (
-                  <p className="text-xs text-muted-foreground mt-0.5 line-clamp-2 whitespace-pre-wrap">
-                    {doc.content}
-                  </p>
+                {doc.highlight ? (
+                  <p
+                    className="text-xs text-muted-foreground mt-0.5 line-clamp-2"
+                    dangerouslySetInnerHTML={{ __html: doc.highlight }}
+                  />
+                ) : (
+                  doc.excerpt && (
+                    <p className="text-xs text-muted-foreground mt-0.5 line-clamp-2">
+                      {doc.excerpt}
+                    </p>
+                  )
                 )}
               </div>
               <div className="flex gap-1 shrink-0 opacity-0 group-hover:opacity-100 transition-opacity">
@@ -138,6 +208,18 @@ function DocList({
               </div>
             </div>
           ))}
+          {hasMore && (
+            <Button
+              variant="ghost"
+              size="sm"
+              className="w-full gap-1.5"
+              onClick={handleLoadMore}
+              disabled={loadingMore}
+            >
+              {loadingMore && <Icon name="Loader2" size={14} className="animate-spin" />}
+              Показать ещё
+            </Button>
+          )}
         </div>
       )}
 
@@ -156,8 +238,10 @@ export default function DocumentsPage() {
   const [editingDoc, setEditingDoc] = useState<Document | null>(null);
   const [editorOpen, setEditorOpen] = useState(false);
 
-  const handleEdit = (doc: Document) => {
-    setEditingDoc(doc);
+  const handleEdit = async (doc: DocumentSummary) => {
+    const full = await fetchDocument(doc.id).catch(() => null);
+    if (!full) return;
+    setEditingDoc(full);
     setEditorOpen(true);
   };
 
@@ -166,7 +250,7 @@ export default function DocumentsPage() {
     setEditingDoc(null);
     // DocList компонент сам перезагрузится при следующем открытии вкладки
     // Принудительно обновить — перемонтировать через key нельзя, поэтому просто закрываем редактор
-    // Данные актуализируются при следующем fetchDocuments
+    // Данные актуализируются при следующем fetchDocumentList
   };
 
   return (
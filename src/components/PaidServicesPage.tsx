@@ -29,22 +29,25 @@ export default function PaidServicesPage() {
 
   const loadAll = useCallback(async () => {
     setLoading(true);
-    const headers = authHeaders();
-    const [sRes, cRes, aRes, tRes] = await Promise.all([
-      fetch(API, { headers }),
-      fetch(`${API}/catalog`, { headers }),
-      fetch(`${API}/applicants`, { headers }),
-      fetch(`${API}/tags`, { headers }),
-    ]);
-    if (sRes.ok) setServices(await sRes.json());
-    if (cRes.ok) setCatalog(await cRes.json());
-    if (aRes.ok) setApplicants(await aRes.json());
-    if (tRes.ok) setTags(await tRes.json());
+    const res = await fetch(`${API}/bootstrap`, { headers: authHeaders() });
+    if (res.ok) {
+      const data = await res.json();
+      setServices(data.services);
+      setCatalog(data.catalog);
+      setApplicants(data.applicants);
+      setTags(data.tags);
+    }
     setLoading(false);
   }, []);
 
   useEffect(() => { loadAll(); }, [loadAll]);
 
+  // После правки справочника перечитывается только он: ответ идёт из кеша функции и по ETag
+  const reloadDirectory = async <T,>(name: "catalog" | "applicants" | "tags", set: (items: T[]) => void) => {
+    const res = await fetch(`${API}/${name}`, { headers: authHeaders() });
+    if (res.ok) set(await res.json());
+  };
+
   const reloadServices = async () => {
     const res = await fetch(API, { headers: authHeaders() });
     if (res.ok) setServices(await res.json());
@@ -148,26 +151,17 @@ export default function PaidServicesPage() {
 
         {/* ── CATALOG TAB ─────────────────────────────────────────────────── */}
         <TabsContent value="catalog" className="mt-4">
-          <CatalogManager catalog={catalog} onRefresh={async () => {
-            const res = await fetch(`${API}/catalog`, { headers: authHeaders() });
-            if (res.ok) setCatalog(await res.json());
-          }} />
+          <CatalogManager catalog={catalog} onRefresh={() => reloadDirectory("catalog", setCatalog)} />
         </TabsContent>
 
         {/* ── APPLICANTS TAB ──────────────────────────────────────────────── */}
         <TabsContent value="applicants" className="mt-4">
-          <ApplicantsManager applicants={applicants} onRefresh={async () => {
-            const res = await fetch(`${API}/applicants`, { headers: authHeaders() });
-            if (res.ok) setApplicants(await res.json());
-          }} />
+          <ApplicantsManager applicants={applicants} onRefresh={() => reloadDirectory("applicants", setApplicants)} />
         </TabsContent>
 
         {/* ── TAGS TAB ────────────────────────────────────────────────────── */}
         <TabsContent value="tags" className="mt-4">
-          <TagsManager tags={tags} onRefresh={async () => {
-            const res = await fetch(`${API}/tags`, { headers: authHeaders() });
-            if (res.ok) setTags(await res.json());
-          }} />
+          <TagsManager tags={tags} onRefresh={() => reloadDirectory("tags", setTags)} />
         </TabsContent>
       </Tabs>
 
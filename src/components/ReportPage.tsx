@@ -5,7 +5,9 @@ import { authHeaders } from "@/lib/auth";
 import {
   ReportRow,
   SavedReport,
-  ReportsTree,
+  ArchiveYear,
+  ArchiveMonth,
+  ArchiveMonthReports,
   FullReport,
   DEFAULT_ROWS,
   COLUMNS,
@@ -18,6 +20,11 @@ import ReportEditorContent from "./report/ReportEditorContent";
 
 const API = funcUrls["reports-api"];
 
+async function fetchTree<T>(query: string): Promise<T | null> {
+  const res = await fetch(`${API}/tree${query}`, { headers: await authHeaders() });
+  return res.ok ? res.json() : null;
+}
+
 // ─── Main component ────────────────────────────────────────────────────────────
 export default function ReportPage() {
   // Current report data
@@ -31,8 +38,10 @@ export default function ReportPage() {
   // View mode
   const [viewMode, setViewMode] = useState<"table" | "form">("table");
 
-  // Archive tree
-  const [tree, setTree] = useState<ReportsTree>({});
+  // Archive tree: уровни подгружаются при раскрытии
+  const [years, setYears] = useState<ArchiveYear[]>([]);
+  const [monthsByYear, setMonthsByYear] = useState<Record<string, ArchiveMonth[]>>({});
+  const [reportsByMonth, setReportsByMonth] = useState<Record<string, ArchiveMonthReports>>({});
   const [expandedYears, setExpandedYears] = useState<Set<string>>(new Set());
   const [expandedMonths, setExpandedMonths] = useState<Set<string>>(new Set());
 
@@ -47,20 +56,55 @@ export default function ReportPage() {
   const [addEmployeeOpen, setAddEmployeeOpen] = useState(false);
   const [newEmployeeName, setNewEmployeeName] = useState("");
 
+  const loadYear = useCallback(async (year: string) => {
+    const months = await fetchTree<ArchiveMonth[]>(`?year=${year}`);
+    if (months) setMonthsByYear((prev) => ({ ...prev, [year]: months }));
+    return months || [];
+  }, []);
+
+  const loadMonth = useCallback(async (treeKey: string, cursor?: string) => {
+    const [year, monthKey] = treeKey.split("-");
+    const query = `?year=${year}&month=${parseInt(monthKey)}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
+    const page = await fetchTree<ArchiveMonthReports>(query);
+    if (!page) return;
+    setReportsByMonth((prev) => ({
+      ...prev,
+      [treeKey]: cursor
+        ? { items: [...(prev[treeKey]?.items || []), ...page.items], nextCursor: page.nextCursor }
+        : page,
+    }));
+  }, []);
+
+  // Первое открытие: годы и первый месяц последнего года
   const loadTree = useCallback(async () => {
-    const res = await fetch(API, { headers: await authHeaders() });
-    if (res.ok) {
-      const data: ReportsTree = await res.json();
-      setTree(data);
-      const years = Object.keys(data);
-      setExpandedYears(new Set(years.slice(0, 1)));
-      if (years.length > 0) {
-        const firstYear = years[0];
-        const months = Object.keys(data[firstYear]);
-        setExpandedMonths(new Set(months.slice(0, 1).map((m) => `${firstYear}-${m}`)));
-      }
+    const data = await fetchTree<ArchiveYear[]>("");
+    if (!data) return;
+    setYears(data);
+    setMonthsByYear({});
+    setReportsByMonth({});
+    if (data.length === 0) return;
+    const firstYear = String(data[0].year);
+    setExpandedYears(new Set([firstYear]));
+    const months = await loadYear(firstYear);
+    if (months.length > 0) {
+      const treeKey = `${firstYear}-${months[0].month}`;
+      setExpandedMonths(new Set([treeKey]));
+      await loadMonth(treeKey);
     }
-  }, []);
+  }, [loadYear, loadMonth]);
+
+  // После сохранения или удаления перечитываются годы и только раскрытые уровни
+  const refreshTree = async () => {
+    const data = await fetchTree<ArchiveYear[]>("");
+    if (!data) return;
+    setYears(data);
+    setMonthsByYear({});
+    setReportsByMonth({});
+    await Promise.all([
+      ...[...expandedYears].map((year) => loadYear(year)),
+      ...[...expandedMonths].map((treeKey) => loadMonth(treeKey)),
+    ]);
+  };
 
   useEffect(() => { loadTree(); }, [loadTree]);
 
@@ -124,7 +168,7 @@ export default function ReportPage() {
         setCurrentId(data.id);
       }
       setSaveMessage("Сохранено!");
-      await loadTree();
+      await refreshTree();
     } else {
       setSaveMessage("Ошибка сохранения");
     }
@@ -136,7 +180,7 @@ export default function ReportPage() {
   const deleteReport = async (id: number) => {
     await fetch(`${API}/${id}`, { method: "DELETE", headers: await authHeaders() });
     if (currentId === id) newReport();
-    await loadTree();
+    await refreshTree();
   };
 
   // Export single employee report to Excel
@@ -226,6 +270,7 @@ export default function ReportPage() {
   };
 
   const toggleYear = (year: string) => {
+    if (!expandedYears.has(year) && !monthsByYear[year]) loadYear(year);
     setExpandedYears((prev) => {
       const s = new Set(prev);
       if (s.has(year)) { s.delete(year); } else { s.add(year); }
@@ -234,6 +279,7 @@ export default function ReportPage() {
   };
 
   const toggleMonth = (key: string) => {
+    if (!expandedMonths.has(key) && !reportsByMonth[key]) loadMonth(key);
     setExpandedMonths((prev) => {
       const s = new Set(prev);
       if (s.has(key)) { s.delete(key); } else { s.add(key); }
@@ -254,7 +300,9 @@ export default function ReportPage() {
     <div className="flex gap-4 h-full">
       {/* ── Боковая панель — архив отчётов ─────────────────────────────────── */}
       <ReportArchiveSidebar
-        tree={tree}
+        years={years}
+        monthsByYear={monthsByYear}
+        reportsByMonth={reportsByMonth}
         currentId={currentId}
         expandedYears={expandedYears}
         expandedMonths={expandedMonths}
@@ -264,6 +312,7 @@ export default function ReportPage() {
         onDeleteReport={deleteReport}
         onToggleYear={toggleYear}
         onToggleMonth={toggleMonth}
+        onLoadMoreReports={(treeKey, cursor) => loadMonth(treeKey, cursor)}
         onExportDepartmentExcel={exportDepartmentExcel}
         onOpenAddEmployee={handleOpenAddEmployee}
       />
@@ -1,6 +1,7 @@
 import { useState, useEffect, useRef } from "react";
 import { Button } from "@/components/ui/button";
 import Icon from "@/components/ui/icon";
+import { toast } from "sonner";
 import type { Attachment } from "@/lib/task-store";
 import {
   fetchAttachments,
@@ -13,11 +14,13 @@ import FilePreview, { isPreviewable } from "./FilePreview";
 
 interface TaskAttachmentsProps {
   taskId: string;
+  // изменение числа и суммарного размера вложений — для счётчика в карточке задачи
+  onChange?: (count: number, totalSize: number) => void;
 }
 
 const MAX_FILE_SIZE = 10 * 1024 * 1024;
 
-export default function TaskAttachments({ taskId }: TaskAttachmentsProps) {
+export default function TaskAttachments({ taskId, onChange }: TaskAttachmentsProps) {
   const [files, setFiles] = useState<Attachment[]>([]);
   const [uploading, setUploading] = useState(false);
   const [loading, setLoading] = useState(true);
@@ -40,17 +43,25 @@ export default function TaskAttachments({ taskId }: TaskAttachmentsProps) {
     for (let i = 0; i < fileList.length; i++) {
       const file = fileList[i];
       if (file.size > MAX_FILE_SIZE) continue;
-      const att = await uploadAttachment(taskId, file);
-      newFiles.push(att);
+      try {
+        newFiles.push(await uploadAttachment(taskId, file));
+      } catch {
+        toast.error(`Не удалось загрузить «${file.name}»`);
+      }
     }
     setFiles((prev) => [...newFiles, ...prev]);
+    if (newFiles.length > 0) {
+      onChange?.(newFiles.length, newFiles.reduce((sum, f) => sum + f.fileSize, 0));
+    }
     setUploading(false);
     if (inputRef.current) inputRef.current.value = "";
   };
 
   const handleDelete = async (id: string) => {
     await deleteAttachment(id);
+    const removed = files.find((f) => f.id === id);
     setFiles((prev) => prev.filter((f) => f.id !== id));
+    if (removed) onChange?.(-1, -removed.fileSize);
   };
 
   const handleClick = (file: Attachment) => {
@@ -123,8 +134,10 @@ export default function TaskAttachments({ taskId }: TaskAttachmentsProps) {
                 onClick={() => handleClick(file)}
                 className="shrink-0 w-10 h-10 rounded overflow-hidden flex items-center justify-center bg-background border hover:border-primary/40 transition-colors cursor-pointer"
               >
-                {isImg(file.contentType) ? (
-                  <img src={file.cdnUrl} alt={file.fileName} className="w-full h-full object-cover" />
+                {file.thumbUrl ? (
+                  <img src={file.thumbUrl} alt={file.fileName} loading="lazy" className="w-full h-full object-cover" />
+                ) : isImg(file.contentType) ? (
+                  <img src={file.cdnUrl} alt={file.fileName} loading="lazy" className="w-full h-full object-cover" />
                 ) : (
                   <Icon name={getFileIcon(file.contentType)} size={18} className="text-muted-foreground" />
                 )}
@@ -9,21 +9,31 @@ import {
   DropdownMenuItem,
   DropdownMenuTrigger,
 } from "@/components/ui/dropdown-menu";
-import type { Task } from "@/lib/task-store";
-import { priorityLabels, priorityColors } from "@/lib/task-store";
+import type { Task, AttachmentSummary } from "@/lib/task-store";
+import { priorityLabels, priorityColors, formatFileSize } from "@/lib/task-store";
 import { format, isPast, isToday } from "date-fns";
 import { ru } from "date-fns/locale";
 import TaskAttachments from "./TaskAttachments";
 
 interface TaskCardProps {
   task: Task;
+  attachments?: AttachmentSummary;
+  onAttachmentsChange?: (taskId: string, count: number, totalSize: number) => void;
   onToggle: (id: string) => void;
   onEdit: (task: Task) => void;
   onDelete: (id: string) => void;
   onArchive: (id: string) => void;
 }
 
-export default function TaskCard({ task, onToggle, onEdit, onDelete, onArchive }: TaskCardProps) {
+export default function TaskCard({
+  task,
+  attachments,
+  onAttachmentsChange,
+  onToggle,
+  onEdit,
+  onDelete,
+  onArchive,
+}: TaskCardProps) {
   const [expanded, setExpanded] = useState(false);
 
   const isOverdue =
@@ -91,6 +101,9 @@ export default function TaskCard({ task, onToggle, onEdit, onDelete, onArchive }
             >
               <Icon name="Paperclip" size={12} />
               <span>Файлы</span>
+              {attachments && attachments.count > 0 && (
+                <span title={formatFileSize(attachments.totalSize)}>({attachments.count})</span>
+              )}
               <Icon
                 name="ChevronDown"
                 size={12}
@@ -135,7 +148,10 @@ export default function TaskCard({ task, onToggle, onEdit, onDelete, onArchive }
       {expanded && (
         <div className="px-4 pb-4 pt-0 pl-11 animate-fade-in">
           <div className="border-t pt-3">
-            <TaskAttachments taskId={task.id} />
+            <TaskAttachments
+              taskId={task.id}
+              onChange={(count, totalSize) => onAttachmentsChange?.(task.id, count, totalSize)}
+            />
           </div>
         </div>
       )}
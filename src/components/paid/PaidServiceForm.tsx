@@ -265,22 +265,19 @@ export function FileUploadButton({ serviceId, fileType, currentUrl, onUploaded }
     const file = e.target.files?.[0];
     if (!file) return;
     setUploading(true);
-    const reader = new FileReader();
-    reader.onload = async () => {
-      const base64 = (reader.result as string).split(",")[1];
-      const res = await fetch(`${API}/upload`, {
-        method: "POST",
-        headers: { ...(authHeaders()), "Content-Type": "application/json" },
-        body: JSON.stringify({ serviceId, fileType, fileName: file.name, contentType: file.type, fileData: base64 }),
-      });
-      if (res.ok) {
-        const data = await res.json();
-        onUploaded(data.url);
-      }
-      setUploading(false);
-    };
-    reader.readAsDataURL(file);
     e.target.value = "";
+    // Файл уходит сырым телом — без FileReader и base64 в JSON
+    const query = new URLSearchParams({ serviceId: String(serviceId), fileType, fileName: file.name });
+    const res = await fetch(`${API}/upload?${query}`, {
+      method: "POST",
+      headers: { ...(authHeaders()), "Content-Type": file.type || "application/octet-stream" },
+      body: file,
+    }).catch(() => null);
+    if (res?.ok) {
+      const data = await res.json();
+      onUploaded(data.url);
+    }
+    setUploading(false);
   };
 
   const label = fileType === "draft" ? "Проект договора" : "Итоговый договор";
@@ -1,9 +1,11 @@
 import { Button } from "@/components/ui/button";
 import Icon from "@/components/ui/icon";
-import { MONTH_NAMES, ReportsTree, SavedReport } from "./ReportTypes";
+import { MONTH_NAMES, ArchiveYear, ArchiveMonth, ArchiveMonthReports, SavedReport } from "./ReportTypes";
 
 interface ReportArchiveSidebarProps {
-  tree: ReportsTree;
+  years: ArchiveYear[];
+  monthsByYear: Record<string, ArchiveMonth[]>;
+  reportsByMonth: Record<string, ArchiveMonthReports>;
   currentId: number | null;
   expandedYears: Set<string>;
   expandedMonths: Set<string>;
@@ -13,12 +15,15 @@ interface ReportArchiveSidebarProps {
   onDeleteReport: (id: number) => void;
   onToggleYear: (year: string) => void;
   onToggleMonth: (key: string) => void;
+  onLoadMoreReports: (key: string, cursor: string) => void;
   onExportDepartmentExcel: (year: string, monthKey: string) => void;
   onOpenAddEmployee: (reportsInMonth: SavedReport[]) => void;
 }
 
 export default function ReportArchiveSidebar({
-  tree,
+  years,
+  monthsByYear,
+  reportsByMonth,
   currentId,
   expandedYears,
   expandedMonths,
@@ -28,10 +33,11 @@ export default function ReportArchiveSidebar({
   onDeleteReport,
   onToggleYear,
   onToggleMonth,
+  onLoadMoreReports,
   onExportDepartmentExcel,
   onOpenAddEmployee,
 }: ReportArchiveSidebarProps) {
-  const hasReports = Object.keys(tree).length > 0;
+  const hasReports = years.length > 0;
 
   return (
     <div className="w-60 shrink-0 flex flex-col gap-2">
@@ -51,7 +57,7 @@ export default function ReportArchiveSidebar({
           </div>
         ) : (
           <div className="py-1">
-            {Object.keys(tree).sort((a, b) => Number(b) - Number(a)).map((year) => (
+            {years.map(({ year: yearNum }) => String(yearNum)).map((year) => (
               <div key={year}>
                 {/* Year */}
                 <button
@@ -62,10 +68,17 @@ export default function ReportArchiveSidebar({
                   <span className="text-xs font-bold">{year}</span>
                 </button>
 
-                {expandedYears.has(year) && Object.keys(tree[year]).sort((a, b) => Number(b) - Number(a)).map((monthKey) => {
+                {expandedYears.has(year) && !monthsByYear[year] && (
+                  <div className="pl-6 py-1">
+                    <Icon name="Loader2" size={11} className="animate-spin text-muted-foreground" />
+                  </div>
+                )}
+
+                {expandedYears.has(year) && (monthsByYear[year] || []).map(({ month: monthKey, reports: monthCount }) => {
                   const treeKey = `${year}-${monthKey}`;
                   const monthNum = parseInt(monthKey);
-                  const reportsInMonth = tree[year][monthKey];
+                  const page = reportsByMonth[treeKey];
+                  const reportsInMonth = page?.items || [];
 
                   return (
                     <div key={monthKey}>
@@ -77,7 +90,7 @@ export default function ReportArchiveSidebar({
                         >
                           <Icon name={expandedMonths.has(treeKey) ? "ChevronDown" : "ChevronRight"} size={11} className="text-muted-foreground shrink-0" />
                           <span className="text-[11px] text-muted-foreground">{MONTH_NAMES[monthNum] || monthKey}</span>
-                          <span className="ml-auto text-[10px] text-muted-foreground/60">{reportsInMonth.length}</span>
+                          <span className="ml-auto text-[10px] text-muted-foreground/60">{monthCount}</span>
                         </button>
                         {/* Export department button */}
                         <button
@@ -124,6 +137,22 @@ export default function ReportArchiveSidebar({
                             </div>
                           ))}
 
+                          {!page && (
+                            <div className="pl-9 py-1">
+                              <Icon name="Loader2" size={11} className="animate-spin text-muted-foreground" />
+                            </div>
+                          )}
+
+                          {page?.nextCursor && (
+                            <button
+                              onClick={() => onLoadMoreReports(treeKey, page.nextCursor as string)}
+                              className="w-full flex items-center gap-1.5 pl-9 pr-3 py-1 text-[11px] text-muted-foreground hover:text-primary hover:bg-muted/30 transition-colors"
+                            >
+                              <Icon name="ChevronsDown" size={11} />
+                              Показать ещё
+                            </button>
+                          )}
+
                           {/* Add employee button */}
                           <button
                             onClick={() => onOpenAddEmployee(reportsInMonth)}
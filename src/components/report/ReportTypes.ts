@@ -27,8 +27,24 @@ export interface SavedReport {
   updated_at: string;
 }
 
-// year → monthKey → reports[]
-export type ReportsTree = Record<string, Record<string, SavedReport[]>>;
+// Ленивое дерево архива (GET /tree): годы, месяцы года и страницы отчётов месяца
+export interface ArchiveYear {
+  year: number;
+  months: number;
+  reports: number;
+  updated_at: string | null;
+}
+
+export interface ArchiveMonth {
+  month: string;
+  reports: number;
+  updated_at: string | null;
+}
+
+export interface ArchiveMonthReports {
+  items: SavedReport[];
+  nextCursor: string | null;
+}
 
 // Full report with rows data (for department export)
 export interface FullReport extends SavedReport {
@@ -0,0 +1,98 @@
+import funcUrls from "../../backend/func2url.json";
+import { authHeaders } from "./auth";
+
+const FILES_API = (funcUrls as Record<string, string>)["files-api"];
+
+interface PresignResponse {
+  fileId: string;
+  fileName: string;
+  key: string;
+  uploadUrl?: string;
+  headers?: Record<string, string>;
+  uploadId?: string;
+  partSize?: number;
+  parts?: { partNumber: number; url: string }[];
+}
+
+// Совпадает с MULTIPART_THRESHOLD files-api: контрольную сумму хранилище проверяет только у одиночного PUT
+const HASH_MAX_SIZE = 16 * 1024 * 1024;
+
+// SHA-256 содержимого: хранилище сверяет его с телом PUT, сервер хранит дубликаты одним блобом
+async function sha256Hex(file: File): Promise<string | undefined> {
+  if (file.size > HASH_MAX_SIZE || !crypto?.subtle) return undefined;
+  const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+export class FilesApiError extends Error {
+  constructor(readonly status: number) {
+    super("files-api: " + status);
+  }
+}
+
+// presign недоступен (сеть или ошибка сервера) — только в этом случае можно загрузить файл через функцию
+export class PresignError extends Error {}
+
+async function filesApi<T>(body: Record<string, unknown>): Promise<T> {
+  const res = await fetch(FILES_API, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", ...authHeaders() },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok) throw new FilesApiError(res.status);
+  return res.json();
+}
+
+// Загрузка напрямую в хранилище: presign → PUT (или части multipart) → finalize
+export async function uploadDirect<T>(
+  target: { taskId?: string; docId?: string },
+  file: File
+): Promise<T> {
+  const contentType = file.type || "application/octet-stream";
+  const sha256 = await sha256Hex(file).catch(() => undefined);
+  let presign: PresignResponse;
+  try {
+    presign = await filesApi<PresignResponse>({
+      action: "presign",
+      ...target,
+      fileName: file.name,
+      contentType,
+      fileSize: file.size,
+      sha256,
+    });
+  } catch (e) {
+    // отказ по самому файлу (4xx, например слишком большой) повторять через функцию бессмысленно
+    if (e instanceof FilesApiError && e.status < 500) throw e;
+    throw new PresignError(e instanceof Error ? e.message : String(e));
+  }
+  const base = { ...target, fileId: presign.fileId, fileName: presign.fileName, sha256 };
+
+  if (presign.uploadUrl) {
+    const res = await fetch(presign.uploadUrl, {
+      method: "PUT",
+      headers: presign.headers,
+      body: file,
+    });
+    if (!res.ok) throw new Error("upload: " + res.status);
+    return filesApi<T>({ action: "finalize", ...base });
+  }
+
+  const partSize = presign.partSize || 0;
+  try {
+    const parts = [];
+    for (const part of presign.parts || []) {
+      const start = (part.partNumber - 1) * partSize;
+      const res = await fetch(part.url, {
+        method: "PUT",
+        body: file.slice(start, start + partSize),
+      });
+      const etag = res.headers.get("ETag");
+      if (!res.ok || !etag) throw new Error("upload part: " + res.status);
+      parts.push({ partNumber: part.partNumber, etag });
+    }
+    return await filesApi<T>({ action: "finalize", ...base, uploadId: presign.uploadId, parts });
+  } catch (e) {
+    await filesApi({ action: "abort", ...base, uploadId: presign.uploadId }).catch(() => undefined);
+    throw e;
+  }
+}
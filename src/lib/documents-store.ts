@@ -1,5 +1,6 @@
 import funcUrls from "../../backend/func2url.json";
 import { authHeaders } from "./auth";
+import { PresignError, uploadDirect } from "./direct-upload";
 
 const DOCS_API = (funcUrls as Record<string, string>)["documents-api"];
 const RCPT_API = (funcUrls as Record<string, string>)["recipients-api"];
@@ -15,6 +16,37 @@ export interface Document {
   updatedAt: string;
 }
 
+export interface DocumentSummary {
+  id: string;
+  title: string;
+  category: DocCategory;
+  excerpt: string;
+  contentLength: number;
+  createdAt: string;
+  updatedAt: string;
+  // HTML-фрагмент с <mark> из серверного поиска (текст уже экранирован)
+  highlight?: string;
+}
+
+export interface DocumentPage {
+  items: DocumentSummary[];
+  nextCursor: string | null;
+}
+
+export interface DocumentSearchPage {
+  items: DocumentSummary[];
+  nextOffset: number | null;
+}
+
+interface DocumentSearchItem {
+  id: string;
+  title: string;
+  category: DocCategory;
+  createdAt: string;
+  updatedAt: string;
+  highlight: { title: string; content: string };
+}
+
 export interface Recipient {
   id: string;
   fullName: string;
@@ -40,6 +72,60 @@ export async function fetchDocuments(category?: DocCategory): Promise<Document[]
   return res.json();
 }
 
+export async function fetchDocumentList(category?: DocCategory, cursor?: string): Promise<DocumentPage> {
+  const params = new URLSearchParams({ mode: "list" });
+  if (category) params.set("category", category);
+  if (cursor) params.set("cursor", cursor);
+  const res = await fetch(`${DOCS_API}?${params}`, { headers: authHeaders() });
+  if (!res.ok) return { items: [], nextCursor: null };
+  return res.json();
+}
+
+// Полнотекстовый поиск на сервере — по всем документам, а не только по загруженным страницам
+export async function searchDocuments(
+  q: string,
+  category?: DocCategory,
+  offset = 0
+): Promise<DocumentSearchPage> {
+  const params = new URLSearchParams({ q, offset: String(offset) });
+  if (category) params.set("category", category);
+  const res = await fetch(`${DOCS_API}?${params}`, { headers: authHeaders() });
+  if (!res.ok) return { items: [], nextOffset: null };
+  const data: { items: DocumentSearchItem[]; nextOffset: number | null } = await res.json();
+  return {
+    nextOffset: data.nextOffset,
+    items: data.items.map((d) => ({
+      id: d.id,
+      title: d.title,
+      category: d.category,
+      excerpt: "",
+      contentLength: 0,
+      createdAt: d.createdAt,
+      updatedAt: d.updatedAt,
+      highlight: d.highlight.content,
+    })),
+  };
+}
+
+export async function fetchDocument(id: string): Promise<Document> {
+  const res = await fetch(`${DOCS_API}?id=${id}`, { headers: authHeaders() });
+  if (!res.ok) throw new Error("Документ не найден");
+  return res.json();
+}
+
+export function toDocumentSummary(doc: Document): DocumentSummary {
+  const text = doc.content.split(/\s+/).join(" ").trim();
+  return {
+    id: doc.id,
+    title: doc.title,
+    category: doc.category,
+    excerpt: text.length > 200 ? text.slice(0, 200) + "…" : text,
+    contentLength: doc.content.length,
+    createdAt: doc.createdAt,
+    updatedAt: doc.updatedAt,
+  };
+}
+
 export async function createDocument(data: {
   title: string;
   content: string;
@@ -87,6 +173,7 @@ export interface DocAttachment {
   fileSize: number;
   contentType: string;
   cdnUrl: string;
+  thumbUrl?: string | null;
   createdAt: string;
 }
 
@@ -97,6 +184,12 @@ export async function fetchDocAttachments(docId: string): Promise<DocAttachment[
 }
 
 export async function uploadDocAttachment(docId: string, file: File): Promise<DocAttachment> {
+  try {
+    return await uploadDirect<DocAttachment>({ docId }, file);
+  } catch (e) {
+    // через функцию — только если не удалось получить presign; ошибки самой загрузки показываем
+    if (!(e instanceof PresignError)) throw e;
+  }
   const buffer = await file.arrayBuffer();
   const base64 = btoa(new Uint8Array(buffer).reduce((d, b) => d + String.fromCharCode(b), ""));
   const res = await fetch(FILES_API, {
@@ -1,5 +1,6 @@
 import funcUrls from "../../backend/func2url.json";
 import { authHeaders } from "./auth";
+import { PresignError, uploadDirect } from "./direct-upload";
 
 export type Priority = "high" | "medium" | "low";
 export type TaskStatus = "active" | "completed" | "archived";
@@ -95,6 +96,7 @@ export interface Attachment {
   fileSize: number;
   contentType: string;
   cdnUrl: string;
+  thumbUrl?: string | null;
   createdAt: string;
 }
 
@@ -106,10 +108,38 @@ export async function fetchAttachments(taskId: string): Promise<Attachment[]> {
   return res.json();
 }
 
+export interface AttachmentSummary {
+  count: number;
+  totalSize: number;
+}
+
+const ATTACHMENTS_BATCH_SIZE = 200;
+
+// Количество и объём вложений сразу для многих задач — один запрос на пачку вместо запроса на задачу
+export async function fetchAttachmentSummary(
+  taskIds: string[]
+): Promise<Record<string, AttachmentSummary>> {
+  const result: Record<string, AttachmentSummary> = {};
+  for (let i = 0; i < taskIds.length; i += ATTACHMENTS_BATCH_SIZE) {
+    const ids = taskIds.slice(i, i + ATTACHMENTS_BATCH_SIZE).map(encodeURIComponent).join(",");
+    const res = await fetch(`${FILES_API}?task_ids=${ids}&summary=1`, { headers: authHeaders() });
+    if (!res.ok) continue;
+    const data = await res.json();
+    Object.assign(result, data.items);
+  }
+  return result;
+}
+
 export async function uploadAttachment(
   taskId: string,
   file: File
 ): Promise<Attachment> {
+  try {
+    return await uploadDirect<Attachment>({ taskId }, file);
+  } catch (e) {
+    // через функцию — только если не удалось получить presign; ошибки самой загрузки показываем
+    if (!(e instanceof PresignError)) throw e;
+  }
   const buffer = await file.arrayBuffer();
   const base64 = btoa(
     new Uint8Array(buffer).reduce((data, byte) => data + String.fromCharCode(byte), "")
@@ -11,9 +11,10 @@ import AuthScreen from "@/components/AuthScreen";
 import DocumentsPage from "@/components/DocumentsPage";
 import ReportPage from "@/components/ReportPage";
 import PaidServicesPage from "@/components/PaidServicesPage";
-import type { Task, Priority } from "@/lib/task-store";
+import type { Task, Priority, AttachmentSummary } from "@/lib/task-store";
 import {
   fetchTasks,
+  fetchAttachmentSummary,
   createTaskApi,
   updateTaskApi,
   deleteTaskApi,
@@ -33,6 +34,7 @@ const Index = () => {
   const [search, setSearch] = useState("");
   const [tab, setTab] = useState<Tab>("active");
   const [loading, setLoading] = useState(true);
+  const [attachments, setAttachments] = useState<Record<string, AttachmentSummary>>({});
 
   useEffect(() => {
     checkAuth().then((u) => {
@@ -47,6 +49,7 @@ const Index = () => {
     const data = await fetchTasks();
     setTasks(data);
     setLoading(false);
+    fetchAttachmentSummary(data.map((t) => t.id)).then(setAttachments);
   }, [user]);
 
   useEffect(() => {
@@ -98,6 +101,17 @@ const Index = () => {
     setFormOpen(true);
   };
 
+  // загрузка/удаление вложений в карточке меняет счётчик без перезапроса сводки
+  const handleAttachmentsChange = (taskId: string, count: number, totalSize: number) => {
+    setAttachments((prev) => {
+      const current = prev[taskId] || { count: 0, totalSize: 0 };
+      return {
+        ...prev,
+        [taskId]: { count: current.count + count, totalSize: current.totalSize + totalSize },
+      };
+    });
+  };
+
   const filtered = useMemo(() => {
     let list = tasks;
     if (search) {
@@ -157,6 +171,8 @@ const Index = () => {
           <TaskCard
             key={task.id}
             task={task}
+            attachments={attachments[task.id]}
+            onAttachmentsChange={handleAttachmentsChange}
             onToggle={handleToggle}
             onEdit={handleEdit}
             onDelete={handleDelete}
@@ -318,6 +334,8 @@ const Index = () => {
                           <TaskCard
                             key={task.id}
                             task={task}
+                            attachments={attachments[task.id]}
+                            onAttachmentsChange={handleAttachmentsChange}
                             onToggle={handleToggle}
                             onEdit={handleEdit}
                             onDelete={handleDelete}